@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatlog',
+            index=models.Index(fields=['user', 'timestamp'], name='chatlog_user_timestamp_idx'),
+        ),
+    ]
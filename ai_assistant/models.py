@@ -12,6 +12,19 @@ class ChatLog(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='chatlog_user_timestamp_idx'),
+        ]
         
     def __str__(self):
         return f"Chat with {self.user.email} at {self.timestamp}"
+
+class ChatSummary(models.Model):
+    """Rolling summary of a user's older chat turns, used as context for new ones"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_summary')
+    summary = models.TextField(blank=True)
+    last_log_id = models.BigIntegerField(default=0, help_text="ID of the newest chat log folded into the summary")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Chat summary for {self.user.email}"
@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from healthmateai.serializers import SparseFieldsetsMixin
 from .models import ChatLog
 
-class ChatLogSerializer(serializers.ModelSerializer):
+class ChatLogSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for chat logs"""
     
     class Meta:
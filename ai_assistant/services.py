@@ -1,57 +1,216 @@
-import openai
+import logging
 from django.conf import settings
-from .models import ChatLog
+from django.core.cache import cache
+from healthmateai.llm import chat_completion, achat_completion, astream_chat_completion
+from .models import ChatLog, ChatSummary
+from .tasks import summarize_chat_history
 
-# Initialize the OpenAI client with the API key
-client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-# client = openai.OpenAI()
+logger = logging.getLogger(__name__)
 
-def get_user_chat_history(user, limit=5):
+SYSTEM_PROMPT = "You are a supportive health assistant. Give correct, useful information regarding health issues but don't provide final medical diagnoses. Always remind users to consult healthcare professionals for individual medical advice. Refuse to answer completely any questions or inquiries that have no relation to healthcare"
 
-    chat_logs = ChatLog.objects.filter(user=user).order_by('-timestamp')[:limit]
+SUMMARY_SYSTEM_PROMPT = "You maintain a concise summary of a conversation between a patient and a health assistant. Update the summary with the new turns. Keep the patient's symptoms, conditions, medications, allergies, stated preferences and any advice already given. Drop greetings and small talk. Reply with the updated summary only."
+
+# Per-message overhead of the chat format, in tokens
+MESSAGE_TOKEN_OVERHEAD = 4
+
+def estimate_tokens(text):
+    """Estimate the token count of ``text`` at roughly four characters per token"""
+    return len(text) // 4 + 1
+
+def get_user_chat_history(user, budget=None):
+    """
+    Build the conversation context for a user's next message.
     
-    # Format history for OpenAI context
+    The rolling summary of older turns comes first, then as many of the most
+    recent turns as fit in the token budget, oldest first.
+    
+    Args:
+        user: The user chatting with the assistant
+        budget: Token budget for the context (defaults to CHAT_CONTEXT_TOKEN_BUDGET)
+    
+    Returns:
+        List of chat messages in OpenAI format
+    """
+    budget = settings.CHAT_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    
+    summary = ChatSummary.objects.filter(user=user).first()
     history = []
-    for log in reversed(chat_logs):
+    last_log_id = 0
+    if summary and summary.summary:
+        content = f"Summary of the earlier conversation: {summary.summary}"
+        history.append({"role": "system", "content": content})
+        budget -= estimate_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+        last_log_id = summary.last_log_id
+    
+    # Turns already folded into the summary are not repeated
+    chat_logs = ChatLog.objects.filter(user=user, id__gt=last_log_id).order_by('-id')[:settings.CHAT_CONTEXT_MAX_TURNS]
+    
+    # Pack turns newest first until the budget runs out
+    turns = []
+    for log in chat_logs:
+        cost = estimate_tokens(log.message) + estimate_tokens(log.response) + 2 * MESSAGE_TOKEN_OVERHEAD
+        if cost > budget:
+            break
+        budget -= cost
+        turns.append(log)
+    
+    # Format history for OpenAI context
+    for log in reversed(turns):
         history.append({"role": "user", "content": log.message})
         history.append({"role": "assistant", "content": log.response})
         
     return history
 
+def build_chat_messages(message, history=None):
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + (history or []) + [{"role": "user", "content": message}]
+
 def query_openai(message, history=None):
 
-    if not settings.OPENAI_API_KEY:
+    if not settings.OPENAI_API_KEY and settings.LLM_BACKEND == 'openai':
         return "API key not configured. Please set the OPENAI_API_KEY environment variable."
     
 
-    messages = [
-        {"role": "system", "content": "You are a supportive health assistant. Give correct, useful information regarding health issues but don't provide final medical diagnoses. Always remind users to consult healthcare professionals for individual medical advice. Refuse to answer completely any questions or inquiries that have no relation to healthcare"}
-    ]
-    
-
-        
-    # Add the current message
-    messages.append({"role": "user", "content": message})
+    messages = build_chat_messages(message, history)
     
     try:
-        # Make API call to OpenAI using the client
-        response = client.chat.completions.create(
+        # Make API call to OpenAI through the shared gateway
+        return chat_completion(
             model="gpt-4-turbo",  # Using a cost-effective model
             messages=messages,
             max_tokens=500,
             temperature=0.7,
         )
         
-        # Extract and return the response text
-        return response.choices[0].message.content
-        
     except Exception as e:
-        print(f"Error querying OpenAI: {str(e)}")
+        logger.error(f"Error querying OpenAI: {str(e)}")
         return f"Sorry, I encountered an error: {str(e)}"
 
+async def aquery_openai(message, history=None):
+    """
+    Async version of query_openai for the ASGI chat view.
+    """
+    if not settings.OPENAI_API_KEY and settings.LLM_BACKEND == 'openai':
+        return "API key not configured. Please set the OPENAI_API_KEY environment variable."
+    
+    messages = build_chat_messages(message, history)
+    
+    try:
+        return await achat_completion(
+            model="gpt-4-turbo",
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7,
+        )
+    except Exception as e:
+        logger.error(f"Error querying OpenAI: {str(e)}")
+        return f"Sorry, I encountered an error: {str(e)}"
+
+async def astream_openai(message, history=None):
+    """
+    Streaming counterpart of aquery_openai that yields the reply as it is generated.
+    """
+    if not settings.OPENAI_API_KEY and settings.LLM_BACKEND == 'openai':
+        yield "API key not configured. Please set the OPENAI_API_KEY environment variable."
+        return
+    
+    messages = build_chat_messages(message, history)
+    
+    try:
+        async for token in astream_chat_completion(
+            model="gpt-4-turbo",
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7,
+        ):
+            yield token
+    except Exception as e:
+        logger.error(f"Error streaming from OpenAI: {str(e)}")
+        yield f"Sorry, I encountered an error: {str(e)}"
+
 def log_chat(user, message, response):
     ChatLog.objects.create(
         user=user,
         message=message,
         response=response
-    ) 
\ No newline at end of file
+    )
+    schedule_chat_summary(user)
+
+def schedule_chat_summary(user):
+    """
+    Queue a summary refresh once enough turns have aged out of the recent window.
+    
+    Args:
+        user: The user who just chatted
+    """
+    summary = ChatSummary.objects.filter(user=user).first()
+    last_log_id = summary.last_log_id if summary else 0
+    pending = ChatLog.objects.filter(user=user, id__gt=last_log_id).count()
+    if pending < settings.CHAT_CONTEXT_RECENT_TURNS + settings.CHAT_SUMMARY_MIN_TURNS:
+        return
+    
+    # One queued refresh per user at a time
+    if not cache.add(f'chat-summary-queued:{user.id}', 1, 60):
+        return
+    try:
+        summarize_chat_history.delay(user.id)
+    except Exception as e:
+        logger.error(f"Unable to queue chat summary for user {user.id}: {str(e)}")
+        cache.delete(f'chat-summary-queued:{user.id}')
+
+def update_chat_summary(user):
+    """
+    Fold the oldest unsummarized turns outside the recent window into the summary.
+    
+    Old turns are folded in chronological order, up to CHAT_SUMMARY_INPUT_BUDGET
+    tokens per call, so the summary model sees a bounded prompt.
+    
+    Args:
+        user: The user whose summary to update
+    
+    Returns:
+        The number of turns folded, 0 if there was nothing to do
+    """
+    summary, _ = ChatSummary.objects.get_or_create(user=user)
+    pending = ChatLog.objects.filter(user=user, id__gt=summary.last_log_id)
+    
+    # The newest turns stay verbatim in the context window
+    cutoff = pending.order_by('-id').values_list('id', flat=True)[settings.CHAT_CONTEXT_RECENT_TURNS:settings.CHAT_CONTEXT_RECENT_TURNS + 1]
+    if not cutoff:
+        return 0
+    old_logs = pending.filter(id__lte=cutoff[0]).order_by('id')[:settings.CHAT_CONTEXT_MAX_TURNS]
+    
+    budget = settings.CHAT_SUMMARY_INPUT_BUDGET
+    lines = []
+    last_log_id = summary.last_log_id
+    for log in old_logs:
+        turn = f"Patient: {log.message}\nAssistant: {log.response}"
+        cost = estimate_tokens(turn)
+        if lines and cost > budget:
+            break
+        # A single oversized turn is truncated rather than skipped
+        lines.append(turn[:budget * 4])
+        budget -= cost
+        last_log_id = log.id
+    
+    prompt = f"Current summary:\n{summary.summary or '(none)'}\n\nNew turns:\n" + "\n\n".join(lines)
+    try:
+        text = chat_completion(
+            model="gpt-4-turbo",
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+            temperature=0.2,
+        )
+    except Exception as e:
+        logger.error(f"Error updating chat summary for user {user.id}: {str(e)}")
+        return 0
+    
+    # Only apply the update if no other worker advanced the summary meanwhile
+    updated = ChatSummary.objects.filter(id=summary.id, last_log_id=summary.last_log_id).update(
+        summary=text.strip()[:settings.CHAT_SUMMARY_MAX_TOKENS * 4],
+        last_log_id=last_log_id
+    )
+    return len(lines) if updated else 0 
\ No newline at end of file
@@ -0,0 +1,27 @@
+from celery import shared_task
+
+@shared_task
+def summarize_chat_history(user_id):
+    """Fold a user's older chat turns into their rolling summary"""
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from .services import update_chat_summary
+    
+    # Let later turns queue another refresh while this one runs
+    cache.delete(f'chat-summary-queued:{user_id}')
+    
+    User = get_user_model()
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return f"User {user_id} not found"
+    
+    folded = 0
+    # Each call folds one budget's worth of turns; catch up on a long backlog
+    while True:
+        count = update_chat_summary(user)
+        if not count:
+            break
+        folded += count
+    
+    return f"Folded {folded} chat turns into the summary for user {user_id}"
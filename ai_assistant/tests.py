@@ -1,3 +1,170 @@
-from django.test import TestCase
+import json
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.test import APIClient
+from users.authentication import UserRefreshToken
+from users.models import CustomUser
+from .models import ChatLog, ChatSummary
+from .services import get_user_chat_history, schedule_chat_summary, update_chat_summary
+from .tasks import summarize_chat_history
 
-# Create your tests here.
+
+@override_settings(LLM_BACKEND='stub', LLM_STUB_LATENCY=0)
+class ChatViewTests(TestCase):
+    """The async chat endpoints answer through the LLM gateway and log each turn"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_chat(self):
+        response = self.client.post('/api/chat/chat/', {'message': 'I have a headache'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reply'], 'Stub response to: I have a headache')
+        log = ChatLog.objects.get()
+        self.assertEqual((log.user, log.message, log.response), (self.user, 'I have a headache', response.data['reply']))
+
+    def test_message_is_required(self):
+        response = self.client.post('/api/chat/chat/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChatLog.objects.exists())
+
+    def test_authentication_and_methods(self):
+        # Authentication and method checks run before the async handler
+        self.assertEqual(self.client.get('/api/chat/chat/').status_code, 405)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/api/chat/chat/', {'message': 'Hi'}, format='json').status_code, 401)
+
+    async def test_stream(self):
+        # Served as under ASGI, where the stream is an async iterator
+        token = await sync_to_async(lambda: str(UserRefreshToken.for_user(self.user).access_token))()
+        response = await AsyncClient().post('/api/chat/chat/stream/', {'message': 'Hi there'},
+                                            content_type='application/json', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        events = [event for event in body.decode().split('\n\n') if event]
+        self.assertTrue(all(event.startswith('event: token\n') for event in events[:-1]))
+        self.assertTrue(events[-1].startswith('event: done\n'))
+        reply = json.loads(events[-1].split('data: ', 1)[1])['reply']
+        self.assertEqual(reply, 'Stub response to: Hi there')
+        log = await ChatLog.objects.aget()
+        self.assertEqual(log.response, reply)
+
+
+class ChatHistoryTests(TestCase):
+    """Chat history pages through the conversation in chronological order"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_chronological_pages(self):
+        for i in range(5):
+            ChatLog.objects.create(user=self.user, message=f'Question {i}', response=f'Answer {i}')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        ChatLog.objects.create(user=other, message='Not mine', response='Hidden')
+
+        messages = []
+        url = '/api/chat/history/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            messages += [log['message'] for log in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(messages, [f'Question {i}' for i in range(5)])
+
+
+@override_settings(CHAT_CONTEXT_RECENT_TURNS=2, CHAT_SUMMARY_MIN_TURNS=2, CHAT_CONTEXT_MAX_TURNS=20)
+class ChatContextTests(TestCase):
+    """The chat context is a rolling summary plus the recent turns that fit the token budget"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        # 40 characters each way: 11 + 11 tokens plus 2 * 4 of overhead, 30 tokens a turn
+        self.logs = [
+            ChatLog.objects.create(user=self.user, message=f'Question {i}'.ljust(40, '.'),
+                                   response=f'Answer {i}'.ljust(40, '.'))
+            for i in range(5)
+        ]
+
+    def test_recent_turns_fit_the_budget(self):
+        history = get_user_chat_history(self.user, budget=70)
+        self.assertEqual([m['role'] for m in history], ['user', 'assistant', 'user', 'assistant'])
+        self.assertEqual(history[0]['content'], self.logs[3].message)
+        self.assertEqual(history[3]['content'], self.logs[4].response)
+
+        self.assertEqual(len(get_user_chat_history(self.user, budget=1000)), 10)
+        self.assertEqual(get_user_chat_history(self.user, budget=29), [])
+
+    def test_summary_replaces_folded_turns(self):
+        ChatSummary.objects.create(user=self.user, summary='Allergic to penicillin', last_log_id=self.logs[2].id)
+        history = get_user_chat_history(self.user, budget=1000)
+        self.assertEqual(history[0], {
+            'role': 'system', 'content': 'Summary of the earlier conversation: Allergic to penicillin'
+        })
+        self.assertEqual([m['content'] for m in history[1::2]], [self.logs[3].message, self.logs[4].message])
+
+        # The summary's tokens come out of the same budget
+        self.assertEqual(len(get_user_chat_history(self.user, budget=60)), 3)
+
+    def test_summary_is_queued_once_enough_turns_pile_up(self):
+        ChatLog.objects.filter(id__in=[self.logs[3].id, self.logs[4].id]).delete()
+        with mock.patch('ai_assistant.services.summarize_chat_history.delay') as delay:
+            schedule_chat_summary(self.user)
+            delay.assert_not_called()
+
+            ChatLog.objects.create(user=self.user, message='Another question', response='Another answer')
+            schedule_chat_summary(self.user)
+            schedule_chat_summary(self.user)
+        delay.assert_called_once_with(self.user.id)
+
+    def test_update_folds_turns_outside_the_recent_window(self):
+        with mock.patch('ai_assistant.services.chat_completion', return_value=' Asked about headaches ') as completion:
+            self.assertEqual(update_chat_summary(self.user), 3)
+        prompt = completion.call_args.kwargs['messages'][1]['content']
+        self.assertIn(f'Patient: {self.logs[0].message}', prompt)
+        self.assertIn(f'Assistant: {self.logs[2].response}', prompt)
+        self.assertNotIn(self.logs[3].message, prompt)
+        summary = ChatSummary.objects.get()
+        self.assertEqual((summary.summary, summary.last_log_id), ('Asked about headaches', self.logs[2].id))
+
+        # Only the recent window is left
+        with mock.patch('ai_assistant.services.chat_completion') as completion:
+            self.assertEqual(update_chat_summary(self.user), 0)
+        completion.assert_not_called()
+
+    def test_update_is_skipped_when_another_worker_advanced_the_summary(self):
+        def advance(**kwargs):
+            ChatSummary.objects.update(summary='Newer summary', last_log_id=self.logs[1].id)
+            return 'Stale summary'
+
+        with mock.patch('ai_assistant.services.chat_completion', side_effect=advance):
+            self.assertEqual(update_chat_summary(self.user), 0)
+        self.assertEqual(ChatSummary.objects.get().summary, 'Newer summary')
+
+    def test_failed_update_keeps_the_summary(self):
+        with mock.patch('ai_assistant.services.chat_completion', side_effect=RuntimeError('LLM unavailable')):
+            self.assertEqual(update_chat_summary(self.user), 0)
+        self.assertEqual(ChatSummary.objects.get().last_log_id, 0)
+
+    @override_settings(CHAT_SUMMARY_INPUT_BUDGET=30)
+    def test_task_catches_up_one_budget_at_a_time(self):
+        cache.set(f'chat-summary-queued:{self.user.id}', 1)
+        with mock.patch('ai_assistant.services.chat_completion', return_value='Summary') as completion:
+            summarize_chat_history(self.user.id)
+        self.assertEqual(completion.call_count, 3)
+        self.assertEqual(ChatSummary.objects.get().last_log_id, self.logs[2].id)
+        self.assertIsNone(cache.get(f'chat-summary-queued:{self.user.id}'))
@@ -4,6 +4,7 @@ from . import views
 app_name = 'ai_assistant'
 
 urlpatterns = [
-    path('chat/', views.chat_with_ai, name='chat'),
+    path('chat/', views.ChatWithAIView.as_view(), name='chat'),
+    path('chat/stream/', views.ChatWithAIStreamView.as_view(), name='chat-stream'),
     path('history/', views.ChatHistoryListView.as_view(), name='history'),
 ] 
\ No newline at end of file
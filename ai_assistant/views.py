@@ -1,52 +1,97 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status, generics
+from healthmateai.pagination import HistoryCursorPagination
+from healthmateai.views import AsyncAPIView
 from .models import ChatLog
-from .services import query_openai, get_user_chat_history, log_chat
+from .services import aquery_openai, astream_openai, get_user_chat_history, log_chat
 from .serializers import ChatLogSerializer
 
 # Create your views here.
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def chat_with_ai(request):
+class ChatWithAIView(AsyncAPIView):
     """
     API endpoint for chatting with the AI assistant.
     
     Request body should contain a 'message' field with the user's message.
-    Returns the AI assistant's response.
+    Returns the AI assistant's response. The OpenAI call is awaited on the
+    event loop, so it does not hold a worker while the reply is generated.
     """
-    message = request.data.get('message')
-    if not message:
-        return Response(
-            {"error": "Please provide a message"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-        
-    # Get chat history for context
-    history = get_user_chat_history(request.user)
+    permission_classes = [IsAuthenticated]
     
-    # Query OpenAI API
-    ai_response = query_openai(message, history)
-    print("ai_response", ai_response)
+    async def post(self, request):
+        message = request.data.get('message')
+        if not message:
+            return Response(
+                {"error": "Please provide a message"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Get chat history for context
+        history = await sync_to_async(get_user_chat_history)(request.user)
+        
+        # Query OpenAI API
+        ai_response = await aquery_openai(message, history)
+        
+        # Log the conversation
+        await sync_to_async(log_chat)(request.user, message, ai_response)
+        
+        return Response({"reply": ai_response})
+
+
+class ChatWithAIStreamView(AsyncAPIView):
+    """
+    Streaming variant of the chat endpoint.
     
-    # Log the conversation
-    log_chat(request.user, message, ai_response)
+    Request body should contain a 'message' field with the user's message.
+    Returns Server-Sent Events: a 'token' event per chunk of the reply as it is
+    generated, then a 'done' event. The assembled reply is logged when the
+    stream closes, including when the client disconnects early.
+    """
+    permission_classes = [IsAuthenticated]
     
-    return Response({"reply": ai_response})
+    async def post(self, request):
+        message = request.data.get('message')
+        if not message:
+            return Response(
+                {"error": "Please provide a message"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        user = request.user
+        history = await sync_to_async(get_user_chat_history)(user)
+        
+        async def event_stream():
+            parts = []
+            try:
+                async for token in astream_openai(message, history):
+                    parts.append(token)
+                    yield f"event: token\ndata: {json.dumps({'token': token})}\n\n"
+                yield f"event: done\ndata: {json.dumps({'reply': ''.join(parts)})}\n\n"
+            finally:
+                await sync_to_async(log_chat)(user, message, ''.join(parts))
+        
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+        return response
 
 
 class ChatHistoryListView(generics.ListAPIView):
     """
-    API endpoint for listing a user's chat history.
+    API endpoint for listing a user's chat history in chronological order.
     """
     serializer_class = ChatLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = HistoryCursorPagination
+    ordering = ['timestamp']
     
     def get_queryset(self):
         # Skip queryset filtering during schema generation
         if getattr(self, 'swagger_fake_view', False):
             return ChatLog.objects.none()
-        return ChatLog.objects.filter(user=self.request.user).order_by('timestamp')
+        return ChatLog.objects.filter(user=self.request.user)
@@ -0,0 +1,268 @@
+"""
+Availability engine for doctor appointments.
+
+Answers two questions:
+
+* which slots are free for a doctor between two times, combining the
+  doctor's weekly working hours (``DoctorProfile.available_times``) with
+  their booked appointments
+* whether a booking conflicts with another active appointment of the doctor
+  or the patient
+
+Booked appointments are loaded with one range query per participant, served
+by the (doctor|patient, datetime, end_time, status) indexes, into an
+``IntervalIndex``. On PostgreSQL, exclusion constraints also reject
+overlapping bookings that race past these checks; ``is_overlap_violation``
+recognizes the resulting IntegrityError.
+
+The working-hours template maps weekdays to time ranges, in the doctor's
+``timezone`` when given and the server's time zone otherwise::
+
+    {
+        "timezone": "America/New_York",
+        "monday": ["09:00-12:00", "13:00-17:00"],
+        "tue": [["09:00", "17:00"]],
+        "friday": [{"start": "09:00", "end": "13:00"}]
+    }
+
+An empty template means the doctor has not restricted their hours.
+"""
+import bisect
+import logging
+import zoneinfo
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+# Appointments that hold their time slot
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# SQLSTATE of a PostgreSQL exclusion constraint violation
+EXCLUSION_VIOLATION = '23P01'
+
+
+class IntervalIndex:
+    """
+    Static index of half-open ``[start, end)`` intervals.
+
+    Intervals are sorted by start, and ``max_ends[i]`` holds the latest end
+    among the first ``i + 1`` of them. An overlap test is a binary search for
+    the intervals starting before the query ends plus one lookup of their
+    latest end, so it is O(log n).
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, _end, *_rest in self.intervals]
+        self.max_ends = []
+        latest = None
+        for _start, end, *_rest in self.intervals:
+            latest = end if latest is None or end > latest else latest
+            self.max_ends.append(latest)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def overlaps(self, start, end):
+        """Return True if any interval overlaps ``[start, end)``"""
+        count = bisect.bisect_left(self.starts, end)
+        return count > 0 and self.max_ends[count - 1] > start
+
+    def overlapping(self, start, end):
+        """Return the intervals overlapping ``[start, end)``, in start order"""
+        result = []
+        index = bisect.bisect_left(self.starts, end) - 1
+        # Walk back while some earlier interval could still reach past ``start``
+        while index >= 0 and self.max_ends[index] > start:
+            if self.intervals[index][1] > start:
+                result.append(self.intervals[index])
+            index -= 1
+        result.reverse()
+        return result
+
+    def gaps(self, start, end):
+        """Yield the free ``(start, end)`` stretches of ``[start, end)``"""
+        cursor = start
+        for busy_start, busy_end, *_rest in self.overlapping(start, end):
+            if busy_start > cursor:
+                yield cursor, busy_start
+            cursor = max(cursor, busy_end)
+        if cursor < end:
+            yield cursor, end
+
+
+def _parse_time(value):
+    return time.fromisoformat(str(value).strip())
+
+
+def _parse_ranges(ranges):
+    """Normalize one weekday's entries of the template to ``(time, time)`` pairs"""
+    parsed = []
+    for entry in ranges or []:
+        if isinstance(entry, str):
+            start, end = entry.split('-', 1)
+        elif isinstance(entry, dict):
+            start, end = entry['start'], entry['end']
+        else:
+            start, end = entry
+        parsed.append((_parse_time(start), _parse_time(end)))
+    return parsed
+
+
+def parse_working_hours(template):
+    """
+    Parse a working-hours template.
+
+    Args:
+        template: The ``available_times`` dictionary of a doctor profile
+
+    Returns:
+        A ``(weekly, tzinfo)`` pair: ``weekly`` lists the ``(start, end)`` time
+        ranges of each weekday, Monday first, or is None if the template sets
+        no hours
+
+    Raises:
+        ValueError: If the template is malformed
+    """
+    template = template or {}
+    try:
+        tzinfo = zoneinfo.ZoneInfo(template['timezone']) if template.get('timezone') else timezone.get_current_timezone()
+
+        weekly = [[] for _ in WEEKDAYS]
+        has_hours = False
+        for key, ranges in template.items():
+            key = str(key).strip().lower()
+            day = next((i for i, name in enumerate(WEEKDAYS) if name.startswith(key) and len(key) >= 3), None)
+            if day is None:
+                continue
+            weekly[day] = _parse_ranges(ranges)
+            has_hours = True
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid working hours: {str(e)}")
+    return (weekly if has_hours else None), tzinfo
+
+
+def doctor_template(doctor):
+    """Return a doctor's working-hours template, or {} if none is set or it is malformed"""
+    profile = getattr(doctor, 'doctor_profile', None) if doctor else None
+    template = profile.available_times if profile else {}
+    try:
+        parse_working_hours(template)
+    except ValueError as e:
+        logger.warning(f"Ignoring working hours of doctor {doctor.id}: {str(e)}")
+        return {}
+    return template
+
+
+def working_windows(template, start, end):
+    """
+    Yield the working-hour windows of a template that fall inside ``[start, end)``.
+
+    An empty template yields the whole range.
+    """
+    weekly, tzinfo = parse_working_hours(template)
+    if weekly is None:
+        yield start, end
+        return
+
+    day = start.astimezone(tzinfo).date() - timedelta(days=1)  # Covers ranges past midnight
+    last_day = end.astimezone(tzinfo).date()
+    while day <= last_day:
+        for open_time, close_time in weekly[day.weekday()]:
+            window_start = datetime.combine(day, open_time, tzinfo)
+            window_end = datetime.combine(day, close_time, tzinfo)
+            if window_end <= window_start:
+                window_end += timedelta(days=1)  # Overnight shift
+            window_start, window_end = max(window_start, start), min(window_end, end)
+            if window_start < window_end:
+                yield window_start, window_end
+        day += timedelta(days=1)
+
+
+def within_working_hours(template, start, end):
+    """Return True if ``[start, end)`` fits inside a single working-hours window"""
+    return any(
+        window_start <= start and end <= window_end
+        for window_start, window_end in working_windows(template, start - timedelta(days=1), end + timedelta(days=1))
+    )
+
+
+def booked_intervals(start, end, exclude_id=None, **participant):
+    """
+    Build an IntervalIndex of a participant's active appointments overlapping ``[start, end)``.
+
+    Args:
+        start: Start of the range
+        end: End of the range
+        exclude_id: Appointment to leave out, e.g. the one being edited
+        participant: ``doctor=<user or id>`` or ``patient=<user or id>``
+    """
+    appointments = Appointment.objects.filter(
+        status__in=ACTIVE_STATUSES,
+        datetime__lt=end,
+        end_time__gt=start,
+        **participant
+    )
+    if exclude_id is not None:
+        appointments = appointments.exclude(id=exclude_id)
+    return IntervalIndex(appointments.values_list('datetime', 'end_time', 'id'))
+
+
+def free_slots(doctor, start, end, duration, step=None):
+    """
+    List a doctor's bookable slots between ``start`` and ``end``.
+
+    Args:
+        doctor: The doctor user
+        start: Aware datetime where the search starts
+        end: Aware datetime where the search ends
+        duration: Length of each slot, a timedelta
+        step: Gap between consecutive slot starts (defaults to ``duration``)
+
+    Returns:
+        List of ``(start, end)`` pairs in chronological order
+    """
+    step = step or duration
+    template = doctor_template(doctor)
+    busy = booked_intervals(start, end, doctor=doctor)
+
+    slots = []
+    for window_start, window_end in working_windows(template, start, end):
+        for gap_start, gap_end in busy.gaps(window_start, window_end):
+            slot_start = gap_start
+            while slot_start + duration <= gap_end:
+                slots.append((slot_start, slot_start + duration))
+                slot_start += step
+    return slots
+
+
+def find_booking_conflict(doctor, patient, start, end, exclude_id=None):
+    """
+    Check a booking against the doctor's hours and both participants' appointments.
+
+    Args:
+        doctor: The doctor user
+        patient: The patient user, or None if not known yet
+        start: Start of the booking
+        end: End of the booking
+        exclude_id: ID of the appointment being edited, if any
+
+    Returns:
+        None if the booking is possible, otherwise the reason it is not
+    """
+    if doctor and not within_working_hours(doctor_template(doctor), start, end):
+        return 'outside_hours'
+    if doctor and booked_intervals(start, end, exclude_id, doctor=doctor).overlaps(start, end):
+        return 'doctor_busy'
+    if patient and booked_intervals(start, end, exclude_id, patient=patient).overlaps(start, end):
+        return 'patient_busy'
+    return None
+
+
+def is_overlap_violation(error):
+    """Return True if an IntegrityError comes from the appointment exclusion constraints"""
+    return getattr(error.__cause__, 'pgcode', None) == EXCLUSION_VIOLATION
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:53
+
+import logging
+import django.contrib.postgres.constraints
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+import healthmateai.postgres
+from healthmateai.postgres import AddPostgresConstraint
+
+logger = logging.getLogger(__name__)
+
+
+def cancel_overlapping_appointments(apps, schema_editor):
+    """
+    Cancel legacy double-bookings the exclusion constraints would reject.
+
+    For each doctor, then each patient, active appointments are swept in
+    start order and one overlapping an earlier kept appointment is cancelled,
+    so the earlier slot (or, for equal starts, the earlier booking) is kept.
+    Appointments ending before they start cannot be stored in a range and are
+    cancelled too. Every cancelled appointment is logged.
+    """
+    Appointment = apps.get_model('appointments', 'Appointment')
+    cancelled = set()
+    for participant in ('doctor_id', 'patient_id'):
+        active = (
+            Appointment.objects.filter(status__in=['pending', 'confirmed'])
+            .exclude(id__in=cancelled)
+            .order_by(participant, 'datetime', 'created_at', 'id')
+            .values_list('id', participant, 'datetime', 'end_time')
+        )
+        kept_until = {}
+        for appointment_id, owner, start, end in active.iterator():
+            if end < start:
+                reason = "it ends before it starts"
+            elif owner in kept_until and start < kept_until[owner]:
+                reason = f"it overlaps another appointment of {participant[:-3]} {owner}"
+            else:
+                kept_until[owner] = max(end, kept_until.get(owner, end))
+                continue
+            cancelled.add(appointment_id)
+            logger.warning(f"Cancelling appointment {appointment_id}: {reason}")
+
+    Appointment.objects.filter(id__in=cancelled).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'datetime', 'end_time', 'status'], name='appointment_doctor_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'datetime', 'end_time', 'status'], name='appointment_patient_slot_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_doctor_dt_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_patient_dt_idx',
+        ),
+        migrations.RunPython(cancel_overlapping_appointments, migrations.RunPython.noop),
+        BtreeGistExtension(),
+        AddPostgresConstraint(
+            model_name='appointment',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('status__in', ['pending', 'confirmed'])), expressions=[(healthmateai.postgres.TsTzRange('datetime', 'end_time'), '&&'), ('doctor', '=')], name='appointment_doctor_no_overlap'),
+        ),
+        AddPostgresConstraint(
+            model_name='appointment',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('status__in', ['pending', 'confirmed'])), expressions=[(healthmateai.postgres.TsTzRange('datetime', 'end_time'), '&&'), ('patient', '=')], name='appointment_patient_no_overlap'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def confirm_existing(apps, schema_editor):
+    # Appointments booked before confirmations were recorded keep the access they gave
+    Appointment = apps.get_model('appointments', 'Appointment')
+    Appointment.objects.update(patient_confirmed_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_reminder_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='patient_confirmed_at',
+            field=models.DateTimeField(blank=True, help_text="When the patient booked or confirmed the appointment; only confirmed appointments give the doctor access to the patient's records", null=True),
+        ),
+        migrations.RunPython(confirm_existing, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.conf import settings
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import RangeOperators
+from healthmateai.postgres import TsTzRange, is_postgres
 from django.utils.translation import gettext_lazy as _
 
 class Appointment(models.Model):
@@ -28,30 +33,88 @@ class Appointment(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    patient_confirmed_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text=_("When the patient booked or confirmed the appointment; only confirmed appointments give the doctor access to the patient's records")
+    )
     notes = models.TextField(blank=True, help_text=_("Doctor's notes about the appointment"))
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, help_text=_("When the reminder email was sent"))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['datetime']
+        indexes = [
+            # Serve listings and the availability range queries in appointments.availability
+            models.Index(fields=['doctor', 'datetime', 'end_time', 'status'], name='appointment_doctor_slot_idx'),
+            models.Index(fields=['patient', 'datetime', 'end_time', 'status'], name='appointment_patient_slot_idx'),
+            # Only the confirmed appointments still waiting for a reminder
+            models.Index(
+                fields=['datetime'],
+                condition=models.Q(status='confirmed', reminder_sent_at__isnull=True),
+                name='appointment_reminder_due_idx'
+            ),
+        ]
+        constraints = [
+            # PostgreSQL only (btree_gist); rejects double-booking even when requests race
+            ExclusionConstraint(
+                name='appointment_doctor_no_overlap',
+                expressions=[
+                    (TsTzRange('datetime', 'end_time'), RangeOperators.OVERLAPS),
+                    ('doctor', RangeOperators.EQUAL),
+                ],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+            ),
+            ExclusionConstraint(
+                name='appointment_patient_no_overlap',
+                expressions=[
+                    (TsTzRange('datetime', 'end_time'), RangeOperators.OVERLAPS),
+                    ('patient', RangeOperators.EQUAL),
+                ],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+            ),
+        ]
         
     def __str__(self):
         return f"Appointment: {self.patient} with Dr. {self.doctor.full_name or self.doctor.username} on {self.datetime.strftime('%Y-%m-%d %H:%M')}"
         
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the participants so a reassigned appointment refreshes both care relationships
+        instance._care_pair = (instance.__dict__.get('doctor_id'), instance.__dict__.get('patient_id'))
+        return instance
+    
     def clean(self):
         from django.core.exceptions import ValidationError
+        from .availability import ACTIVE_STATUSES, find_booking_conflict
         
         # Ensure end time is after start time
         if self.end_time <= self.datetime:
             raise ValidationError(_("End time must be after start time"))
+        
+        if self.status not in ACTIVE_STATUSES:
+            return
             
         # Check for conflicting appointments
-        conflicts = Appointment.objects.filter(
-            models.Q(doctor=self.doctor) | models.Q(patient=self.patient),
-            datetime__lt=self.end_time,
-            end_time__gt=self.datetime,
-            status__in=['pending', 'confirmed']
-        ).exclude(id=self.id)
-        
-        if conflicts.exists():
+        conflict = find_booking_conflict(self.doctor, self.patient, self.datetime, self.end_time, exclude_id=self.id)
+        if conflict == 'outside_hours':
+            raise ValidationError(_("This time slot is outside the doctor's working hours"))
+        if conflict:
             raise ValidationError(_("This time slot conflicts with another appointment"))
+    
+    def validate_constraints(self, exclude=None):
+        # The exclusion constraints only exist on PostgreSQL; clean() checks overlaps elsewhere
+        if not is_postgres():
+            return
+        super().validate_constraints(exclude=exclude)
+
+@receiver([post_save, post_delete], sender=Appointment)
+def refresh_care_relationship(sender, instance, **kwargs):
+    """Keep the doctor-patient care relationship in step with appointments"""
+    from users.models import CareRelationship
+    
+    pairs = {(instance.doctor_id, instance.patient_id), getattr(instance, '_care_pair', (None, None))}
+    for doctor_id, patient_id in pairs:
+        CareRelationship.refresh(doctor_id, patient_id)
+    instance._care_pair = (instance.doctor_id, instance.patient_id)
@@ -1,9 +1,20 @@
+from contextlib import contextmanager
 from rest_framework import serializers
+from healthmateai.serializers import SparseFieldsetsMixin
 from .models import Appointment
+from users.models import CareRelationship
 from users.serializers import UserProfileSerializer
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from .availability import ACTIVE_STATUSES, find_booking_conflict, is_overlap_violation
 
-class AppointmentSerializer(serializers.ModelSerializer):
+CONFLICT_MESSAGE = _("This time slot conflicts with another appointment")
+
+# Fields whose changes can move an appointment into a conflict or out of the doctor's hours
+SCHEDULING_FIELDS = ['datetime', 'end_time', 'doctor', 'patient', 'status']
+
+class AppointmentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for appointments"""
     patient_details = UserProfileSerializer(source='patient', read_only=True)
     doctor_details = UserProfileSerializer(source='doctor', read_only=True)
@@ -13,47 +24,106 @@ class AppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = ['id', 'patient', 'doctor', 'patient_details', 'doctor_details', 
                   'datetime', 'end_time', 'reason', 'status', 'status_display', 
-                  'notes', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'status_display', 'created_at', 'updated_at']
+                  'patient_confirmed_at', 'notes', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'status_display', 'patient_confirmed_at', 'created_at', 'updated_at']
+        extra_kwargs = {'patient': {'required': False}}
         
     def validate(self, data):
-        # Validate appointment conflicts
-        datetime = data.get('datetime')
-        end_time = data.get('end_time')
-        doctor = data.get('doctor')
-        patient = data.get('patient')
+        self.validate_participants(data)
         
-        # If this is an update, get the existing instance
+        # If this is an update, fall back to the existing instance
         instance = self.instance
         
+        datetime = data.get('datetime', instance.datetime if instance else None)
+        end_time = data.get('end_time', instance.end_time if instance else None)
+        doctor = data.get('doctor', instance.doctor if instance else None)
+        patient = data.get('patient', instance.patient if instance else None)
+        status = data.get('status', instance.status if instance else 'pending')
+        
         if datetime and end_time:
             if end_time <= datetime:
                 raise serializers.ValidationError({"end_time": _("End time must be after start time")})
-                
-            # Check for conflicting appointments
-            from django.db.models import Q
-            
-            conflicts_query = Q(
-                Q(doctor=doctor) | Q(patient=patient),
-                datetime__lt=end_time,
-                end_time__gt=datetime,
-                status__in=['pending', 'confirmed']
-            )
             
-            # Exclude the current instance if we're updating
-            if instance:
-                conflicts = Appointment.objects.filter(conflicts_query).exclude(id=instance.id)
-            else:
-                conflicts = Appointment.objects.filter(conflicts_query)
-                
-            if conflicts.exists():
-                raise serializers.ValidationError({"datetime": _("This time slot conflicts with another appointment")})
+            if status in ACTIVE_STATUSES and self.reschedules(data):
+                # Check working hours and conflicting appointments
+                conflict = find_booking_conflict(doctor, patient, datetime, end_time, exclude_id=instance.id if instance else None)
+                if conflict == 'outside_hours':
+                    raise serializers.ValidationError({"datetime": _("This time slot is outside the doctor's working hours")})
+                if conflict:
+                    raise serializers.ValidationError({"datetime": CONFLICT_MESSAGE})
                 
         return data
+    
+    def validate_participants(self, data):
+        """
+        Keep appointments from granting access to records the caller may not see.
+        
+        Patients always book for themselves, which confirms the appointment.
+        Doctors book for themselves, and only with patients already in their
+        care; those appointments give no access of their own until the patient
+        confirms them. Participants cannot be swapped afterwards, except the
+        doctor by the patient.
+        """
+        user = self.context['request'].user
+        instance = self.instance
+        
+        if instance is None:
+            if user.is_doctor:
+                data['doctor'] = user
+                patient = data.get('patient')
+                if patient is None:
+                    raise serializers.ValidationError({"patient": _("This field is required.")})
+                if not CareRelationship.objects.filter(doctor=user, patient=patient).exists():
+                    raise serializers.ValidationError(
+                        {"patient": _("You can only book appointments for patients in your care")}
+                    )
+            else:
+                data['patient'] = user
+                data['patient_confirmed_at'] = timezone.now()
+            return
+        
+        if 'patient' in data and data['patient'] != instance.patient:
+            raise serializers.ValidationError({"patient": _("The patient of an appointment cannot be changed")})
+        if user.is_doctor and 'doctor' in data and data['doctor'] != instance.doctor:
+            raise serializers.ValidationError({"doctor": _("The doctor of an appointment cannot be changed")})
+    
+    def reschedules(self, data):
+        """
+        Whether the validated data books a slot.
+        
+        New appointments always do; updates only when they change the time,
+        a participant or the status, so editing the notes or reason of an
+        existing appointment is never rejected.
+        """
+        if self.instance is None:
+            return True
+        return any(field in data and data[field] != getattr(self.instance, field) for field in SCHEDULING_FIELDS)
         
     def create(self, validated_data):
-        # Set the patient to the current request user if not specified
-        if 'patient' not in validated_data:
-            validated_data['patient'] = self.context['request'].user
-            
-        return super().create(validated_data) 
\ No newline at end of file
+        with rejecting_overlaps():
+            return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        # A rescheduled appointment gets a reminder for its new time
+        if 'datetime' in validated_data and validated_data['datetime'] != instance.datetime:
+            validated_data['reminder_sent_at'] = None
+        
+        with rejecting_overlaps():
+            return super().update(instance, validated_data)
+
+
+@contextmanager
+def rejecting_overlaps():
+    """
+    Turn a double-booking rejected by the database into a validation error.
+    
+    The checks in validate() can race with a concurrent booking; on PostgreSQL
+    the exclusion constraints on Appointment catch what they miss.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as e:
+        if is_overlap_violation(e):
+            raise serializers.ValidationError({"datetime": CONFLICT_MESSAGE}) from e
+        raise
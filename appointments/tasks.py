@@ -1,35 +1,110 @@
 from celery import shared_task
+from django.db import transaction
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def send_appointment_reminder():
-    """Send email reminders for appointments scheduled in the next 24 hours"""
+    """
+    Queue email reminders for confirmed appointments in the next 24 hours.
+    
+    Appointments are picked once: each is marked with reminder_sent_at when a
+    chunk claims it for sending. Due appointments are split into chunks that are sent by
+    send_appointment_reminder_chunk subtasks.
+    """
+    from celery import group
     from .models import Appointment
     
-    # Get appointments scheduled in the next 24 hours
+    # Get appointments scheduled in the next 24 hours that have not been reminded
     now = timezone.now()
-    tomorrow = now + datetime.timedelta(hours=24)
+    window_end = now + datetime.timedelta(hours=settings.APPOINTMENT_REMINDER_WINDOW_HOURS)
     
-    upcoming_appointments = Appointment.objects.filter(
-        datetime__range=(now, tomorrow),
-        status='confirmed'
+    due_ids = list(
+        Appointment.objects.filter(
+            datetime__range=(now, window_end),
+            status='confirmed',
+            reminder_sent_at__isnull=True
+        ).exclude(patient__email='').order_by('datetime').values_list('id', flat=True)
     )
     
-    for appointment in upcoming_appointments:
-        # Skip if no email is provided
-        if not appointment.patient.email:
-            continue
-            
-        # Format appointment time for display
-        appointment_time = appointment.datetime.strftime('%B %d, %Y at %I:%M %p')
-        doctor_name = appointment.doctor.full_name or appointment.doctor.username
-        
-        # Send email reminder
-        subject = f'Reminder: Appointment with Dr. {doctor_name}'
-        message = f"""
+    size = settings.APPOINTMENT_REMINDER_CHUNK_SIZE
+    chunks = [due_ids[i:i + size] for i in range(0, len(due_ids), size)]
+    if chunks:
+        group(send_appointment_reminder_chunk.s(chunk) for chunk in chunks).apply_async()
+    
+    logger.info(f"Queued {len(due_ids)} appointment reminders in {len(chunks)} chunks")
+    return f"Queued {len(due_ids)} appointment reminders in {len(chunks)} chunks"
+
+@shared_task
+def send_appointment_reminder_chunk(appointment_ids):
+    """
+    Send the reminders for a chunk of appointments over one mail connection.
+    
+    The appointments are claimed first, in a short transaction that sets
+    reminder_sent_at on the rows not already claimed or locked by another
+    worker, so overlapping runs never remind the same appointment twice. The
+    emails are sent after it commits, without holding row locks or a
+    transaction open during SMTP round trips. Claims whose email fails are
+    released for the next run; a worker dying mid-chunk leaves its unsent
+    claims marked as sent.
+    """
+    from .models import Appointment
+    
+    started = time.monotonic()
+    sender_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@healthmateai.com')
+    claimed_at = timezone.now()
+    sent = 0
+    failed_ids = []
+    
+    with transaction.atomic():
+        appointments = list(
+            Appointment.objects.select_related('patient', 'doctor')
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=appointment_ids, status='confirmed', reminder_sent_at__isnull=True)
+        )
+        Appointment.objects.filter(id__in=[appointment.id for appointment in appointments]).update(
+            reminder_sent_at=claimed_at
+        )
+    
+    # One SMTP session for the whole chunk
+    with get_connection() as connection:
+        for appointment in appointments:
+            try:
+                delivered = connection.send_messages([build_reminder_message(appointment, sender_email)])
+            except Exception as e:
+                logger.warning(f"Reminder for appointment {appointment.id} failed: {str(e)}")
+                delivered = 0
+            if delivered:
+                sent += 1
+            else:
+                failed_ids.append(appointment.id)
+    
+    # Release failed claims, unless the appointment was rescheduled meanwhile
+    Appointment.objects.filter(id__in=failed_ids, reminder_sent_at=claimed_at).update(reminder_sent_at=None)
+    
+    failed = len(failed_ids)
+    skipped = len(appointment_ids) - len(appointments)
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Appointment reminders: sent={sent} failed={failed} skipped={skipped} "
+        f"seconds={elapsed:.2f}"
+    )
+    return f"Sent {sent} appointment reminders ({failed} failed, {skipped} skipped) in {elapsed:.2f}s"
+
+def build_reminder_message(appointment, sender_email):
+    """Build the reminder email for an appointment with its patient and doctor loaded"""
+    # Format appointment time for display
+    appointment_time = appointment.datetime.strftime('%B %d, %Y at %I:%M %p')
+    doctor_name = appointment.doctor.full_name or appointment.doctor.username
+    
+    subject = f'Reminder: Appointment with Dr. {doctor_name}'
+    message = f"""
         Hello {appointment.patient.full_name or appointment.patient.username},
         
         This is a reminder that you have an appointment scheduled with Dr. {doctor_name} on {appointment_time}.
@@ -39,19 +114,8 @@ def send_appointment_reminder():
         Thank you,
         HealthMateAI Team
         """
-        
-        # In production, use actual sender email
-        sender_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@healthmateai.com')
-        
-        send_mail(
-            subject,
-            message,
-            sender_email,
-            [appointment.patient.email],
-            fail_silently=True,
-        )
-        
-    return f"Sent {upcoming_appointments.count()} appointment reminders"
+    
+    return EmailMessage(subject, message, sender_email, [appointment.patient.email])
 
 @shared_task
 def update_completed_appointments():
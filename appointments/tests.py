@@ -1,3 +1,388 @@
-from django.test import TestCase
+import importlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.apps import apps
+from django.core import mail
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.models import CareRelationship, CustomUser
+from .availability import IntervalIndex, find_booking_conflict, free_slots
+from .models import Appointment
+from . import tasks
 
-# Create your tests here.
+# A Monday
+MONDAY = datetime(2030, 1, 7, tzinfo=dt_timezone.utc)
+
+
+def at(hour, minute=0, day=0):
+    return MONDAY + timedelta(days=day, hours=hour, minutes=minute)
+
+
+class IntervalIndexTests(SimpleTestCase):
+    """Half-open interval overlaps and gaps"""
+
+    def setUp(self):
+        self.index = IntervalIndex([(10, 12, 'b'), (1, 3, 'a'), (2, 20, 'long'), (14, 15, 'c')])
+
+    def test_overlaps(self):
+        self.assertTrue(self.index.overlaps(0, 2))
+        self.assertTrue(self.index.overlaps(16, 17))  # Only the long interval reaches here
+        self.assertFalse(self.index.overlaps(20, 25))  # Touching the end is not an overlap
+        self.assertFalse(self.index.overlaps(-5, 1))
+        self.assertFalse(IntervalIndex().overlaps(0, 10))
+
+    def test_overlapping(self):
+        self.assertEqual(self.index.overlapping(11, 14), [(2, 20, 'long'), (10, 12, 'b')])
+        self.assertEqual(self.index.overlapping(0, 2), [(1, 3, 'a')])
+        self.assertEqual(self.index.overlapping(20, 30), [])
+
+    def test_gaps(self):
+        index = IntervalIndex([(2, 4), (3, 5), (7, 8)])
+        self.assertEqual(list(index.gaps(0, 10)), [(0, 2), (5, 7), (8, 10)])
+        self.assertEqual(list(index.gaps(2, 5)), [])
+        self.assertEqual(list(IntervalIndex().gaps(0, 10)), [(0, 10)])
+
+
+class AppointmentTestCase(TestCase):
+
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            email='doctor@example.com', username='doctor', password='testpass123', is_doctor=True
+        )
+        profile = self.doctor.doctor_profile
+        profile.available_times = {'timezone': 'UTC', 'monday': ['09:00-12:00', '13:00-17:00']}
+        profile.save()
+        self.patient = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.other_patient = CustomUser.objects.create_user(
+            email='other@example.com', username='other', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def book(self, start, end, patient=None, status='confirmed'):
+        return Appointment.objects.create(doctor=self.doctor, patient=patient or self.other_patient,
+                                          datetime=start, end_time=end, status=status)
+
+
+class AvailabilityTests(AppointmentTestCase):
+    """Free slots inside working hours and around active appointments"""
+
+    def test_free_slots(self):
+        self.book(at(10), at(11))
+        self.book(at(14), at(15), status='cancelled')
+        slots = free_slots(self.doctor, at(8), at(18), timedelta(hours=1))
+        self.assertEqual(slots, [(at(9), at(10)), (at(11), at(12)),
+                                 (at(13), at(14)), (at(14), at(15)), (at(15), at(16)), (at(16), at(17))])
+
+        slots = free_slots(self.doctor, at(9), at(12), timedelta(minutes=45), step=timedelta(minutes=30))
+        self.assertEqual(slots, [(at(9), at(9, 45)), (at(11), at(11, 45))])
+        # No hours on Tuesdays
+        self.assertEqual(free_slots(self.doctor, at(0, day=1), at(23, day=1), timedelta(hours=1)), [])
+
+    def test_no_template_means_always_open(self):
+        self.doctor.doctor_profile.available_times = {}
+        self.doctor.doctor_profile.save()
+        self.book(at(1), at(2))
+        self.assertEqual(free_slots(self.doctor, at(0), at(3), timedelta(hours=1)),
+                         [(at(0), at(1)), (at(2), at(3))])
+
+    def test_endpoint(self):
+        self.book(at(9, 30), at(11, 30))
+        response = self.client.get('/api/appointments/availability/', {
+            'doctor': self.doctor.id, 'start': at(9).isoformat(), 'end': at(12).isoformat(), 'duration': 30,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['doctor'], self.doctor.id)
+        self.assertEqual(response.data['slots'], [{'start': at(9), 'end': at(9, 30)},
+                                                  {'start': at(11, 30), 'end': at(12)}])
+
+    def test_endpoint_rejects_bad_queries(self):
+        url = '/api/appointments/availability/'
+        query = {'doctor': self.doctor.id, 'start': at(9).isoformat(), 'end': at(12).isoformat()}
+        for changes in [{'doctor': 'x'}, {'start': 'tomorrow'}, {'end': at(8).isoformat()},
+                        {'duration': 0}, {'step': 'x'}, {'end': at(0, day=40).isoformat()}]:
+            response = self.client.get(url, {**query, **changes})
+            self.assertEqual(response.status_code, 400, changes)
+        response = self.client.get(url, {**query, 'doctor': self.patient.id})
+        self.assertEqual(response.status_code, 404)
+
+
+class BookingConflictTests(AppointmentTestCase):
+    """Bookings must fit the doctor's hours and both participants' calendars"""
+
+    def create(self, start, end, **data):
+        return self.client.post('/api/appointments/', {
+            'doctor': self.doctor.id, 'patient': self.patient.id, 'datetime': start, 'end_time': end,
+            'reason': 'Checkup', **data
+        }, format='json')
+
+    def test_conflicts(self):
+        self.book(at(10), at(11))
+        self.assertEqual(find_booking_conflict(self.doctor, self.patient, at(7), at(8)), 'outside_hours')
+        self.assertEqual(find_booking_conflict(self.doctor, self.patient, at(11, 30), at(12, 30)), 'outside_hours')
+        self.assertEqual(find_booking_conflict(self.doctor, self.patient, at(10, 30), at(11, 30)), 'doctor_busy')
+        self.assertIsNone(find_booking_conflict(self.doctor, self.patient, at(11), at(12)))
+
+        other_doctor = CustomUser.objects.create_user(
+            email='other-doctor@example.com', username='other-doctor', password='testpass123', is_doctor=True
+        )
+        Appointment.objects.create(doctor=other_doctor, patient=self.patient, datetime=at(9), end_time=at(10))
+        self.assertEqual(find_booking_conflict(self.doctor, self.patient, at(9, 30), at(10)), 'patient_busy')
+        self.assertIsNone(find_booking_conflict(self.doctor, self.other_patient, at(9), at(10)))
+
+    def test_create(self):
+        response = self.create(at(9), at(9, 30))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['patient'], self.patient.id)
+        self.assertEqual(response.data['status'], 'pending')
+
+        for start, end in [(at(9, 15), at(9, 45)), (at(7), at(8)), (at(11, 30), at(13))]:
+            response = self.create(start, end)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('datetime', response.data)
+        response = self.create(at(10), at(9))
+        self.assertIn('end_time', response.data)
+
+        # Cancelled appointments free their slot
+        self.book(at(10), at(11), status='cancelled')
+        self.assertEqual(self.create(at(10), at(11)).status_code, 201)
+
+    def test_edit_without_rescheduling(self):
+        # Booked before the doctor narrowed their hours
+        appointment = self.book(at(7), at(8), patient=self.patient)
+        url = f'/api/appointments/{appointment.id}/'
+        response = self.client.patch(url, {'notes': 'Bring test results', 'reason': 'Follow-up'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reason'], 'Follow-up')
+
+        # Sending the stored time back is not a reschedule either
+        response = self.client.patch(url, {'datetime': at(7), 'status': 'confirmed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.patch(url, {'datetime': at(7, 30)}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_reschedule(self):
+        appointment = self.book(at(9), at(10), patient=self.patient)
+        self.book(at(11), at(12))
+        url = f'/api/appointments/{appointment.id}/'
+        response = self.client.patch(url, {'datetime': at(11), 'end_time': at(11, 30)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(response.data['datetime'][0]), 'This time slot conflicts with another appointment')
+
+        # Moving within its own slot does not conflict with itself
+        response = self.client.patch(url, {'datetime': at(9, 30)}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_reactivate(self):
+        appointment = self.book(at(9), at(10), patient=self.patient, status='cancelled')
+        self.book(at(9), at(10))
+        response = self.client.patch(f'/api/appointments/{appointment.id}/', {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_users_cannot_edit(self):
+        appointment = self.book(at(9), at(10))
+        response = self.client.patch(f'/api/appointments/{appointment.id}/', {'notes': 'x'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class OverlapMigrationTests(AppointmentTestCase):
+    """Legacy double-bookings are cancelled before the exclusion constraints are added"""
+
+    def test_cancel_overlapping_appointments(self):
+        migration = importlib.import_module('appointments.migrations.0004_availability_constraints')
+        other_doctor = CustomUser.objects.create_user(
+            email='other-doctor@example.com', username='other-doctor', password='testpass123', is_doctor=True
+        )
+        kept = [
+            self.book(at(10), at(11)),
+            self.book(at(11), at(12)),
+            self.book(at(10), at(11), status='cancelled'),
+            self.book(at(10), at(11), status='completed'),
+            Appointment.objects.create(doctor=other_doctor, patient=self.patient, datetime=at(10), end_time=at(11)),
+        ]
+        doctor_busy = self.book(at(10, 30), at(11, 30), patient=self.patient)
+        patient_busy = Appointment.objects.create(
+            doctor=other_doctor, patient=self.other_patient, datetime=at(11, 45), end_time=at(12, 15)
+        )
+        inverted = self.book(at(15), at(14), patient=self.patient)
+
+        with self.assertLogs(migration.logger, 'WARNING') as logs:
+            migration.cancel_overlapping_appointments(apps, None)
+        self.assertEqual(len(logs.output), 3)
+        statuses = dict(Appointment.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[a.id] for a in kept], ['confirmed', 'confirmed', 'cancelled', 'completed', 'pending'])
+        for appointment in (doctor_busy, patient_busy, inverted):
+            self.assertEqual(statuses[appointment.id], 'cancelled')
+
+
+@override_settings(APPOINTMENT_REMINDER_CHUNK_SIZE=2)
+class ReminderTests(AppointmentTestCase):
+    """Each confirmed appointment in the window is reminded exactly once"""
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.due = [
+            self.book(now + timedelta(hours=hours), now + timedelta(hours=hours, minutes=30),
+                      patient=CustomUser.objects.create_user(email=f'due{hours}@example.com',
+                                                             username=f'due{hours}', password='testpass123'))
+            for hours in (1, 2, 3)
+        ]
+        # Outside the window, or not confirmed
+        self.book(now + timedelta(days=3), now + timedelta(days=3, minutes=30))
+        self.book(now + timedelta(hours=4), now + timedelta(hours=5), status='pending')
+
+    def reminded(self):
+        return sorted(message.to[0] for message in mail.outbox)
+
+    def remind(self):
+        """Run the reminder task, running its chunks inline instead of through the broker"""
+        chunks = []
+
+        def run_inline(signatures):
+            signatures = list(signatures)
+            chunks.extend(signature.args[0] for signature in signatures)
+            return mock.Mock(apply_async=lambda: [signature.apply() for signature in signatures])
+
+        with mock.patch('celery.group', side_effect=run_inline):
+            tasks.send_appointment_reminder()
+        return chunks
+
+    def test_sent_once(self):
+        self.assertEqual(self.remind(), [[a.id for a in self.due[:2]], [self.due[2].id]])
+        self.assertEqual(self.reminded(), ['due1@example.com', 'due2@example.com', 'due3@example.com'])
+        self.assertFalse(Appointment.objects.filter(id__in=[a.id for a in self.due],
+                                                    reminder_sent_at__isnull=True).exists())
+
+        self.assertEqual(self.remind(), [])
+        tasks.send_appointment_reminder_chunk([a.id for a in self.due])
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_overlapping_run_skips_claimed(self):
+        ids = [a.id for a in self.due]
+        build = tasks.build_reminder_message
+        results = []
+
+        def build_and_overlap(appointment, sender_email):
+            # Another worker runs the same chunk while this one is sending
+            if not results:
+                results.append(tasks.send_appointment_reminder_chunk(ids))
+            return build(appointment, sender_email)
+
+        with mock.patch.object(tasks, 'build_reminder_message', side_effect=build_and_overlap):
+            tasks.send_appointment_reminder_chunk(ids)
+        self.assertTrue(results[0].startswith('Sent 0 appointment reminders (0 failed, 3 skipped)'))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_send_is_retried(self):
+        build = tasks.build_reminder_message
+
+        def fail_first(appointment, sender_email):
+            if appointment.id == self.due[0].id:
+                raise ConnectionError('SMTP down')
+            return build(appointment, sender_email)
+
+        with mock.patch.object(tasks, 'build_reminder_message', side_effect=fail_first):
+            result = tasks.send_appointment_reminder_chunk([a.id for a in self.due])
+        self.assertTrue(result.startswith('Sent 2 appointment reminders (1 failed, 0 skipped)'))
+        self.due[0].refresh_from_db()
+        self.assertIsNone(self.due[0].reminder_sent_at)
+
+        self.assertEqual(self.remind(), [[self.due[0].id]])
+        self.assertEqual(self.reminded(), ['due1@example.com', 'due2@example.com', 'due3@example.com'])
+
+    def test_rescheduled_appointment_is_reminded_again(self):
+        tasks.send_appointment_reminder_chunk([a.id for a in self.due])
+        appointment = self.due[0]
+        self.client.force_authenticate(appointment.patient)
+        new_start = appointment.datetime + timedelta(hours=5)
+        self.doctor.doctor_profile.available_times = {}
+        self.doctor.doctor_profile.save()
+        response = self.client.patch(f'/api/appointments/{appointment.id}/', {
+            'datetime': new_start, 'end_time': new_start + timedelta(minutes=30)
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.remind(), [[appointment.id]])
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(mail.outbox[-1].to, ['due1@example.com'])
+
+
+class AppointmentParticipantTests(AppointmentTestCase):
+    """Appointments cannot be used to reach patients outside the caller's care"""
+
+    def setUp(self):
+        super().setUp()
+        self.doctor_client = APIClient()
+        self.doctor_client.force_authenticate(self.doctor)
+
+    def create(self, client, **data):
+        return client.post('/api/appointments/', {
+            'doctor': self.doctor.id, 'datetime': at(9), 'end_time': at(9, 30), **data
+        }, format='json')
+
+    def in_care(self, patient):
+        return CareRelationship.objects.filter(doctor=self.doctor, patient=patient).exists()
+
+    def test_patients_book_for_themselves(self):
+        response = self.create(self.client, patient=self.other_patient.id, patient_confirmed_at=None)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['patient'], self.patient.id)
+        self.assertIsNotNone(response.data['patient_confirmed_at'])
+        self.assertTrue(self.in_care(self.patient))
+        self.assertFalse(self.in_care(self.other_patient))
+
+    def test_doctors_cannot_book_strangers(self):
+        response = self.create(self.doctor_client, patient=self.other_patient.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('patient', response.data)
+        self.assertEqual(self.create(self.doctor_client).status_code, 400)
+        self.assertFalse(Appointment.objects.exists())
+        self.assertFalse(self.in_care(self.other_patient))
+
+    def test_doctor_booking_needs_patient_confirmation(self):
+        first = self.book(at(9), at(10), patient=self.patient)
+        first.patient_confirmed_at = timezone.now()
+        first.save()
+        other_doctor = CustomUser.objects.create_user(
+            email='other-doctor@example.com', username='other-doctor', password='testpass123', is_doctor=True
+        )
+        response = self.create(self.doctor_client, patient=self.patient.id, doctor=other_doctor.id,
+                               datetime=at(13), end_time=at(14))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['doctor'], self.doctor.id)
+        self.assertIsNone(response.data['patient_confirmed_at'])
+        url = f"/api/appointments/{response.data['id']}/confirm/"
+
+        # The doctor's own booking does not keep access once the patient's is cancelled
+        first.status = 'cancelled'
+        first.save()
+        self.assertFalse(self.in_care(self.patient))
+        self.assertEqual(self.doctor_client.post(url).status_code, 403)
+        self.assertFalse(self.in_care(self.patient))
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['patient_confirmed_at'])
+        self.assertTrue(self.in_care(self.patient))
+
+    def test_participants_cannot_be_swapped(self):
+        response = self.create(self.client)
+        url = f"/api/appointments/{response.data['id']}/"
+        other_doctor = CustomUser.objects.create_user(
+            email='other-doctor@example.com', username='other-doctor', password='testpass123', is_doctor=True
+        )
+        response = self.doctor_client.patch(url, {'patient': self.other_patient.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.doctor_client.patch(url, {'doctor': other_doctor.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.in_care(self.other_patient))
+
+        # The patient may move the appointment to another doctor
+        response = self.client.patch(url, {'doctor': other_doctor.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.in_care(self.patient))
@@ -1,10 +1,17 @@
-from django.shortcuts import render
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Appointment
-from .serializers import AppointmentSerializer
+from .serializers import AppointmentSerializer, rejecting_overlaps
+from .availability import free_slots
+from healthmateai.pagination import HistoryCursorPagination
 from users.permissions import IsDoctor, IsPatient, IsOwnerOrReadOnly
 from .filters import AppointmentFilter
 
@@ -21,6 +28,8 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     filterset_class = AppointmentFilter
     search_fields = ['reason', 'notes']
     ordering_fields = ['datetime', 'created_at', 'updated_at']
+    ordering = ['datetime']
+    pagination_class = HistoryCursorPagination
     
     def get_queryset(self):
         """
@@ -61,7 +70,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             )
             
         appointment.status = new_status
-        appointment.save()
+        # Re-activating a cancelled appointment can collide with a newer booking
+        with rejecting_overlaps():
+            appointment.save()
         
         return Response(AppointmentSerializer(appointment).data)
     
@@ -78,3 +89,70 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         appointment.save()
         
         return Response(AppointmentSerializer(appointment).data)
+    
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsPatient])
+    def confirm(self, request, pk=None):
+        """
+        Confirm an appointment booked by the doctor.
+        Only the patient can confirm; confirmed appointments give the doctor
+        access to the patient's records.
+        """
+        appointment = self.get_object()
+        if appointment.patient_confirmed_at is None:
+            appointment.patient_confirmed_at = timezone.now()
+            appointment.save()
+        
+        return Response(AppointmentSerializer(appointment).data)
+    
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        List a doctor's free slots.
+        
+        Query parameters: doctor (user ID), start and end (ISO 8601 datetimes),
+        and optionally duration and step in minutes. Slots fall inside the
+        doctor's working hours and avoid pending and confirmed appointments.
+        """
+        try:
+            doctor_id = int(request.query_params.get('doctor'))
+            start = self._parse_aware(request.query_params.get('start'))
+            end = self._parse_aware(request.query_params.get('end'))
+            duration = timedelta(minutes=int(request.query_params.get('duration', settings.APPOINTMENT_SLOT_MINUTES)))
+            step = timedelta(minutes=int(request.query_params.get('step', duration.total_seconds() // 60)))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Provide a doctor ID, start and end as ISO 8601 datetimes, and duration and step as minutes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if end <= start or duration <= timedelta(0) or step <= timedelta(0):
+            return Response(
+                {"error": "end must be after start, and duration and step must be positive"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end - start > timedelta(days=settings.APPOINTMENT_AVAILABILITY_MAX_DAYS):
+            return Response(
+                {"error": f"The range can span at most {settings.APPOINTMENT_AVAILABILITY_MAX_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        doctor = get_object_or_404(
+            get_user_model().objects.select_related('doctor_profile'),
+            id=doctor_id,
+            is_doctor=True
+        )
+        slots = free_slots(doctor, start, end, duration, step)
+        
+        return Response({
+            "doctor": doctor.id,
+            "slots": [{"start": slot_start, "end": slot_end} for slot_start, slot_end in slots]
+        })
+    
+    @staticmethod
+    def _parse_aware(value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"Invalid datetime: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['user', 'diagnosis_date'], name='diagnosis_user_date_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
@@ -62,10 +64,20 @@ class Diagnosis(models.Model):
     
     class Meta:
         ordering = ['-diagnosis_date']
+        indexes = [
+            models.Index(fields=['user', 'diagnosis_date'], name='diagnosis_user_date_idx'),
+        ]
         verbose_name_plural = "Diagnoses"
     
     def __str__(self):
         return f"{self.title} - {self.get_source_display()} ({self.diagnosis_date})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the doctor and patient so a change refreshes the old care relationship too
+        instance._care_pair = (instance.__dict__.get('doctor_id'), instance.__dict__.get('user_id'))
+        return instance
 
 class Treatment(models.Model):
     """Model for treatment plans associated with diagnoses"""
@@ -174,3 +186,14 @@ class FollowUp(models.Model):
     
     def __str__(self):
         return f"{self.get_follow_up_type_display()} for {self.diagnosis.title} ({self.recommended_date})"
+
+
+@receiver([post_save, post_delete], sender=Diagnosis)
+def refresh_care_relationship(sender, instance, **kwargs):
+    """Keep the doctor-patient care relationship in step with doctor diagnoses"""
+    from users.models import CareRelationship
+    
+    pairs = {(instance.doctor_id, instance.user_id), getattr(instance, '_care_pair', (None, None))}
+    for doctor_id, patient_id in pairs:
+        CareRelationship.refresh(doctor_id, patient_id)
+    instance._care_pair = (instance.doctor_id, instance.user_id)
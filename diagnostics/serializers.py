@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from healthmateai.serializers import SparseFieldsetsMixin
 from .models import Diagnosis, Treatment, FollowUp
 from users.serializers import UserProfileSerializer
 
-class TreatmentSerializer(serializers.ModelSerializer):
+class TreatmentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Treatment
         fields = [
@@ -18,7 +19,7 @@ class TreatmentSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         return Treatment.objects.create(user=user, **validated_data)
 
-class FollowUpSerializer(serializers.ModelSerializer):
+class FollowUpSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = FollowUp
         fields = [
@@ -38,7 +39,7 @@ class FollowUpSerializer(serializers.ModelSerializer):
         
         return follow_up
 
-class DiagnosisSerializer(serializers.ModelSerializer):
+class DiagnosisSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     treatments = TreatmentSerializer(many=True, read_only=True)
     follow_ups = FollowUpSerializer(many=True, read_only=True)
     doctor_details = serializers.SerializerMethodField()
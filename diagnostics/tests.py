@@ -1,3 +1,88 @@
-from django.test import TestCase
+from datetime import date
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from users.models import CustomUser
+from .models import Diagnosis, Treatment
 
-# Create your tests here.
+
+@override_settings(LLM_BACKEND='stub', LLM_STUB_LATENCY=0)
+class GenerateTreatmentTests(TestCase):
+    """Treatment plans are generated by the async endpoint"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.diagnosis = Diagnosis.objects.create(
+            user=self.user, source='user', title='Migraine', description='Recurring headaches',
+            diagnosis_date=date.today()
+        )
+
+    def generate(self, diagnosis):
+        return self.client.post(f'/api/diagnostics/diagnoses/{diagnosis.id}/generate_treatment/')
+
+    def test_generate_treatment(self):
+        plan = ('{"title": "Migraine care", "description": "Rest in a dark room", "type": "lifestyle", '
+                '"instructions": "Avoid triggers"}')
+        with mock.patch('diagnostics.services.achat_completion', return_value=plan):
+            response = self.generate(self.diagnosis)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Migraine care')
+        treatment = Treatment.objects.get()
+        self.assertEqual((treatment.diagnosis, treatment.treatment_type), (self.diagnosis, 'lifestyle'))
+
+    def test_unusable_reply_falls_back(self):
+        with mock.patch('diagnostics.services.achat_completion', return_value='not json'):
+            response = self.generate(self.diagnosis)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'General management approach')
+
+    def test_other_users_diagnosis(self):
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.generate(self.diagnosis).status_code, 404)
+        self.assertFalse(Treatment.objects.exists())
+
+
+class DiagnosisPaginationTests(TestCase):
+    """Diagnoses sharing a date are paged without gaps or repeats"""
+
+    def test_same_date_pages(self):
+        user = CustomUser.objects.create_user(email='patient@example.com', username='patient', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user)
+        created = [
+            Diagnosis.objects.create(user=user, source='user', title=f'Diagnosis {i}', description='',
+                                     diagnosis_date=date(2024, 1, 1 + i // 3))
+            for i in range(7)
+        ]
+
+        ids = []
+        url = '/api/diagnostics/diagnoses/?page_size=2'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [diagnosis['id'] for diagnosis in response.data['results']]
+            url = response.data['next']
+        # Newest date first, then newest row first within a date
+        expected = sorted(created, key=lambda d: (d.diagnosis_date, d.id), reverse=True)
+        self.assertEqual(ids, [d.id for d in expected])
+
+        # Walking back from the last page returns the same rows
+        response = client.get('/api/diagnostics/diagnoses/?page_size=2')
+        while response.data['next']:
+            response = client.get(response.data['next'])
+        previous = response.data['previous']
+        response = client.get(previous)
+        self.assertEqual([d['id'] for d in response.data['results']], ids[4:6])
+
+        # ?ordering= reorders the pages, still with the id tiebreaker
+        response = client.get('/api/diagnostics/diagnoses/?ordering=diagnosis_date&page_size=4')
+        following = client.get(response.data['next'])
+        self.assertEqual([d['id'] for d in response.data['results'] + following.data['results']],
+                         [d.id for d in reversed(expected)])
+
+        self.assertEqual(client.get('/api/diagnostics/diagnoses/?cursor=bogus').status_code, 404)
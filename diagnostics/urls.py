@@ -8,5 +8,6 @@ router.register(r'treatments', views.TreatmentViewSet, basename='treatment')
 router.register(r'follow-ups', views.FollowUpViewSet, basename='follow-up')
 
 urlpatterns = [
+    path('diagnoses/<int:pk>/generate_treatment/', views.GenerateTreatmentView.as_view(), name='diagnosis-generate-treatment'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
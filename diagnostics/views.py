@@ -1,4 +1,5 @@
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
@@ -14,8 +15,11 @@ from .serializers import (
     FollowUpSerializer,
     FollowUpUpdateSerializer
 )
+from symptoms.catalog import attach_symptoms
 from symptoms.models import SymptomCheck
-from .services import generate_treatment_plan
+from healthmateai.pagination import HistoryCursorPagination
+from healthmateai.views import AsyncAPIView
+from .services import agenerate_treatment_plan
 
 class DiagnosisViewSet(viewsets.ModelViewSet):
     """
@@ -26,6 +30,7 @@ class DiagnosisViewSet(viewsets.ModelViewSet):
     filterset_fields = ['source', 'status', 'confidence']
     ordering_fields = ['diagnosis_date', 'created_at']
     ordering = ['-diagnosis_date']
+    pagination_class = HistoryCursorPagination
     
     def get_queryset(self):
         return Diagnosis.objects.filter(user=self.request.user)
@@ -58,17 +63,6 @@ class DiagnosisViewSet(viewsets.ModelViewSet):
         serializer = DiagnosisSerializer(diagnosis)
         return Response(serializer.data)
     
-    @action(detail=True, methods=['post'])
-    def generate_treatment(self, request, pk=None):
-        """Generate a treatment plan for this diagnosis"""
-        diagnosis = self.get_object()
-        
-        # Generate treatment plan
-        treatment = generate_treatment_plan(diagnosis)
-        
-        serializer = TreatmentSerializer(treatment)
-        return Response(serializer.data)
-    
     @action(detail=False, methods=['post'])
     def from_symptom_check(self, request):
         """Create a diagnosis from a symptom check result"""
@@ -106,7 +100,7 @@ class DiagnosisViewSet(viewsets.ModelViewSet):
                 confidence=top_condition.get('confidence', 'low'),
                 diagnosis_date=timezone.now().date(),
                 status='active',
-                related_symptoms=[s.symptom.name for s in symptom_check.symptoms.all()]
+                related_symptoms=[s.symptom.name for s in attach_symptoms(list(symptom_check.symptoms.all()))]
             )
             
             serializer = DiagnosisSerializer(diagnosis)
@@ -118,6 +112,26 @@ class DiagnosisViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+class GenerateTreatmentView(AsyncAPIView):
+    """
+    API endpoint that generates a treatment plan for a diagnosis.
+    
+    The OpenAI call is awaited on the event loop, so it does not hold a
+    worker while the plan is generated.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    async def post(self, request, pk=None):
+        diagnosis = await sync_to_async(get_object_or_404)(
+            Diagnosis.objects.select_related('user'), pk=pk, user=request.user
+        )
+        
+        # Generate treatment plan
+        treatment = await agenerate_treatment_plan(diagnosis)
+        
+        data = await sync_to_async(lambda: TreatmentSerializer(treatment).data)()
+        return Response(data)
+
 class TreatmentViewSet(viewsets.ModelViewSet):
     """
     API endpoint for managing treatments.
@@ -1,5 +1,12 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
+from healthmateai.postgres import is_postgres
 from .models import DoctorProfile
+from .search import SEARCH_FIELDS, doctor_search_index
 
 class DoctorProfileFilter(filters.FilterSet):
     """
@@ -22,6 +29,46 @@ class DoctorProfileFilter(filters.FilterSet):
         Custom filter method for specialty field (JSONField)
         Filters doctors that have the specified specialty in their specialties list
         """
-        # This requires PostgreSQL with JSONField containment operator @>
-        # For SQLite, we can use a simple string contains check
-        return queryset.filter(specialties__contains=value) 
\ No newline at end of file
+        # PostgreSQL answers the containment (@>) from the GIN index on specialties;
+        # other databases cannot filter JSON arrays, so use the in-memory index
+        if is_postgres(queryset.db):
+            return queryset.filter(specialties__contains=[value])
+        return queryset.filter(id__in=doctor_search_index.with_specialty(value))
+
+
+class DoctorSearchFilter(SearchFilter):
+    """
+    Ranked free-text search over doctor names, locations and bios.
+    
+    Takes the same ``?search=`` parameter as DRF's SearchFilter. On PostgreSQL
+    doctors are matched by trigram word similarity, which the trigram GIN
+    indexes serve, and ordered by their best similarity across the fields.
+    Elsewhere the in-memory index in doctors.search ranks the matches.
+    """
+    
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        
+        if is_postgres(queryset.db):
+            matches = Q()
+            for field in SEARCH_FIELDS:
+                matches |= Q(**{f'{field}__trigram_word_similar': query})
+            rank = Greatest(*[TrigramWordSimilarity(query, field) for field in SEARCH_FIELDS])
+            return queryset.filter(matches).annotate(search_rank=rank).order_by('-search_rank', '-rating')
+        
+        results = doctor_search_index.search(query, limit=settings.DOCTOR_SEARCH_MAX_RESULTS)
+        if not results:
+            return queryset.none()
+        # One branch per distinct score keeps the CASE short
+        ids_by_score = {}
+        for doctor_id, score in results:
+            ids_by_score.setdefault(score, []).append(doctor_id)
+        rank = Case(
+            *[When(id__in=ids, then=Value(score)) for score, ids in ids_by_score.items()],
+            output_field=FloatField()
+        )
+        return queryset.filter(id__in=[doctor_id for doctor_id, _ in results]).annotate(
+            search_rank=rank
+        ).order_by('-search_rank', '-rating') 
\ No newline at end of file
@@ -0,0 +1,113 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+from doctors.filters import DoctorProfileFilter, DoctorSearchFilter
+from doctors.models import DoctorProfile
+from doctors.search import doctor_search_index
+from healthmateai.postgres import is_postgres
+from users.models import CustomUser
+
+FIRST_NAMES = ['James', 'Maria', 'Wei', 'Aisha', 'Carlos', 'Olga', 'Kenji', 'Fatima', 'Liam', 'Priya',
+               'Noah', 'Sofia', 'Omar', 'Elena', 'Yusuf', 'Hannah', 'Mateo', 'Ingrid', 'Ravi', 'Chloe']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Okafor', 'Rossi', 'Ivanova', 'Tanaka', 'Haddad', 'Murphy', 'Patel',
+              'Kowalski', 'Nguyen', 'Schmidt', 'Silva', 'Dubois', 'Andersen', 'Kim', 'Moreno', 'Cohen', 'Walsh']
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio',
+          'San Diego', 'Dallas', 'Austin', 'Seattle', 'Denver', 'Boston', 'Portland', 'Atlanta', 'Miami']
+SPECIALTIES = ['Cardiology', 'Dermatology', 'Neurology', 'Pediatrics', 'Oncology', 'Orthopedics',
+               'Psychiatry', 'Radiology', 'Endocrinology', 'Gastroenterology', 'Urology', 'Ophthalmology']
+
+class Command(BaseCommand):
+    help = 'Seeds doctors and reports doctor search latency; the seeded data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Number of doctors to seed')
+        parser.add_argument('--queries', type=int, default=200, help='Queries to time per search type')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated data')
+        parser.add_argument('--keep', action='store_true', help='Commit the seeded doctors instead of rolling back')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self.seed(rng, options['count'])
+            self.run(rng, options['queries'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        # The index may hold rolled-back doctors
+        doctor_search_index.invalidate()
+
+    def seed(self, rng, count):
+        started = time.perf_counter()
+        run_id = rng.randrange(10 ** 8)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f'bench-{run_id}-{i}@example.com',
+                username=f'bench-{run_id}-{i}',
+                password='!',  # Unusable password
+                full_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                is_doctor=True,
+            )
+            for i in range(count)
+        ], batch_size=2000)
+
+        # bulk_create skips the post_save signal that creates profiles
+        DoctorProfile.objects.bulk_create([
+            DoctorProfile(
+                user=user,
+                specialties=rng.sample(SPECIALTIES, rng.randint(1, 3)),
+                location=f'{rng.choice(CITIES)}, USA',
+                bio=f'Board-certified physician with a focus on {rng.choice(SPECIALTIES).lower()} and preventive care.',
+                experience_years=rng.randint(1, 40),
+                rating=round(rng.uniform(1, 5), 1),
+            )
+            for user in users
+        ], batch_size=2000)
+
+        if is_postgres():
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {CustomUser._meta.db_table}')
+                cursor.execute(f'ANALYZE {DoctorProfile._meta.db_table}')
+        self.stdout.write(f'Seeded {count} doctors in {time.perf_counter() - started:.1f}s')
+
+        doctor_search_index.invalidate()
+        if not is_postgres():
+            started = time.perf_counter()
+            doctor_search_index.search('warmup')
+            self.stdout.write(f'Built the in-memory search index in {time.perf_counter() - started:.1f}s')
+
+    def run(self, rng, queries):
+        factory = RequestFactory()
+        searches = {
+            'specialty': lambda: {'specialty': rng.choice(SPECIALTIES)},
+            'location': lambda: {'location': rng.choice(CITIES)},
+            'name search': lambda: {'search': rng.choice(LAST_NAMES)},
+            'typo search': lambda: {'search': rng.choice(LAST_NAMES)[:-1] + 'x'},
+            'specialty + search': lambda: {'specialty': rng.choice(SPECIALTIES), 'search': rng.choice(CITIES)},
+        }
+
+        backend = 'PostgreSQL' if is_postgres() else 'in-memory index'
+        self.stdout.write(f'Search backend: {backend}; timing {queries} queries per type (first page of 20)')
+        for name, make_params in searches.items():
+            timings = []
+            for _ in range(queries):
+                request = Request(factory.get('/api/doctors/', make_params()))
+                started = time.perf_counter()
+                queryset = DoctorProfile.objects.select_related('user')
+                queryset = DoctorProfileFilter(request.query_params, queryset=queryset, request=request).qs
+                queryset = DoctorSearchFilter().filter_queryset(request, queryset, None)
+                list(queryset[:20])
+                timings.append((time.perf_counter() - started) * 1000)
+
+            p50, p95 = self.percentile(timings, 50), self.percentile(timings, 95)
+            self.stdout.write(f'{name:<20} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms   max {max(timings):8.2f} ms')
+
+    @staticmethod
+    def percentile(values, percent):
+        if len(values) < 2:
+            return values[0]
+        return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from doctors.models import DoctorProfile
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized rating totals of every doctor from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', help='Only rebuild this doctor profile ID (repeatable)')
+
+    def handle(self, *args, **options):
+        queryset = DoctorProfile.objects.all()
+        if options['doctor']:
+            queryset = queryset.filter(pk__in=options['doctor'])
+
+        updated = DoctorProfile.rebuild_ratings(queryset)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {updated} doctors'))
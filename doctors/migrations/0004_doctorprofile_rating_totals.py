@@ -0,0 +1,40 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:46
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_totals(apps, schema_editor):
+    DoctorProfile = apps.get_model('doctors', 'DoctorProfile')
+    DoctorReview = apps.get_model('doctors', 'DoctorReview')
+    reviews = DoctorReview.objects.filter(doctor=OuterRef('pk')).order_by().values('doctor')
+    DoctorProfile.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+        rating=Coalesce(
+            Subquery(reviews.annotate(total=Cast(Sum('rating'), FloatField()) / Count('id')).values('total')),
+            Value(0.0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0003_alter_doctorprofile_available_times_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, help_text='Sum of all review ratings'),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_doctorprofile_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorreview',
+            index=models.Index(fields=['doctor', 'created_at'], name='review_doctor_created_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:52
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+from healthmateai.postgres import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0005_doctorreview_doctor_created_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddPostgresIndex(
+            model_name='doctorprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['specialties'], name='doctor_specialties_gin', opclasses=['jsonb_path_ops']),
+        ),
+        AddPostgresIndex(
+            model_name='doctorprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['location'], name='doctor_location_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        AddPostgresIndex(
+            model_name='doctorprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('location'), name='gin_trgm_ops'), name='doctor_location_upper_trgm'),
+        ),
+        AddPostgresIndex(
+            model_name='doctorprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['bio'], name='doctor_bio_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
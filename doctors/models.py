@@ -1,7 +1,12 @@
+import copy
 from django.db import models
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Upper
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from .search import doctor_search_index
 
 class DoctorProfile(models.Model):
     """Model for doctor profiles with additional information"""
@@ -11,15 +16,93 @@ class DoctorProfile(models.Model):
     education = models.TextField(blank=True)
     experience_years = models.PositiveIntegerField(default=0)
     rating = models.FloatField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0, help_text="Sum of all review ratings")
+    review_count = models.PositiveIntegerField(default=0)
     location = models.CharField(max_length=255, blank=True)
     available_times = models.JSONField(default=dict, help_text="Dictionary of available time slots")
     profile_picture = models.ImageField(upload_to='doctor_profiles/', blank=True, null=True)
     
+    # Fields covered by the in-memory search index, besides the user's full_name
+    SEARCH_INDEXED_FIELDS = ('specialties', 'location', 'bio')
+    
     def __str__(self):
         return f"Dr. {self.user.full_name or self.user.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored searchable values so saves that keep them skip rebuilding the search index
+        instance._original = {
+            field: copy.deepcopy(instance.__dict__.get(field)) for field in cls.SEARCH_INDEXED_FIELDS
+        }
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._original = {
+            field: copy.deepcopy(getattr(self, field)) if update_fields is None or field in update_fields
+            else getattr(self, '_original', {}).get(field)
+            for field in self.SEARCH_INDEXED_FIELDS
+        }
+    
     class Meta:
         ordering = ['-rating']
+        indexes = [
+            # PostgreSQL only; see healthmateai.postgres
+            GinIndex(fields=['specialties'], opclasses=['jsonb_path_ops'], name='doctor_specialties_gin'),
+            GinIndex(fields=['location'], opclasses=['gin_trgm_ops'], name='doctor_location_trgm'),
+            # Serves the icontains location filter, which compares UPPER(location)
+            GinIndex(OpClass(Upper('location'), name='gin_trgm_ops'), name='doctor_location_upper_trgm'),
+            GinIndex(fields=['bio'], opclasses=['gin_trgm_ops'], name='doctor_bio_trgm'),
+        ]
+    
+    @classmethod
+    def apply_review_delta(cls, doctor_id, rating_delta, count_delta):
+        """
+        Adjust a doctor's rating totals in a single UPDATE.
+        
+        The new values are computed by the database from the current row, so
+        concurrent reviews cannot overwrite each other's changes.
+        
+        Args:
+            doctor_id: ID of the DoctorProfile
+            rating_delta: Change to the sum of ratings
+            count_delta: Change to the number of reviews
+        """
+        rating_sum = F('rating_sum') + rating_delta
+        review_count = F('review_count') + count_delta
+        cls.objects.filter(pk=doctor_id).update(
+            rating_sum=rating_sum,
+            review_count=review_count,
+            rating=Case(
+                When(review_count__lte=-count_delta, then=Value(0.0)),
+                default=Cast(rating_sum, FloatField()) / review_count,
+                output_field=FloatField()
+            )
+        )
+    
+    @classmethod
+    def rebuild_ratings(cls, queryset=None):
+        """
+        Recompute rating totals from the reviews table in one set-based UPDATE.
+        
+        Args:
+            queryset: Optional DoctorProfile queryset to limit the rebuild to
+        
+        Returns:
+            The number of profiles updated
+        """
+        reviews = DoctorReview.objects.filter(doctor=OuterRef('pk')).order_by().values('doctor')
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+            review_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+            rating=Coalesce(
+                Subquery(reviews.annotate(total=Cast(Sum('rating'), FloatField()) / Count('id')).values('total')),
+                Value(0.0)
+            )
+        )
 
 
 class DoctorReview(models.Model):
@@ -33,23 +116,89 @@ class DoctorReview(models.Model):
     class Meta:
         unique_together = ('doctor', 'patient')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['doctor', 'created_at'], name='review_doctor_created_idx'),
+        ]
     
     def __str__(self):
         return f"Review for {self.doctor} by {self.patient.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save() can apply only the difference
+        instance._original = {
+            'doctor_id': instance.__dict__.get('doctor_id'),
+            'rating': instance.__dict__.get('rating'),
+        }
+        return instance
+    
     def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding and self.pk is not None and DoctorReview.objects.filter(pk=self.pk).exists():
+            # Constructed with the id of a stored review, so save() updates it
+            adding = False
+        
         # Save the review
         super().save(*args, **kwargs)
         
-        # Update the doctor's rating
-        reviews = DoctorReview.objects.filter(doctor=self.doctor)
-        if reviews:
-            self.doctor.rating = sum(r.rating for r in reviews) / reviews.count()
-            self.doctor.save()
+        # Update the doctor's rating totals
+        original = getattr(self, '_original', None)
+        if adding:
+            DoctorProfile.apply_review_delta(self.doctor_id, self.rating, 1)
+        elif original is None:
+            # Saved over an existing row without loading it; the old rating is unknown
+            DoctorProfile.rebuild_ratings(DoctorProfile.objects.filter(pk=self.doctor_id))
+        elif original['doctor_id'] != self.doctor_id:
+            DoctorProfile.apply_review_delta(original['doctor_id'], -original['rating'], -1)
+            DoctorProfile.apply_review_delta(self.doctor_id, self.rating, 1)
+        elif original['rating'] != self.rating:
+            DoctorProfile.apply_review_delta(self.doctor_id, self.rating - original['rating'], 0)
+        
+        self._original = {'doctor_id': self.doctor_id, 'rating': self.rating}
+
+
+def search_fields_changed(instance, fields, update_fields=None):
+    """
+    Whether a save may have changed fields of the doctor search index.
+    
+    Saves limited to other fields, such as the ``last_login`` update on
+    login, never do. Otherwise the values are compared with the ones loaded
+    from the database; instances not loaded from it count as changed.
+    """
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return False
+    original = getattr(instance, '_original', None)
+    if original is None:
+        return True
+    return any(original.get(field) != getattr(instance, field) for field in fields)
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_doctor_profile(sender, instance, created, **kwargs):
+def create_doctor_profile(sender, instance, created, update_fields=None, **kwargs):
     """Create a DoctorProfile when a new doctor user is created"""
     if created and instance.is_doctor:
         DoctorProfile.objects.create(user=instance)
+    elif instance.is_doctor and search_fields_changed(instance, ['full_name'], update_fields):
+        # The doctor's name is searchable
+        doctor_search_index.invalidate()
+
+
+@receiver(post_save, sender=DoctorProfile)
+def invalidate_doctor_search(sender, instance, created, update_fields=None, **kwargs):
+    """Rebuild the in-memory search index after a profile's searchable fields change"""
+    if created or search_fields_changed(instance, DoctorProfile.SEARCH_INDEXED_FIELDS, update_fields):
+        doctor_search_index.invalidate()
+
+
+@receiver(post_delete, sender=DoctorProfile)
+def remove_doctor_from_search(sender, **kwargs):
+    """Rebuild the in-memory search index after a profile is deleted"""
+    doctor_search_index.invalidate()
+
+
+@receiver(post_delete, sender=DoctorReview)
+def remove_review_from_rating(sender, instance, **kwargs):
+    """Take a deleted review out of the doctor's rating totals"""
+    original = getattr(instance, '_original', None) or {'doctor_id': instance.doctor_id, 'rating': instance.rating}
+    DoctorProfile.apply_review_delta(original['doctor_id'], -original['rating'], -1)
@@ -0,0 +1,85 @@
+"""
+In-memory doctor search index.
+
+On PostgreSQL, doctor search runs in the database against the trigram and GIN
+indexes. Other databases (SQLite in tests and local runs) cannot index these
+lookups, so this module keeps an equivalent index in process memory. It is
+rebuilt lazily after a doctor's name or searchable profile fields change
+(see the signal handlers in doctors.models). Each process has its own copy, so this is
+meant for single-process development and test runs.
+"""
+import threading
+from django.conf import settings
+from healthmateai.search import TrigramIndex
+
+# Fields matched by free-text search, as in DoctorSearchFilter
+SEARCH_FIELDS = ['user__full_name', 'location', 'bio']
+
+
+class DoctorSearchIndex:
+    """Trigram indexes over the searchable doctor fields plus a specialty index"""
+
+    def __init__(self):
+        self.fields = {}
+        self.specialties = {}
+        self.stale = True
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the index stale; it is rebuilt on the next lookup"""
+        self.stale = True
+
+    def build(self):
+        from .models import DoctorProfile
+
+        fields = {field: TrigramIndex() for field in SEARCH_FIELDS}
+        specialties = {}
+        rows = DoctorProfile.objects.values_list('id', 'specialties', *SEARCH_FIELDS)
+        for row in rows.iterator(chunk_size=2000):
+            doctor_id, doctor_specialties = row[0], row[1]
+            for field, text in zip(SEARCH_FIELDS, row[2:]):
+                if text:
+                    fields[field].add(doctor_id, text)
+            for specialty in doctor_specialties or []:
+                specialties.setdefault(specialty, set()).add(doctor_id)
+
+        self.fields = fields
+        self.specialties = specialties
+
+    def _ensure_built(self):
+        if self.stale:
+            with self.lock:
+                if self.stale:
+                    # Clear the flag first so changes made during the build mark it stale again
+                    self.stale = False
+                    self.build()
+
+    def search(self, query, limit=None):
+        """
+        Rank doctors against a free-text query.
+
+        Args:
+            query: The search text
+            limit: Optional cap on the number of results
+
+        Returns:
+            List of ``(doctor_id, score)`` pairs, best match first. The score
+            of a doctor is its best score across the search fields.
+        """
+        self._ensure_built()
+        threshold = settings.DOCTOR_SEARCH_MIN_SIMILARITY
+        scores = {}
+        for index in self.fields.values():
+            for doctor_id, score in index.search(query, threshold=threshold):
+                if score > scores.get(doctor_id, 0):
+                    scores[doctor_id] = score
+        results = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return results[:limit] if limit else results
+
+    def with_specialty(self, specialty):
+        """Return the IDs of doctors listing exactly ``specialty``"""
+        self._ensure_built()
+        return self.specialties.get(specialty, set())
+
+
+doctor_search_index = DoctorSearchIndex()
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from healthmateai.serializers import SparseFieldsetsMixin
 from .models import DoctorProfile, DoctorReview
 from users.serializers import UserProfileSerializer
 
-class DoctorReviewSerializer(serializers.ModelSerializer):
+class DoctorReviewSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for doctor reviews"""
     patient_name = serializers.CharField(source='patient.full_name', read_only=True)
     
@@ -12,21 +13,31 @@ class DoctorReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'doctor', 'patient', 'patient_name', 'created_at']
 
 
-class DoctorProfileSerializer(serializers.ModelSerializer):
-    """Serializer for doctor profiles"""
+class DoctorProfileSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Serializer for doctor profiles; expects the newest reviews prefetched
+    into ``recent_reviews`` by DoctorProfileViewSet
+    """
     user = UserProfileSerializer(read_only=True)
-    reviews = DoctorReviewSerializer(many=True, read_only=True)
-    review_count = serializers.SerializerMethodField()
+    reviews = DoctorReviewSerializer(source='recent_reviews', many=True, read_only=True)
     
     class Meta:
         model = DoctorProfile
         fields = ['id', 'user', 'specialties', 'bio', 'education', 'experience_years', 
                   'rating', 'location', 'available_times', 'profile_picture', 
                   'reviews', 'review_count']
-        read_only_fields = ['id', 'user', 'rating', 'reviews']
-        
-    def get_review_count(self, obj):
-        return obj.reviews.count()
+        read_only_fields = ['id', 'user', 'rating', 'reviews', 'review_count']
+
+
+class DoctorProfileListSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """Compact serializer for the doctor directory; reviews are listed separately"""
+    full_name = serializers.CharField(source='user.full_name', read_only=True)
+    
+    class Meta:
+        model = DoctorProfile
+        fields = ['id', 'full_name', 'specialties', 'experience_years', 'location',
+                  'rating', 'review_count', 'profile_picture']
+        read_only_fields = fields
 
 
 class DoctorProfileUpdateSerializer(serializers.ModelSerializer):
@@ -35,4 +46,13 @@ class DoctorProfileUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorProfile
         fields = ['specialties', 'bio', 'education', 'experience_years', 
-                  'location', 'available_times', 'profile_picture'] 
\ No newline at end of file
+                  'location', 'available_times', 'profile_picture']
+    
+    def validate_available_times(self, value):
+        from appointments.availability import parse_working_hours
+        
+        try:
+            parse_working_hours(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
\ No newline at end of file
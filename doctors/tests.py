@@ -1,3 +1,264 @@
-from django.test import TestCase
+import io
+from unittest import mock
+from django.contrib.auth.signals import user_logged_in
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from users.models import CustomUser
+from .models import DoctorProfile, DoctorReview
+from .search import doctor_search_index
 
-# Create your tests here.
+
+class DoctorRatingTests(TestCase):
+    """Review writes keep the doctor's rating totals in step with the reviews table"""
+
+    def setUp(self):
+        self.doctor = self.create_doctor('doctor')
+        self.other_doctor = self.create_doctor('other-doctor')
+        self.patients = [
+            CustomUser.objects.create_user(email=f'patient{i}@example.com', username=f'patient{i}',
+                                           password='testpass123')
+            for i in range(3)
+        ]
+
+    def create_doctor(self, username):
+        user = CustomUser.objects.create_user(
+            email=f'{username}@example.com', username=username, password='testpass123', is_doctor=True
+        )
+        return user.doctor_profile
+
+    def review(self, patient, rating, doctor=None):
+        return DoctorReview.objects.create(doctor=doctor or self.doctor, patient=patient, rating=rating)
+
+    def assertTotals(self, doctor, rating_sum, review_count, rating):
+        doctor = DoctorProfile.objects.get(pk=doctor.pk)
+        self.assertEqual((doctor.rating_sum, doctor.review_count), (rating_sum, review_count))
+        self.assertAlmostEqual(doctor.rating, rating)
+
+    def test_create(self):
+        client = APIClient()
+        client.force_authenticate(self.patients[0])
+        response = client.post(f'/api/doctors/{self.doctor.id}/reviews/create/', {'rating': 4}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.review(self.patients[1], 5)
+        self.assertTotals(self.doctor, 9, 2, 4.5)
+
+    def test_edit_rating(self):
+        self.review(self.patients[0], 4)
+        review = self.review(self.patients[1], 2)
+        review.rating = 5
+        review.save()
+        self.assertTotals(self.doctor, 9, 2, 4.5)
+
+        review = DoctorReview.objects.get(pk=review.pk)
+        review.rating = 3
+        review.save()
+        review.comment = 'Unchanged rating'
+        review.save()
+        self.assertTotals(self.doctor, 7, 2, 3.5)
+
+    def test_move_to_another_doctor(self):
+        self.review(self.patients[0], 4)
+        review = self.review(self.patients[1], 2)
+        review.doctor = self.other_doctor
+        review.save()
+        self.assertTotals(self.doctor, 4, 1, 4.0)
+        self.assertTotals(self.other_doctor, 2, 1, 2.0)
+
+    def test_save_without_loading_rebuilds(self):
+        review = self.review(self.patients[0], 4)
+        DoctorReview(pk=review.pk, doctor=self.doctor, patient=self.patients[0], rating=1,
+                     created_at=review.created_at).save()
+        self.assertTotals(self.doctor, 1, 1, 1.0)
+
+    def test_delete(self):
+        first = self.review(self.patients[0], 4)
+        self.review(self.patients[1], 2)
+        first.delete()
+        self.assertTotals(self.doctor, 2, 1, 2.0)
+
+        # Edited in memory before the delete: the stored rating is taken out
+        second = DoctorReview.objects.get()
+        second.rating = 5
+        second.delete()
+        self.assertTotals(self.doctor, 0, 0, 0.0)
+
+    def test_bulk_delete(self):
+        for patient, rating in zip(self.patients, (5, 4, 3)):
+            self.review(patient, rating)
+        self.review(self.patients[0], 1, doctor=self.other_doctor)
+        DoctorReview.objects.filter(doctor=self.doctor, rating__gte=4).delete()
+        self.assertTotals(self.doctor, 3, 1, 3.0)
+        self.assertTotals(self.other_doctor, 1, 1, 1.0)
+
+    def test_rebuild_command(self):
+        self.review(self.patients[0], 4)
+        self.review(self.patients[1], 3)
+        self.review(self.patients[0], 2, doctor=self.other_doctor)
+        DoctorProfile.objects.update(rating_sum=100, review_count=1, rating=100)
+
+        out = io.StringIO()
+        call_command('rebuild_doctor_ratings', doctor=[self.doctor.id], stdout=out)
+        self.assertIn('Rebuilt ratings for 1 doctors', out.getvalue())
+        self.assertTotals(self.doctor, 7, 2, 3.5)
+        self.assertTotals(self.other_doctor, 100, 1, 100.0)
+
+        call_command('rebuild_doctor_ratings', stdout=out)
+        self.assertTotals(self.other_doctor, 2, 1, 2.0)
+
+        # Doctors without reviews go back to zero
+        DoctorReview.objects.filter(doctor=self.other_doctor).delete()
+        DoctorProfile.objects.filter(pk=self.other_doctor.pk).update(rating_sum=9, review_count=3, rating=3)
+        call_command('rebuild_doctor_ratings', stdout=out)
+        self.assertTotals(self.other_doctor, 0, 0, 0.0)
+
+
+@override_settings(DOCTOR_PROFILE_RECENT_REVIEWS=2)
+class DoctorDirectoryTests(TestCase):
+    """Compact directory entries, capped embedded reviews and ?fields= sparse fieldsets"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email='doctor@example.com', username='doctor', password='testpass123', is_doctor=True,
+            full_name='Dana Doctor'
+        )
+        self.doctor = user.doctor_profile
+        self.doctor.specialties = ['Cardiology']
+        self.doctor.bio = 'Heart specialist'
+        self.doctor.save()
+        self.patient = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.reviews = [
+            DoctorReview.objects.create(
+                doctor=self.doctor, rating=rating,
+                patient=CustomUser.objects.create_user(email=f'reviewer{rating}@example.com',
+                                                       username=f'reviewer{rating}', password='testpass123')
+            )
+            for rating in (3, 4, 5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def test_list_is_compact(self):
+        response = self.client.get('/api/doctors/')
+        self.assertEqual(response.status_code, 200)
+        entry = response.data[0]
+        self.assertEqual(set(entry), {'id', 'full_name', 'specialties', 'experience_years', 'location',
+                                      'rating', 'review_count', 'profile_picture'})
+        self.assertEqual(entry['full_name'], 'Dana Doctor')
+
+    def test_list_fields(self):
+        response = self.client.get('/api/doctors/', {'fields': 'id, rating,unknown'})
+        entry = response.data[0]
+        self.assertEqual(entry, {'id': self.doctor.id, 'rating': 4.0})
+
+    def test_detail_embeds_newest_reviews(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/doctors/{self.doctor.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([review['id'] for review in response.data['reviews']],
+                         [self.reviews[2].id, self.reviews[1].id])
+        self.assertEqual(response.data['review_count'], 3)
+        self.assertEqual(response.data['bio'], 'Heart specialist')
+
+        # Every review through the paginated endpoint
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/reviews/')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_detail_fields(self):
+        # Reviews left out are not even queried
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/doctors/{self.doctor.id}/', {'fields': 'id,user'})
+        self.assertEqual(set(response.data), {'id', 'user'})
+        # Nested serializers keep all their fields
+        self.assertEqual(response.data['user']['full_name'], 'Dana Doctor')
+        self.assertIn('email', response.data['user'])
+
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/', {'fields': 'reviews'})
+        self.assertEqual(set(response.data['reviews'][0]),
+                         {'id', 'doctor', 'patient', 'patient_name', 'rating', 'comment', 'created_at'})
+
+    def test_writes_ignore_fields(self):
+        response = self.client.post(f'/api/doctors/{self.doctor.id}/reviews/create/?fields=rating',
+                                    {'rating': 5, 'comment': 'Great'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['comment'], 'Great')
+        self.assertEqual(response.data['patient'], self.patient.id)
+
+
+class DoctorSearchTests(TestCase):
+    """Ranked ?search= and ?specialty= through the in-memory index, and when it is rebuilt"""
+
+    def setUp(self):
+        self.cardiologist = self.create_doctor('cardio', 'Alice Hart', ['Cardiology'], 'Boston', 'Heart rhythm care')
+        self.neurologist = self.create_doctor('neuro', 'Bob Stone', ['Neurology'], 'Denver', 'Migraine clinic')
+        self.other = self.create_doctor('derm', 'Carol Hartley', ['Dermatology', 'Cardiology'], 'Austin', '')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        ))
+
+    def create_doctor(self, username, full_name, specialties, location, bio):
+        user = CustomUser.objects.create_user(
+            email=f'{username}@example.com', username=username, password='testpass123', is_doctor=True,
+            full_name=full_name
+        )
+        profile = user.doctor_profile
+        profile.specialties = specialties
+        profile.location = location
+        profile.bio = bio
+        profile.save()
+        return profile
+
+    def search(self, **params):
+        response = self.client.get('/api/doctors/', params)
+        self.assertEqual(response.status_code, 200)
+        return [entry['id'] for entry in response.data]
+
+    def test_search_ranks_best_match_first(self):
+        self.assertEqual(self.search(search='Hart')[0], self.cardiologist.id)
+        self.assertEqual(set(self.search(search='Hart')), {self.cardiologist.id, self.other.id})
+        self.assertEqual(self.search(search='migraine'), [self.neurologist.id])
+        self.assertEqual(self.search(search='denvr'), [self.neurologist.id])
+        self.assertEqual(self.search(search='zzzz'), [])
+
+    def test_specialty(self):
+        self.assertEqual(set(self.search(specialty='Cardiology')), {self.cardiologist.id, self.other.id})
+        self.assertEqual(self.search(specialty='Neurology', search='stone'), [self.neurologist.id])
+        self.assertEqual(self.search(specialty='cardio'), [])
+
+    def test_changes_are_searchable(self):
+        self.assertEqual(self.search(search='Keller'), [])
+        user = CustomUser.objects.get(pk=self.neurologist.user_id)
+        user.full_name = 'Bob Keller'
+        user.save()
+        self.assertEqual(self.search(search='Keller'), [self.neurologist.id])
+
+        profile = DoctorProfile.objects.get(pk=self.neurologist.pk)
+        profile.specialties.append('Sleep Medicine')
+        profile.save()
+        self.assertEqual(self.search(specialty='Sleep Medicine'), [self.neurologist.id])
+
+        profile.delete()
+        self.assertEqual(self.search(search='Keller'), [])
+
+    def test_unrelated_saves_keep_index(self):
+        self.search(search='Hart')
+        user = CustomUser.objects.get(pk=self.cardiologist.user_id)
+        profile = DoctorProfile.objects.get(pk=self.cardiologist.pk)
+        with mock.patch.object(doctor_search_index, 'invalidate') as invalidate:
+            # Login stamps last_login with update_fields
+            user_logged_in.send(sender=CustomUser, request=None, user=user)
+            user.age = 50
+            user.save()
+            profile.experience_years = 12
+            profile.save()
+            profile.education = 'MD'
+            profile.save(update_fields=['education'])
+        invalidate.assert_not_called()
+
+        with mock.patch.object(doctor_search_index, 'invalidate') as invalidate:
+            profile.location = 'Chicago'
+            profile.save(update_fields=['location'])
+        invalidate.assert_called_once()
@@ -1,28 +1,53 @@
+from django.conf import settings
+from django.db.models import Prefetch
 from django.shortcuts import render, get_object_or_404
-from rest_framework import viewsets, permissions, generics, filters
+from rest_framework import viewsets, permissions, generics
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import DoctorProfile, DoctorReview
-from .serializers import DoctorProfileSerializer, DoctorReviewSerializer, DoctorProfileUpdateSerializer
+from .serializers import (
+    DoctorProfileSerializer,
+    DoctorProfileListSerializer,
+    DoctorReviewSerializer,
+    DoctorProfileUpdateSerializer
+)
+from healthmateai.pagination import HistoryCursorPagination
 from users.permissions import IsDoctor, IsPatient
-from .filters import DoctorProfileFilter
+from .filters import DoctorProfileFilter, DoctorSearchFilter
 
 # Create your views here.
 
 class DoctorProfileViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for listing and retrieving doctor profiles.
+    
+    The list uses a compact representation. A profile embeds only its newest
+    reviews; all of them are available from the paginated reviews endpoint.
     """
     serializer_class = DoctorProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, DoctorSearchFilter]
     filterset_class = DoctorProfileFilter
-    search_fields = ['user__full_name', 'bio']
     
     def get_queryset(self):
         # Skip queryset filtering during schema generation
         if getattr(self, 'swagger_fake_view', False):
             return DoctorProfile.objects.none()
-        return DoctorProfile.objects.all()
+        queryset = DoctorProfile.objects.select_related('user')
+        if self.action == 'retrieve' and self.reviews_requested():
+            recent = DoctorReview.objects.select_related('patient').order_by('-created_at', '-id')
+            queryset = queryset.prefetch_related(
+                Prefetch('reviews', queryset=recent[:settings.DOCTOR_PROFILE_RECENT_REVIEWS], to_attr='recent_reviews')
+            )
+        return queryset
+    
+    def reviews_requested(self):
+        fields = self.request.query_params.get('fields')
+        return not fields or 'reviews' in {name.strip() for name in fields.split(',')}
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return DoctorProfileListSerializer
+        return DoctorProfileSerializer
 
 
 class DoctorProfileUpdateView(generics.RetrieveUpdateAPIView):
@@ -59,14 +84,16 @@ class DoctorReviewCreateView(generics.CreateAPIView):
 
 class DoctorReviewListView(generics.ListAPIView):
     """
-    View for listing reviews for a specific doctor.
+    View for listing reviews for a specific doctor, newest first.
     """
     serializer_class = DoctorReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HistoryCursorPagination
+    ordering = ['-created_at']
     
     def get_queryset(self):
         # Skip queryset filtering during schema generation
         if getattr(self, 'swagger_fake_view', False):
             return DoctorReview.objects.none()
         doctor_id = self.kwargs.get('doctor_id')
-        return DoctorReview.objects.filter(doctor_id=doctor_id)
+        return DoctorReview.objects.filter(doctor_id=doctor_id).select_related('patient')
@@ -0,0 +1,351 @@
+"""
+Gateway for the chat-completion backends used by the AI features.
+
+The ``openai`` backend talks to the OpenAI API. The ``stub`` backend answers
+locally with canned content so flows can be exercised and load-tested without
+network access. The backend is selected with the ``LLM_BACKEND`` setting.
+
+Every call goes through the same guards:
+
+* one long-lived, pooled client per process (and per event loop for async)
+* a per-call timeout
+* bounded retries with jittered exponential backoff for transient errors
+* a circuit breaker that fails fast while the upstream is degraded
+* a cap on concurrent calls: ``LLM_MAX_CONCURRENCY`` bounds each pool of
+  calls separately, one pool for sync calls and one per event loop, so a
+  process serving both (e.g. ASGI views and sync Celery tasks) can have up to
+  twice as many calls in flight
+
+Refused calls raise ``LLMUnavailable``; callers already fall back to their
+canned responses on any exception.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+import httpx
+import openai
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: the request may succeed if sent again
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMUnavailable(Exception):
+    """Raised when the gateway refuses a call without contacting the upstream"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failed calls in a row the circuit opens and
+    calls are refused for ``reset_timeout`` seconds. Then a single trial call
+    is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """
+        Decide whether a call may go through.
+
+        Returns:
+            Tuple of (allowed, trial), where trial is True when this call took
+            the half-open trial and must end with an outcome or release_trial()
+        """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True, False
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True, True
+            return False, False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Let another trial through after a trial call that ended without an outcome"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(
+    failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+)
+
+_client = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(settings.LLM_MAX_CONCURRENCY)
+
+# Async clients and semaphores are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+_async_slots = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Return the process-wide OpenAI client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = openai.OpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=settings.LLM_TIMEOUT,
+                    max_retries=0,  # Retries are handled here so the breaker sees them
+                    http_client=httpx.Client(limits=_connection_limits()),
+                )
+    return _client
+
+
+def get_async_client():
+    """Return the AsyncOpenAI client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.LLM_TIMEOUT,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=_connection_limits()),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _connection_limits():
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+    )
+
+
+def _async_slots_for_loop():
+    loop = asyncio.get_running_loop()
+    slots = _async_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        _async_slots[loop] = slots
+    return slots
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff delay for a retry attempt (0-based)"""
+    ceiling = min(settings.LLM_RETRY_BACKOFF_MAX, settings.LLM_RETRY_BACKOFF * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _request_options(model, messages, temperature, max_tokens, timeout):
+    options = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'timeout': timeout or settings.LLM_TIMEOUT,
+    }
+    if max_tokens is not None:
+        options['max_tokens'] = max_tokens
+    return options
+
+
+def _call_with_retries(call):
+    """Run ``call`` under the circuit breaker, retrying transient errors"""
+    allowed, trial = breaker.allow()
+    if not allowed:
+        raise LLMUnavailable("LLM circuit is open")
+
+    try:
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                result = call()
+            except RETRYABLE_ERRORS as e:
+                if attempt == settings.LLM_MAX_RETRIES:
+                    breaker.record_failure()
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"LLM call failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        # Other errors (e.g. a bad request) say nothing about the upstream's health, and
+        # interrupted calls (e.g. a worker shutting down) must not keep the trial forever
+        if trial:
+            breaker.release_trial()
+
+
+async def _acall_with_retries(call):
+    """Async version of _call_with_retries; ``call`` returns an awaitable"""
+    allowed, trial = breaker.allow()
+    if not allowed:
+        raise LLMUnavailable("LLM circuit is open")
+
+    try:
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                result = await call()
+            except RETRYABLE_ERRORS as e:
+                if attempt == settings.LLM_MAX_RETRIES:
+                    breaker.record_failure()
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"LLM call failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        # Also reached by non-retryable errors and by CancelledError (e.g. the client disconnected)
+        if trial:
+            breaker.release_trial()
+
+
+class _slot:
+    """
+    Hold one of the worker's concurrent LLM call slots.
+
+    Sync calls share one pool of LLM_MAX_CONCURRENCY slots and each event loop
+    has its own, since an asyncio semaphore cannot be shared across loops or
+    with threads.
+    """
+
+    def __enter__(self):
+        if not _slots.acquire(timeout=settings.LLM_QUEUE_TIMEOUT):
+            raise LLMUnavailable("Too many concurrent LLM calls")
+
+    def __exit__(self, *exc_info):
+        _slots.release()
+
+    async def __aenter__(self):
+        self.slots = _async_slots_for_loop()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), settings.LLM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("Too many concurrent LLM calls")
+
+    async def __aexit__(self, *exc_info):
+        self.slots.release()
+
+
+def chat_completion(messages, model, temperature, max_tokens=None, stub_content=None, timeout=None):
+    """
+    Run a chat completion and return the assistant message content.
+
+    Args:
+        messages: List of chat messages in OpenAI format
+        model: Model name to use
+        temperature: Sampling temperature
+        max_tokens: Optional cap on generated tokens
+        stub_content: Content returned by the stub backend
+        timeout: Seconds to wait for the response (defaults to LLM_TIMEOUT)
+
+    Returns:
+        The response text
+
+    Raises:
+        LLMUnavailable: If the circuit is open or the worker is saturated
+    """
+    with _slot():
+        if settings.LLM_BACKEND == 'stub':
+            return _stub_completion(messages, stub_content)
+
+        options = _request_options(model, messages, temperature, max_tokens, timeout)
+        response = _call_with_retries(lambda: get_client().chat.completions.create(**options))
+        return response.choices[0].message.content
+
+
+async def achat_completion(messages, model, temperature, max_tokens=None, stub_content=None, timeout=None):
+    """
+    Async version of chat_completion built on ``openai.AsyncOpenAI``.
+
+    Awaiting the response does not hold a thread, so one ASGI worker can keep
+    many LLM calls in flight.
+    """
+    async with _slot():
+        if settings.LLM_BACKEND == 'stub':
+            if settings.LLM_STUB_LATENCY:
+                await asyncio.sleep(settings.LLM_STUB_LATENCY)
+            return _stub_content(messages, stub_content)
+
+        options = _request_options(model, messages, temperature, max_tokens, timeout)
+        response = await _acall_with_retries(lambda: get_async_client().chat.completions.create(**options))
+        return response.choices[0].message.content
+
+
+async def astream_chat_completion(messages, model, temperature, max_tokens=None, stub_content=None, timeout=None):
+    """
+    Run a streaming chat completion, yielding content deltas as they arrive.
+
+    Takes the same arguments as ``chat_completion``. This is an async
+    generator because Django's ASGI handler buffers synchronous iterators in
+    full before sending them. Retries only cover opening the stream.
+    """
+    async with _slot():
+        if settings.LLM_BACKEND == 'stub':
+            content = _stub_content(messages, stub_content)
+            words = content.split(' ')
+            for index, word in enumerate(words):
+                if settings.LLM_STUB_LATENCY:
+                    await asyncio.sleep(settings.LLM_STUB_LATENCY / len(words))
+                yield word if index == 0 else ' ' + word
+            return
+
+        options = _request_options(model, messages, temperature, max_tokens, timeout)
+        stream = await _acall_with_retries(lambda: get_async_client().chat.completions.create(stream=True, **options))
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+def _stub_completion(messages, stub_content=None):
+    """Return canned content after the configured simulated latency"""
+    if settings.LLM_STUB_LATENCY:
+        time.sleep(settings.LLM_STUB_LATENCY)
+    return _stub_content(messages, stub_content)
+
+
+def _stub_content(messages, stub_content=None):
+    if stub_content is not None:
+        return stub_content
+    return f"Stub response to: {messages[-1]['content']}"
@@ -0,0 +1,122 @@
+"""
+Pagination for history endpoints.
+
+Offset pagination gets slower the deeper a client pages and skips or repeats
+rows when new ones arrive. Cursor pagination seeks from the last row seen, so
+every page costs the same. Each paginated list is backed by a composite index
+on (owner, ordering column).
+"""
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.settings import api_settings
+
+
+class HistoryCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the view's ``ordering`` attribute.
+
+    Views with an OrderingFilter can still reorder with ``?ordering=``; the
+    cursor then follows that ordering. Views with a ranked search set
+    ``search_ordering``, used for ``?search=`` requests without ``?ordering=``.
+
+    Pages are ordered by the first field of the ordering, then by primary key
+    in the same direction. Both are part of the cursor position, so rows
+    sharing a value of the ordering field (e.g. diagnoses on the same date)
+    are paged in both directions without gaps or repeats. DRF's own cursor
+    seeks on the first field only.
+    """
+    page_size = settings.HISTORY_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.HISTORY_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        # The cursor seeks on the first field, so later fields are replaced by the tiebreaker
+        first = self.get_base_ordering(request, queryset, view)[0]
+        if first.lstrip('-') in ('id', 'pk'):
+            return (first,)
+        return (first, '-id' if first.startswith('-') else 'id')
+
+    def get_base_ordering(self, request, queryset, view):
+        search_ordering = getattr(view, 'search_ordering', None)
+        if (search_ordering and request.query_params.get(api_settings.SEARCH_PARAM)
+                and not request.query_params.get(api_settings.ORDERING_PARAM)):
+            return tuple(search_ordering)
+
+        has_ordering_filter = any(
+            hasattr(backend, 'get_ordering') for backend in getattr(view, 'filter_backends', [])
+        )
+        ordering = getattr(view, 'ordering', None)
+        if not has_ordering_filter and ordering:
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return tuple(super().get_ordering(request, queryset, view))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset, seeking on (first ordering field, id)
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            value, _, pk = current_position.rpartition('|')
+            order = self.ordering[0]
+            # Test for: (cursor reversed) XOR (queryset reversed)
+            lookup = 'lt' if self.cursor.reverse != order.startswith('-') else 'gt'
+            # The tiebreaker follows the first field's direction
+            order_attr = order.lstrip('-')
+            try:
+                queryset = queryset.filter(
+                    Q(**{f'{order_attr}__{lookup}': value}) | Q(**{order_attr: value, f'pk__{lookup}': int(pk)})
+                )
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        pk = instance['id'] if isinstance(instance, dict) else instance.pk
+        return f'{super()._get_position_from_instance(instance, ordering)}|{pk}'
@@ -0,0 +1,47 @@
+"""
+Helpers for PostgreSQL-only database features.
+
+Production runs on PostgreSQL; test and local runs may use SQLite. Indexes and
+constraints that only PostgreSQL supports are declared on the models as usual
+and added in migrations with the operations below. The migration state then
+matches the models on every backend, but the schema change is only applied
+on PostgreSQL.
+"""
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.db import connections
+from django.db.migrations.operations import AddConstraint, AddIndex
+from django.db.models import Func
+
+
+def is_postgres(using='default'):
+    """Return True if the database alias ``using`` is PostgreSQL"""
+    return connections[using].vendor == 'postgresql'
+
+
+class TsTzRange(Func):
+    """Build a ``tstzrange`` from two datetime expressions, for exclusion constraints"""
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+
+class PostgresOnlyOperation:
+    """Mixin for migration operations that are no-ops on other databases"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f"{super().describe()} (PostgreSQL only)"
+
+
+class AddPostgresIndex(PostgresOnlyOperation, AddIndex):
+    """AddIndex that only touches the schema on PostgreSQL"""
+
+
+class AddPostgresConstraint(PostgresOnlyOperation, AddConstraint):
+    """AddConstraint that only touches the schema on PostgreSQL"""
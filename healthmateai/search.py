@@ -0,0 +1,112 @@
+"""
+Trigram matching helpers for in-process search indexes.
+
+These follow PostgreSQL's pg_trgm closely enough for the in-memory fallback
+indexes to rank results the way the database does: text is lowercased, split
+into alphanumeric words, and each word is padded with two spaces in front and
+one behind before taking its three-character substrings.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Lowercase ``text`` and collapse everything but letters and digits to single spaces"""
+    return _NON_WORD.sub(' ', (text or '').lower()).strip()
+
+
+def trigrams(text):
+    """Return the set of pg_trgm-style trigrams of ``text``"""
+    result = set()
+    for word in normalize(text).split():
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    """Trigram similarity of two strings, as pg_trgm's ``similarity()``"""
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def word_similarity(query, text):
+    """
+    Share of the query's trigrams found in ``text``.
+
+    An upper bound of pg_trgm's ``word_similarity()``, which also requires
+    the matching trigrams to be contiguous in ``text``.
+    """
+    query = trigrams(query)
+    if not query:
+        return 0.0
+    return len(query & trigrams(text)) / len(query)
+
+
+class TrigramIndex:
+    """
+    Inverted index from trigrams to keys, scored by word similarity.
+
+    Lookups only visit the postings of the query's trigrams, so their cost
+    depends on how common those trigrams are rather than on the index size.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, text):
+        """Index ``text`` under ``key``, replacing anything indexed for it before"""
+        grams = trigrams(text)
+        with self.lock:
+            self._discard(key)
+            self.keys[key] = grams
+            for gram in grams:
+                self.postings[gram].add(key)
+
+    def remove(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        for gram in self.keys.pop(key, ()):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+
+    def search(self, query, threshold=0.0, limit=None):
+        """
+        Return ``(key, score)`` pairs whose word similarity to ``query`` is at least ``threshold``.
+
+        Results are sorted by descending score.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+
+        # A key scoring at least ``threshold`` shares ``needed`` of the query's
+        # trigrams, so it must appear in one of the len(grams) - needed + 1 rarest
+        # postings. Only those are scanned; common trigrams just confirm matches.
+        needed = max(1, math.ceil(threshold * len(grams) - 1e-9))
+        with self.lock:
+            postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+            candidates = set().union(*postings[:len(grams) - needed + 1])
+            results = []
+            for key in candidates:
+                score = len(grams & self.keys[key]) / len(grams)
+                if score >= threshold:
+                    results.append((key, score))
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:limit] if limit else results
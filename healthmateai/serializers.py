@@ -0,0 +1,40 @@
+"""
+Serializer helpers shared by the API apps.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsetsMixin:
+    """
+    Let clients pick the fields of a response with ``?fields=id,name,...``.
+
+    Only the top-level serializer of a read request is trimmed; nested
+    serializers and writes are unaffected. Unknown names are ignored. Fields
+    that are left out are never computed, so method fields and nested
+    serializers cost nothing when they are not requested.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self._requested_fields()
+        if requested is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in requested}
+
+    def _requested_fields(self):
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+
+        # The top-level serializer, or the child of a top-level list
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return None
+
+        value = request.query_params.get('fields')
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'whitenoise.runserver_nostatic',  # Add whitenoise
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third-party apps
     'rest_framework',
@@ -104,7 +105,9 @@ WSGI_APPLICATION = 'healthmateai.wsgi.application'
 DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.config(conn_max_age=600, ssl_require=True)
+        # Persistent connections are not reused across requests under ASGI, so keep
+        # them off unless serving through WSGI (set DB_CONN_MAX_AGE=600 there)
+        'default': dj_database_url.config(conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '0')), ssl_require=True)
     }
 else:
     # Local database configuration
@@ -120,6 +123,23 @@ else:
     }
 
 
+# Password hashing: 'argon2' (tuned Argon2id, needs argon2-cffi) or 'pbkdf2' (Django's default).
+# The other hashers stay listed so existing hashes verify and are upgraded on login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+PASSWORD_HASHERS = [
+    'users.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if PASSWORD_HASHER == 'pbkdf2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))  # Passes over memory
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19456))  # KiB (19 MiB)
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1))  # Lanes; the pool parallelizes across logins
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))  # Login hashing threads; 0 hashes in the request thread
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -163,6 +183,13 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Store media on S3 when a bucket is configured (credentials come from the standard AWS variables)
+AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME', '')
+if AWS_STORAGE_BUCKET_NAME:
+    DEFAULT_FILE_STORAGE = 'storages.backends.s3.S3Storage'
+    AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME')
+    AWS_S3_FILE_OVERWRITE = False  # Never replace an existing record file
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -174,7 +201,7 @@ AUTH_USER_MODEL = 'users.CustomUser'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -184,12 +211,34 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cursor pagination for history endpoints
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))
+HISTORY_MAX_PAGE_SIZE = 100  # Largest ?page_size= a client may request
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
 }
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 300))  # Seconds a user row is cached for JWT authentication
+
+# Caches: Redis when REDIS_URL is set (shared with Celery), in-process memory otherwise
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
@@ -197,6 +246,62 @@ CORS_ALLOW_ALL_ORIGINS = True
 # OpenAI API Key
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 
+# LLM backend: 'openai' for the real API, 'stub' for canned local responses (load testing)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'openai')
+LLM_STUB_LATENCY = float(os.environ.get('LLM_STUB_LATENCY', '0'))  # Simulated seconds per stub call
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '30'))  # Seconds per OpenAI request
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))  # Retries for timeouts, rate limits and 5xx
+LLM_RETRY_BACKOFF = 0.5  # Base backoff in seconds, doubled per retry with full jitter
+LLM_RETRY_BACKOFF_MAX = 8
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD', '5'))  # Consecutive failures that open the circuit
+LLM_CIRCUIT_RESET_TIMEOUT = int(os.environ.get('LLM_CIRCUIT_RESET_TIMEOUT', '30'))  # Seconds before a trial call is let through
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '16'))  # Concurrent LLM calls per worker process, for sync calls and per event loop
+LLM_QUEUE_TIMEOUT = 5  # Seconds to wait for a free slot before failing fast
+LLM_MAX_CONNECTIONS = 20  # Pooled HTTP connections to OpenAI per client
+
+# Appointment availability
+APPOINTMENT_SLOT_MINUTES = 30  # Default slot length for the availability endpoint
+APPOINTMENT_AVAILABILITY_MAX_DAYS = 31  # Longest range the availability endpoint searches
+
+# Appointment reminders
+APPOINTMENT_REMINDER_WINDOW_HOURS = 24  # Remind this many hours ahead
+APPOINTMENT_REMINDER_CHUNK_SIZE = 500  # Appointments per reminder subtask and SMTP session
+
+# Doctor search
+DOCTOR_SEARCH_MIN_SIMILARITY = 0.6  # Matches pg_trgm.word_similarity_threshold, used by the in-memory index
+DOCTOR_SEARCH_MAX_RESULTS = 1000  # Cap on in-memory index matches per query
+
+# Doctor profiles
+DOCTOR_PROFILE_RECENT_REVIEWS = 5  # Newest reviews embedded in a doctor's profile; the rest are paginated
+
+# AI chat context window (token counts are estimated at 4 characters per token)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.environ.get('CHAT_CONTEXT_TOKEN_BUDGET', 1500))  # Summary plus recent turns
+CHAT_CONTEXT_MAX_TURNS = 20  # Most recent turns considered for the window
+CHAT_CONTEXT_RECENT_TURNS = 6  # Turns always kept verbatim instead of summarized
+CHAT_SUMMARY_MIN_TURNS = 4  # Older turns that must pile up before the summary is refreshed
+CHAT_SUMMARY_INPUT_BUDGET = 2000  # Tokens of old turns folded into the summary per call
+CHAT_SUMMARY_MAX_TOKENS = 300  # Length cap of the rolling summary
+
+# Symptom check analysis
+SYMPTOM_CHECK_ASYNC = os.environ.get('SYMPTOM_CHECK_ASYNC', 'True') == 'True'  # Analyze in Celery and return 202
+SYMPTOM_CHECK_MAX_WAIT = 25  # Longest long-poll on the status endpoint, in seconds
+SYMPTOM_CHECK_POLL_INTERVAL = 0.5
+SYMPTOM_BATCH_MAX_SIZE = int(os.environ.get('SYMPTOM_BATCH_MAX_SIZE', 1000))  # Checks per batch upload
+SYMPTOM_BATCH_CHUNK_SIZE = 50  # Checks per Celery chunk task
+SYMPTOM_BATCH_CONCURRENCY = int(os.environ.get('SYMPTOM_BATCH_CONCURRENCY', 8))  # Analysis threads per chunk task
+SYMPTOM_ANALYSIS_CACHE_ENABLED = os.environ.get('SYMPTOM_ANALYSIS_CACHE_ENABLED', 'True') == 'True'
+SYMPTOM_ANALYSIS_CACHE_TIMEOUT = int(os.environ.get('SYMPTOM_ANALYSIS_CACHE_TIMEOUT', 60 * 60 * 24))  # Seconds
+SYMPTOM_ANALYSIS_CACHE_MAX_ENTRIES = 5000  # In-process fallback only; size Redis with maxmemory
+SYMPTOM_CATALOG_VERSION_CHECK = float(os.environ.get('SYMPTOM_CATALOG_VERSION_CHECK', 1))  # Seconds between checks of the shared catalog version
+SYMPTOM_TYPEAHEAD_LIMIT = 10  # Default suggestions per autocomplete request
+SYMPTOM_TYPEAHEAD_MAX_LIMIT = 50  # Largest ?limit= a client may request
+SYMPTOM_TYPEAHEAD_MIN_SIMILARITY = 0.5  # Lowest trigram similarity of a fuzzy suggestion
+SYMPTOM_RANKER_CANDIDATES = 5  # Catalog candidates added to the prompt and used as the fallback
+SYMPTOM_LOCAL_ANALYSIS = os.environ.get('SYMPTOM_LOCAL_ANALYSIS', 'False') == 'True'  # Answer low-risk checks without the LLM
+SYMPTOM_LOCAL_ANALYSIS_MAX_SEVERITY = 3  # Highest user severity and severity_scale answered locally
+SYMPTOM_LOCAL_ANALYSIS_MIN_MATCH = 60  # Lowest match percentage of the top candidate answered locally
+SYMPTOM_TRIAGE_TTL = int(os.environ.get('SYMPTOM_TRIAGE_TTL', 300))  # Seconds before a process recompiles its triage rules
+
 # Celery settings
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'))
@@ -215,8 +320,32 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'appointments.tasks.update_completed_appointments',
         'schedule': 3600.0 * 6,  # Run every 6 hours
     },
+    'abort-stale-record-uploads': {
+        'task': 'medical_records.tasks.abort_stale_record_uploads',
+        'schedule': 3600.0,  # Run hourly
+    },
 }
 
+# Chunked medical record uploads
+RECORD_UPLOAD_BACKEND = os.environ.get('RECORD_UPLOAD_BACKEND', 's3' if AWS_STORAGE_BUCKET_NAME else 'local')  # 'local' or 's3'
+RECORD_UPLOAD_CHUNK_SIZE = int(os.environ.get('RECORD_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # S3 requires at least 5 MiB
+RECORD_UPLOAD_MAX_SIZE = int(os.environ.get('RECORD_UPLOAD_MAX_SIZE', 5 * 1024 ** 3))  # Largest file accepted
+RECORD_UPLOAD_SPOOL_SIZE = 1024 * 1024  # Chunk bytes kept in memory before spooling to disk (S3 backend)
+RECORD_UPLOAD_TEMP_DIR = os.environ.get('RECORD_UPLOAD_TEMP_DIR', os.path.join(BASE_DIR, 'uploads'))  # Staging files (local backend)
+RECORD_UPLOAD_EXPIRY_HOURS = 24  # Unfinished uploads idle this long are aborted
+
+# Full-text search over extracted record text (PostgreSQL)
+RECORD_SEARCH_CONFIG = os.environ.get('RECORD_SEARCH_CONFIG', 'english')  # Text search configuration
+RECORD_SEARCH_INDEX_CHARS = 500000  # Characters of each record indexed; tsvector values are capped at 1 MB
+
+# Medical record downloads: 'x-accel' (nginx), 'x-sendfile' (Apache), 'presigned' (S3) or 'django'.
+# 'django' streams files through the application and is only the default with DEBUG.
+RECORD_DOWNLOAD_MODE = os.environ.get(
+    'RECORD_DOWNLOAD_MODE', 'presigned' if AWS_STORAGE_BUCKET_NAME else 'django' if DEBUG else 'x-accel'
+)
+RECORD_DOWNLOAD_ACCEL_PREFIX = os.environ.get('RECORD_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')  # Internal nginx location aliasing MEDIA_ROOT
+RECORD_DOWNLOAD_URL_EXPIRY = 300  # Lifetime of presigned download URLs in seconds
+
 # Security settings
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+import httpx
+import openai
+from django.test import SimpleTestCase, override_settings
+from . import llm
+from .llm import CircuitBreaker, LLMUnavailable
+from .search import TrigramIndex, similarity, trigrams, word_similarity
+
+
+def timeout_error():
+    return openai.APITimeoutError(request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """The LLM gateway's breaker opens, lets one trial through, and recovers"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        patcher = mock.patch.object(llm, 'breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expire(self):
+        """Move past the reset timeout"""
+        self.breaker.opened_at = time.monotonic() - 31
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertEqual(self.breaker.allow(), (False, False))
+
+    def test_half_open_allows_one_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.expire()
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertEqual(self.breaker.allow(), (True, True))
+        self.assertEqual(self.breaker.allow(), (False, False))
+
+        # A failed trial re-opens the circuit
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+
+        # A successful one closes it
+        self.expire()
+        self.assertEqual(self.breaker.allow(), (True, True))
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.breaker.allow(), (True, False))
+        self.assertEqual(self.breaker.allow(), (True, False))
+
+    @override_settings(LLM_MAX_RETRIES=1)
+    def test_retries_then_opens(self):
+        call = mock.Mock(side_effect=timeout_error())
+        with mock.patch.object(llm, '_backoff', return_value=0):
+            for _ in range(2):
+                with self.assertRaises(openai.APITimeoutError):
+                    llm._call_with_retries(call)
+        self.assertEqual(call.call_count, 4)
+        with self.assertRaises(LLMUnavailable):
+            llm._call_with_retries(call)
+        self.assertEqual(call.call_count, 4)
+
+        self.expire()
+        self.assertEqual(llm._call_with_retries(mock.Mock(return_value='ok')), 'ok')
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_cancelled_trial_is_released(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.expire()
+
+        async def disconnected():
+            raise asyncio.CancelledError
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(llm._acall_with_retries(disconnected))
+        self.assertEqual(self.breaker.state, 'half-open')
+
+        async def answered():
+            return 'ok'
+
+        self.assertEqual(asyncio.run(llm._acall_with_retries(answered)), 'ok')
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_cancelled_backoff_releases_the_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.expire()
+
+        async def call_and_cancel():
+            task = asyncio.ensure_future(llm._acall_with_retries(mock.AsyncMock(side_effect=timeout_error())))
+            await asyncio.sleep(0.01)  # Into the backoff sleep
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(llm, '_backoff', return_value=10):
+            asyncio.run(call_and_cancel())
+        self.assertEqual(self.breaker.allow(), (True, True))
+
+    def test_bad_request_does_not_close_the_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.expire()
+
+        with self.assertRaises(ValueError):
+            llm._call_with_retries(mock.Mock(side_effect=ValueError('bad request')))
+        # The trial is released for another call, but the circuit is not closed
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertEqual(self.breaker.failures, 2)
+        self.assertEqual(self.breaker.allow(), (True, True))
+
+    def test_closed_call_does_not_release_the_trial(self):
+        started = threading.Event()
+        finish = threading.Event()
+
+        def bad_request():
+            started.set()
+            finish.wait(5)
+            raise ValueError('bad request')
+
+        def call():
+            with self.assertRaises(ValueError):
+                llm._call_with_retries(bad_request)
+
+        # A call starts while the circuit is closed, then the circuit opens and a trial starts
+        thread = threading.Thread(target=call)
+        thread.start()
+        started.wait(5)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.expire()
+        self.assertEqual(self.breaker.allow(), (True, True))
+
+        finish.set()
+        thread.join()
+        # The earlier call ending does not let a second trial through
+        self.assertEqual(self.breaker.allow(), (False, False))
+
+
+class TrigramIndexTests(SimpleTestCase):
+    """pg_trgm-style trigrams and the inverted index built on them"""
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('Cat'), {'  c', ' ca', 'cat', 'at '})
+        self.assertEqual(trigrams('a-b'), {'  a', ' a ', '  b', ' b '})
+        self.assertEqual(trigrams(None), set())
+        self.assertEqual(similarity('word', 'word'), 1.0)
+        self.assertEqual(similarity('', 'word'), 0.0)
+        self.assertEqual(word_similarity('heart', 'Alice Heart Care'), 1.0)
+        self.assertLess(word_similarity('hart', 'Alice Heart'), 1.0)
+
+    def test_search(self):
+        index = TrigramIndex()
+        index.add(1, 'Alice Hart')
+        index.add(2, 'Carol Hartley')
+        index.add(3, 'Bob Stone')
+        self.assertEqual(len(index), 3)
+
+        results = index.search('hart', threshold=0.5)
+        self.assertEqual([key for key, _ in results], [1, 2])
+        self.assertEqual(results[0][1], 1.0)
+        self.assertEqual(index.search('hart', threshold=0.5, limit=1), [(1, 1.0)])
+        self.assertEqual(index.search('stoen', threshold=0.3)[0][0], 3)
+        self.assertEqual(index.search('stoen', threshold=0.9), [])
+        self.assertEqual(index.search('!!'), [])
+
+    def test_search_matches_brute_force(self):
+        index = TrigramIndex()
+        texts = {i: f'{word} clinic {i}' for i, word in enumerate(['cardiology', 'cardio', 'neurology', 'card'])}
+        for key, text in texts.items():
+            index.add(key, text)
+        for query in ['cardiology', 'neuro', 'cardi']:
+            for threshold in (0.1, 0.5, 0.8):
+                expected = {key for key, text in texts.items() if word_similarity(query, text) >= threshold}
+                self.assertEqual({key for key, _ in index.search(query, threshold=threshold)}, expected)
+
+    def test_replace_and_remove(self):
+        index = TrigramIndex()
+        index.add('a', 'Boston')
+        index.add('a', 'Denver')
+        self.assertEqual(index.search('boston', threshold=0.5), [])
+        self.assertEqual(index.search('denver'), [('a', 1.0)])
+        index.remove('a')
+        index.remove('missing')
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.postings, {})
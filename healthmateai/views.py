@@ -0,0 +1,40 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines.
+    
+    Authentication, permission and throttling checks run through
+    sync_to_async, then the handler runs on the event loop so awaiting an LLM
+    call does not hold a worker thread. Under WSGI, Django runs the view
+    through async_to_sync, so the same view works in both deployments.
+    """
+    
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            
+            response = handler(request, *args, **kwargs)
+            # OPTIONS and method-not-allowed handlers are synchronous
+            if asyncio.iscoroutine(response):
+                response = await response
+        
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
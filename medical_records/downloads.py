@@ -0,0 +1,215 @@
+"""
+Authorized downloads of medical record files.
+
+Access is checked by the view; this module only serves the bytes, in one of
+the modes selected by the ``RECORD_DOWNLOAD_MODE`` setting:
+
+* ``x-accel``: an ``X-Accel-Redirect`` to an internal nginx location
+  (``RECORD_DOWNLOAD_ACCEL_PREFIX``), which serves the file and its ranges.
+  The default in production without S3.
+* ``x-sendfile``: an ``X-Sendfile`` header with the file path, for Apache
+  with mod_xsendfile or lighttpd.
+* ``presigned``: a redirect to a short-lived presigned storage URL (S3),
+  which handles ranges and ETags itself.
+* ``django``: the file is streamed by the application, the default with
+  ``DEBUG``. Single byte ranges and conditional requests are handled here.
+  Under a WSGI server with a sendfile-capable ``wsgi.file_wrapper`` the range
+  is sent with ``os.sendfile``. Under ASGI (the uvicorn workers of the
+  Procfile) it is read in blocks in a worker thread and every byte passes
+  through Python, so this mode is meant for development.
+
+Example nginx location for ``x-accel``::
+
+    location /protected-media/ {
+        internal;
+        alias /app/media/;
+    }
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Bytes read per iteration when the server has no sendfile support
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class FileRange:
+    """
+    Read-only view of ``length`` bytes of a file starting at ``start``.
+
+    Exposes ``fileno()`` so WSGI servers with a sendfile-capable
+    ``wsgi.file_wrapper`` can send it directly; they send Content-Length bytes
+    from the current file position. Iterating it asynchronously reads blocks
+    in a worker thread, so ASGI servers stream it instead of Django buffering
+    a synchronous iterator into a list.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    async def __aiter__(self):
+        read = sync_to_async(self.read, thread_sensitive=False)
+        while True:
+            data = await read(STREAM_BLOCK_SIZE)
+            if not data:
+                break
+            yield data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    Args:
+        header: The Range header value
+        size: Size of the file in bytes
+
+    Returns:
+        An inclusive ``(first, last)`` byte pair, None to serve the whole file
+        (no header, or one we do not support such as multiple ranges), or
+        False if the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        return False
+    return first, last
+
+
+def record_etag(record, stat):
+    """Strong ETag from the record checksum, or from the file size and mtime for older records"""
+    if record.checksum:
+        return f'"{record.checksum}"'
+    return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def if_range_matches(request, etag, last_modified):
+    """Return True if the Range header applies under the request's If-Range validator"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_record_file(request, record, as_attachment=True):
+    """
+    Build the download response for a medical record's file.
+
+    Args:
+        request: The Django request (Range and conditional headers are read from it)
+        record: The MedicalRecord, already authorized
+        as_attachment: Send ``Content-Disposition: attachment`` instead of inline
+
+    Returns:
+        An HttpResponse
+    """
+    name = record.file.name
+    filename = os.path.basename(name)
+    mode = settings.RECORD_DOWNLOAD_MODE
+
+    if mode == 'presigned':
+        disposition = content_disposition_header(as_attachment, filename)
+        try:
+            url = default_storage.url(name, parameters={'ResponseContentDisposition': disposition},
+                                      expire=settings.RECORD_DOWNLOAD_URL_EXPIRY)
+        except TypeError:
+            # Storage without presigning support
+            url = default_storage.url(name)
+        return HttpResponseRedirect(url)
+
+    path = default_storage.path(name)
+    stat = os.stat(path)
+    etag = record_etag(record, stat)
+    last_modified = int(stat.st_mtime)
+
+    # 304 Not Modified or 412 Precondition Failed
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, path, name, filename, stat.st_size, etag, last_modified, mode, as_attachment)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _file_response(request, path, name, filename, size, etag, last_modified, mode, as_attachment):
+    if mode == 'x-accel':
+        response = HttpResponse(content_type=None)
+        response['X-Accel-Redirect'] = settings.RECORD_DOWNLOAD_ACCEL_PREFIX + quote(name)
+        del response['Content-Type']  # Let nginx set it from the file
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=None)
+        response['X-Sendfile'] = path
+        del response['Content-Type']
+    else:
+        byte_range = None
+        if request.method in ('GET', 'HEAD') and if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.headers.get('Range'), size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        first, last = byte_range or (0, size - 1)
+        file_range = FileRange(open(path, 'rb'), first, last - first + 1)
+        status = 206 if byte_range else 200
+        if isinstance(getattr(request, '_request', request), ASGIRequest):
+            response = StreamingHttpResponse(
+                file_range, status=status,
+                content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            )
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        else:
+            response = FileResponse(file_range, as_attachment=as_attachment, filename=filename, status=status)
+            response.block_size = STREAM_BLOCK_SIZE
+        response['Content-Length'] = str(last - first + 1)
+        response['Accept-Ranges'] = 'bytes'
+        if byte_range:
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        return response
+
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
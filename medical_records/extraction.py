@@ -0,0 +1,121 @@
+"""
+Text extraction and full-text indexing of medical record files.
+
+``extract_record_text`` (a Celery task in medical_records.tasks) runs after a
+record's file is saved, so uploads do not wait for it. PDFs are read page by
+page with pypdf; plain-text formats are decoded directly. Other files, such as
+images and DICOM studies, are marked unsupported.
+
+The text is stored on MedicalRecordContent together with the offset at which
+each page starts. On PostgreSQL its ``search_vector`` is rebuilt with
+``to_tsvector`` over the first ``RECORD_SEARCH_INDEX_CHARS`` characters
+(tsvector values are limited to 1 MB), and served by a GIN index.
+"""
+import logging
+import os
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db.models.functions import Substr
+from django.utils import timezone
+from healthmateai.postgres import is_postgres
+from .models import MedicalRecordContent
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {'.txt', '.csv', '.tsv', '.json', '.xml', '.md', '.hl7'}
+
+
+class UnsupportedFile(Exception):
+    """Raised for files whose text cannot be extracted"""
+
+
+def extract_pdf(file):
+    """Return the text of each page of a PDF"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file)
+    return [page.extract_text() or '' for page in reader.pages]
+
+
+def extract_plain_text(file):
+    """Return a plain-text file as a single page"""
+    return [file.read().decode('utf-8', errors='replace')]
+
+
+def extract_pages(file, name):
+    """
+    Extract the text of a file, page by page.
+
+    Args:
+        file: Open binary file
+        name: File name, used to pick the extractor
+
+    Returns:
+        List of page texts
+
+    Raises:
+        UnsupportedFile: If no extractor handles the file type
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.pdf':
+        return extract_pdf(file)
+    if extension in TEXT_EXTENSIONS:
+        return extract_plain_text(file)
+    raise UnsupportedFile(f"No text extractor for {extension or 'files without an extension'}")
+
+
+def join_pages(pages):
+    """Join page texts, returning the text and the offset where each page starts"""
+    offsets = []
+    position = 0
+    pages = [page.replace('\x00', '') for page in pages]  # PostgreSQL text cannot hold NUL
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + 1  # Pages are separated by a form feed
+    return '\f'.join(pages), offsets
+
+
+def search_vector_expression():
+    return SearchVector(
+        Substr('text', 1, settings.RECORD_SEARCH_INDEX_CHARS),
+        config=settings.RECORD_SEARCH_CONFIG
+    )
+
+
+def update_search_vectors(queryset):
+    """Rebuild the search vectors of a MedicalRecordContent queryset with one UPDATE"""
+    if not is_postgres(queryset.db):
+        return 0
+    return queryset.update(search_vector=search_vector_expression())
+
+
+def index_record(record):
+    """
+    Extract a record's text and update its search index.
+
+    Args:
+        record: The MedicalRecord
+
+    Returns:
+        The MedicalRecordContent
+    """
+    content, _ = MedicalRecordContent.objects.get_or_create(record=record)
+    try:
+        with record.file.open('rb') as file:
+            pages = extract_pages(file, record.file.name)
+    except UnsupportedFile as e:
+        content.status = MedicalRecordContent.STATUS_UNSUPPORTED
+        content.text, content.page_offsets, content.error = '', [], str(e)
+    except Exception as e:
+        logger.warning(f"Text extraction failed for record {record.id}: {str(e)}")
+        content.status = MedicalRecordContent.STATUS_FAILED
+        content.text, content.page_offsets, content.error = '', [], str(e)
+    else:
+        content.status = MedicalRecordContent.STATUS_DONE
+        content.text, content.page_offsets = join_pages(pages)
+        content.error = ''
+
+    content.extracted_at = timezone.now()
+    content.save()
+    update_search_vectors(MedicalRecordContent.objects.filter(pk=content.pk))
+    return content
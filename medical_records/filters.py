@@ -1,5 +1,16 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Substr
+from django.utils.html import escape
 from django_filters import rest_framework as filters
-from .models import MedicalRecord
+from rest_framework.filters import SearchFilter
+from healthmateai.postgres import is_postgres
+from .models import MedicalRecord, MedicalRecordContent
+
+# Private-use characters delimiting the matches in a search headline until it is escaped
+HEADLINE_START = '\ue000'
+HEADLINE_STOP = '\ue001'
 
 class MedicalRecordFilter(filters.FilterSet):
     """
@@ -18,4 +29,57 @@ class MedicalRecordFilter(filters.FilterSet):
         fields = {
             'record_type': ['exact'],
             'user': ['exact'],
-        } 
\ No newline at end of file
+        } 
+
+class MedicalRecordSearchFilter(SearchFilter):
+    """
+    Ranked search over record titles, descriptions and extracted file text.
+    
+    Takes the same ``?search=`` parameter as DRF's SearchFilter. On PostgreSQL
+    the text is matched against the GIN-indexed ``search_vector`` with a web
+    search style query, ranked with ``ts_rank`` (title matches first), and
+    annotated with a ``search_headline`` snippet. Elsewhere matching falls
+    back to ``icontains`` and no snippet is produced.
+    
+    Records are matched through the UNION of the tsvector matches and the
+    title or description matches, so the GIN index serves the text search;
+    an OR across the join to the contents would scan every row.
+    """
+    
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        
+        title_boost = Case(When(title__icontains=terms, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+        
+        if is_postgres(queryset.db):
+            query = SearchQuery(terms, config=settings.RECORD_SEARCH_CONFIG, search_type='websearch')
+            text_matches = MedicalRecordContent.objects.filter(search_vector=query).values('record_id')
+            field_matches = queryset.filter(Q(title__icontains=terms) | Q(description__icontains=terms))
+            matches = Q(id__in=text_matches.union(field_matches.order_by().values('id')))
+            # Cast to double precision so cursor positions round-trip exactly
+            rank = Cast(Coalesce(SearchRank(F('content__search_vector'), query), Value(0.0)) + title_boost, FloatField())
+            headline = SearchHeadline(
+                Substr('content__text', 1, settings.RECORD_SEARCH_INDEX_CHARS),
+                query,
+                config=settings.RECORD_SEARCH_CONFIG,
+                start_sel=HEADLINE_START,
+                stop_sel=HEADLINE_STOP,
+                max_fragments=2
+            )
+            return queryset.filter(matches).annotate(search_rank=rank, search_headline=headline)
+        
+        matches = Q(title__icontains=terms) | Q(description__icontains=terms) | Q(content__text__icontains=terms)
+        return queryset.filter(matches).annotate(search_rank=title_boost)
+
+
+def render_headline(headline):
+    """
+    Turn a search headline into HTML: the file text is escaped and the matches wrapped in ``<mark>``.
+    
+    The text comes from uploaded files, so it is never returned as raw HTML.
+    """
+    if headline is None:
+        return None
+    return escape(headline).replace(HEADLINE_START, '<mark>').replace(HEADLINE_STOP, '</mark>')
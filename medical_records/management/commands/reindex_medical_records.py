@@ -0,0 +1,54 @@
+from celery import group
+from django.core.management.base import BaseCommand
+from medical_records.extraction import index_record, update_search_vectors
+from medical_records.models import MedicalRecord, MedicalRecordContent
+from medical_records.tasks import extract_record_text
+
+class Command(BaseCommand):
+    help = 'Re-extracts the text of medical record files and rebuilds their search index, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Records loaded per batch')
+        parser.add_argument('--missing', action='store_true', help='Only records without extracted text')
+        parser.add_argument('--vectors-only', action='store_true',
+                            help='Rebuild search vectors from the stored text without re-extracting files')
+        parser.add_argument('--sync', action='store_true', help='Extract in this process instead of queueing tasks')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['vectors_only']:
+            updated = 0
+            for ids in self.batches(MedicalRecordContent.objects.all(), 'record_id', batch_size):
+                updated += update_search_vectors(MedicalRecordContent.objects.filter(record_id__in=ids))
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {updated} search vectors'))
+            return
+
+        records = MedicalRecord.objects.exclude(file='')
+        if options['missing']:
+            records = records.exclude(content__status=MedicalRecordContent.STATUS_DONE)
+
+        total = 0
+        for ids in self.batches(records, 'id', batch_size):
+            if options['sync']:
+                for record in MedicalRecord.objects.filter(id__in=ids).order_by('id'):
+                    index_record(record)
+            else:
+                group(extract_record_text.s(record_id) for record_id in ids).apply_async()
+            total += len(ids)
+            self.stdout.write(f'{"Indexed" if options["sync"] else "Queued"} {total} records')
+
+        self.stdout.write(self.style.SUCCESS(f'{"Indexed" if options["sync"] else "Queued"} {total} records'))
+
+    def batches(self, queryset, key, batch_size):
+        """Yield lists of primary keys, seeking past the last one so each batch costs the same"""
+        last = None
+        while True:
+            page = queryset.order_by(key)
+            if last is not None:
+                page = page.filter(**{f'{key}__gt': last})
+            ids = list(page.values_list(key, flat=True)[:batch_size])
+            if not ids:
+                return
+            yield ids
+            last = ids[-1]
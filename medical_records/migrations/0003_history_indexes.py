@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['user', 'uploaded_at'], name='record_user_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['uploaded_at'], name='record_uploaded_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-18 01:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('medical_records', '0003_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='checksum',
+            field=models.CharField(blank=True, help_text='SHA-256 of the file, or of its chunk digests for chunked uploads', max_length=80),
+        ),
+        migrations.CreateModel(
+            name='MedicalRecordUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=100)),
+                ('record_type', models.CharField(choices=[('lab', 'Lab Report'), ('prescription', 'Prescription'), ('imaging', 'Imaging'), ('discharge', 'Discharge Summary'), ('other', 'Other')], max_length=20)),
+                ('description', models.TextField(blank=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(help_text='Total size of the file in bytes')),
+                ('chunk_size', models.PositiveIntegerField(help_text='Size of every chunk except the last')),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes received so far')),
+                ('parts', models.JSONField(blank=True, default=list, help_text='Number, size and SHA-256 of each received chunk')),
+                ('storage_name', models.CharField(blank=True, max_length=255)),
+                ('backend_upload_id', models.CharField(blank=True, max_length=1024)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete'), ('aborted', 'Aborted')], default='uploading', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('record', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='medical_records.medicalrecord')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='record_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='record_upload_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-18 01:04
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+from healthmateai.postgres import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0004_record_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicalRecordContent',
+            fields=[
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='medical_records.medicalrecord')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('unsupported', 'Unsupported file type'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('text', models.TextField(blank=True)),
+                ('page_offsets', models.JSONField(blank=True, default=list, help_text='Character offset where each page starts in the text')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        AddPostgresIndex(
+            model_name='medicalrecordcontent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='record_content_search_gin'),
+        ),
+    ]
@@ -1,5 +1,14 @@
-from django.db import models
+import logging
+import uuid
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+logger = logging.getLogger(__name__)
 
 class MedicalRecord(models.Model):
     """Model for storing medical records and files"""
@@ -15,10 +24,134 @@ class MedicalRecord(models.Model):
     ]
     record_type = models.CharField(max_length=20, choices=RECORD_TYPES)
     description = models.TextField(blank=True)
+    checksum = models.CharField(max_length=80, blank=True, help_text=_("SHA-256 of the file, or of its chunk digests for chunked uploads"))
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['user', 'uploaded_at'], name='record_user_uploaded_idx'),
+            models.Index(fields=['uploaded_at'], name='record_uploaded_idx'),  # Doctors list records across their patients
+        ]
         
     def __str__(self):
         return f"{self.title} ({self.get_record_type_display()})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored file so a replaced one is re-extracted
+        instance._original_file = instance.__dict__.get('file')
+        return instance
+
+class MedicalRecordContent(models.Model):
+    """
+    Text extracted from a medical record's file, and its full-text index.
+    
+    Kept apart from MedicalRecord so record listings do not load the text.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_UNSUPPORTED = 'unsupported'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_UNSUPPORTED, _('Unsupported file type')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+    
+    record = models.OneToOneField(MedicalRecord, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    text = models.TextField(blank=True)
+    page_offsets = models.JSONField(default=list, blank=True, help_text=_("Character offset where each page starts in the text"))
+    search_vector = SearchVectorField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # PostgreSQL only; serves full-text search= on records
+            GinIndex(fields=['search_vector'], name='record_content_search_gin'),
+        ]
+    
+    def __str__(self):
+        return f"Text of {self.record} ({self.status})"
+
+
+class MedicalRecordUpload(models.Model):
+    """
+    A resumable, chunked upload of a medical record file.
+    
+    Chunks are appended in order and streamed to the storage backend as they
+    arrive; ``offset`` is the number of bytes received so far. Completing the
+    upload creates the MedicalRecord.
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_ABORTED = 'aborted'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, _('Uploading')),
+        (STATUS_COMPLETE, _('Complete')),
+        (STATUS_ABORTED, _('Aborted')),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='record_uploads')
+    
+    # Metadata of the record created on completion
+    title = models.CharField(max_length=100)
+    record_type = models.CharField(max_length=20, choices=MedicalRecord.RECORD_TYPES)
+    description = models.TextField(blank=True)
+    filename = models.CharField(max_length=255)
+    
+    size = models.BigIntegerField(help_text=_("Total size of the file in bytes"))
+    chunk_size = models.PositiveIntegerField(help_text=_("Size of every chunk except the last"))
+    offset = models.BigIntegerField(default=0, help_text=_("Bytes received so far"))
+    parts = models.JSONField(default=list, blank=True, help_text=_("Number, size and SHA-256 of each received chunk"))
+    
+    # Where the storage backend keeps the partial file
+    storage_name = models.CharField(max_length=255, blank=True)
+    backend_upload_id = models.CharField(max_length=1024, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    record = models.OneToOneField(MedicalRecord, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='record_upload_status_idx'),  # Stale upload cleanup
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes, {self.status})"
+    
+    @property
+    def next_chunk_length(self):
+        """Length the next chunk must have"""
+        return min(self.chunk_size, self.size - self.offset)
+
+
+@receiver(post_save, sender=MedicalRecord)
+def schedule_text_extraction(sender, instance, created, **kwargs):
+    """Extract the text of new and replaced files once the upload is committed"""
+    if not instance.file or (not created and instance.file.name == getattr(instance, '_original_file', None)):
+        return
+    instance._original_file = instance.file.name
+    
+    record_id = instance.id
+    transaction.on_commit(lambda: queue_text_extraction(record_id))
+
+def queue_text_extraction(record_id):
+    """
+    Queue a record's text extraction, without failing the upload if the broker is down.
+    
+    Records left unqueued are picked up by ``reindex_medical_records --missing``.
+    """
+    from .tasks import extract_record_text
+    try:
+        extract_record_text.delay(record_id)
+    except Exception as e:
+        logger.error(f"Unable to queue text extraction for medical record {record_id}: {str(e)}")
@@ -1,18 +1,82 @@
+import hashlib
+import os
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from .models import MedicalRecord
+from healthmateai.serializers import SparseFieldsetsMixin
+from .filters import render_headline
+from .models import MedicalRecord, MedicalRecordUpload
+from .uploads import get_upload_backend
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+def file_checksum(file):
+    """Return the hex SHA-256 of an uploaded file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+class MedicalRecordSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for medical records"""
     record_type_display = serializers.CharField(source='get_record_type_display', read_only=True)
     user_email = serializers.EmailField(source='user.email', read_only=True)
+    download_url = serializers.HyperlinkedIdentityField(view_name='medical_records:medical_records-download')
+    search_snippet = serializers.SerializerMethodField()
     
     class Meta:
         model = MedicalRecord
-        fields = ['id', 'user', 'user_email', 'title', 'file', 'record_type', 
-                  'record_type_display', 'description', 'uploaded_at']
-        read_only_fields = ['id', 'user', 'user_email', 'uploaded_at']
+        fields = ['id', 'user', 'user_email', 'title', 'file', 'download_url', 'record_type', 
+                  'record_type_display', 'description', 'checksum', 'search_snippet', 'uploaded_at']
+        read_only_fields = ['id', 'user', 'user_email', 'download_url', 'checksum', 'search_snippet', 'uploaded_at']
+    
+    def get_search_snippet(self, obj):
+        """Escaped excerpt of the file text matching ?search=, matches in <mark> (PostgreSQL only)"""
+        return render_headline(getattr(obj, 'search_headline', None))
         
     def create(self, validated_data):
         # Set the user to the current request user
         validated_data['user'] = self.context['request'].user
-        return super().create(validated_data) 
\ No newline at end of file
+        validated_data['checksum'] = file_checksum(validated_data['file'])
+        return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        if 'file' in validated_data:
+            validated_data['checksum'] = file_checksum(validated_data['file'])
+        return super().update(instance, validated_data)
+
+class MedicalRecordUploadSerializer(serializers.ModelSerializer):
+    """Serializer for starting a chunked upload and reporting its progress"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    
+    class Meta:
+        model = MedicalRecordUpload
+        fields = ['id', 'title', 'record_type', 'description', 'filename', 'size',
+                  'chunk_size', 'offset', 'status', 'status_display', 'record',
+                  'created_at', 'updated_at']
+        read_only_fields = ['id', 'chunk_size', 'offset', 'status', 'status_display', 'record',
+                            'created_at', 'updated_at']
+    
+    def validate_filename(self, value):
+        # Keep only the base name; the storage decides the directory
+        value = os.path.basename(value.replace('\\', '/')).strip()
+        if not value:
+            raise serializers.ValidationError(_("A file name is required"))
+        return value
+    
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError(_("The file is empty"))
+        if value > settings.RECORD_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                _("Files may not be larger than %(max)s bytes") % {'max': settings.RECORD_UPLOAD_MAX_SIZE}
+            )
+        return value
+    
+    def create(self, validated_data):
+        upload = MedicalRecordUpload(
+            user=self.context['request'].user,
+            chunk_size=settings.RECORD_UPLOAD_CHUNK_SIZE,
+            **validated_data
+        )
+        get_upload_backend().initiate(upload)
+        upload.save()
+        return upload
@@ -0,0 +1,46 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def abort_stale_record_uploads():
+    """Abort chunked uploads that have not received data for RECORD_UPLOAD_EXPIRY_HOURS"""
+    from .models import MedicalRecordUpload
+    from .uploads import get_upload_backend
+    
+    cutoff = timezone.now() - datetime.timedelta(hours=settings.RECORD_UPLOAD_EXPIRY_HOURS)
+    stale = MedicalRecordUpload.objects.filter(
+        status=MedicalRecordUpload.STATUS_UPLOADING,
+        updated_at__lt=cutoff
+    )
+    
+    backend = get_upload_backend()
+    aborted = 0
+    for upload in stale.iterator():
+        try:
+            backend.abort(upload)
+        except Exception as e:
+            logger.warning(f"Could not abort upload {upload.id}: {str(e)}")
+            continue
+        upload.delete()
+        aborted += 1
+    
+    return f"Aborted {aborted} stale record uploads"
+
+
+@shared_task
+def extract_record_text(record_id):
+    """Extract the text of a medical record's file and index it for search"""
+    from .models import MedicalRecord
+    from .extraction import index_record
+    
+    record = MedicalRecord.objects.filter(id=record_id).first()
+    if record is None or not record.file:
+        return f"Medical record {record_id} has no file"
+    
+    content = index_record(record)
+    return f"Extracted {len(content.text)} characters from record {record_id} ({content.status})"
@@ -1,3 +1,367 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from appointments.models import Appointment
+from users.authentication import UserRefreshToken
+from diagnostics.models import Diagnosis
+from users.models import CareRelationship, CustomUser
+from .extraction import index_record
+from .filters import render_headline
+from .models import MedicalRecord, MedicalRecordContent, MedicalRecordUpload
 
-# Create your tests here.
+
+class ChunkedUploadTests(TestCase):
+    """The resumable upload protocol, run against the local backend"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            RECORD_UPLOAD_TEMP_DIR=f'{self.media_root}/partial',
+            RECORD_UPLOAD_BACKEND='local',
+            RECORD_UPLOAD_CHUNK_SIZE=4,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = b'0123456789'
+
+    def initiate(self, filename='scan.dcm'):
+        response = self.client.post('/api/records/uploads/', {
+            'title': 'MRI', 'record_type': 'imaging', 'filename': filename, 'size': len(self.content),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def send_chunk(self, upload_id, offset, data, checksum=None):
+        checksum = checksum or hashlib.sha256(data).digest()
+        return self.client.put(
+            f'/api/records/uploads/{upload_id}/chunk/', data, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=f'sha256 {base64.b64encode(checksum).decode()}',
+        )
+
+    def test_upload_in_chunks(self):
+        upload_id = self.initiate()
+        for offset in range(0, len(self.content), 4):
+            response = self.send_chunk(upload_id, offset, self.content[offset:offset + 4])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        response = self.client.post(f'/api/records/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        record = MedicalRecord.objects.get(id=response.data['id'])
+        with record.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertTrue(record.checksum.endswith('-3'))
+
+    def test_resume_after_rejected_chunk(self):
+        upload_id = self.initiate()
+        self.send_chunk(upload_id, 0, b'0123')
+
+        response = self.send_chunk(upload_id, 4, b'4567', checksum=hashlib.sha256(b'xxxx').digest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['offset'], 4)
+
+        response = self.send_chunk(upload_id, 0, b'0123')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 4)
+
+        self.assertEqual(self.client.get(f'/api/records/uploads/{upload_id}/').data['offset'], 4)
+        self.send_chunk(upload_id, 4, b'4567')
+        self.send_chunk(upload_id, 8, b'89')
+        response = self.client.post(f'/api/records/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        with MedicalRecord.objects.get().file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_same_filename_gets_separate_files(self):
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        first_id = self.initiate()
+        self.client.force_authenticate(other)
+        second_id = self.initiate()
+
+        self.send_chunk(second_id, 0, b'abcd')
+        self.client.force_authenticate(self.user)
+        for offset in range(0, len(self.content), 4):
+            self.send_chunk(first_id, offset, self.content[offset:offset + 4])
+        self.client.force_authenticate(other)
+        self.send_chunk(second_id, 4, b'efgh')
+        self.send_chunk(second_id, 8, b'ij')
+        response = self.client.post(f'/api/records/uploads/{second_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/records/uploads/{first_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+
+        first = MedicalRecord.objects.get(user=self.user)
+        second = MedicalRecord.objects.get(user=other)
+        self.assertEqual(first.file.name, f'records/{first_id}/scan.dcm')
+        self.assertEqual(second.file.name, f'records/{second_id}/scan.dcm')
+        with first.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        with second.file.open('rb') as f:
+            self.assertEqual(f.read(), b'abcdefghij')
+
+    def test_file_name_is_sanitized(self):
+        upload_id = self.initiate(filename='..\\C:\\scans\\my scan ' + 'x' * 200 + '.dcm')
+        for offset in range(0, len(self.content), 4):
+            self.send_chunk(upload_id, offset, self.content[offset:offset + 4])
+        response = self.client.post(f'/api/records/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        name = MedicalRecord.objects.get().file.name
+        self.assertTrue(name.startswith(f'records/{upload_id}/my_scan_xxx'))
+        self.assertTrue(name.endswith('.dcm'))
+        self.assertLessEqual(len(name), 100)
+
+    def test_complete_requires_all_chunks(self):
+        upload_id = self.initiate()
+        self.send_chunk(upload_id, 0, b'0123')
+        response = self.client.post(f'/api/records/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MedicalRecordUpload.objects.get().status, MedicalRecordUpload.STATUS_UPLOADING)
+
+
+class RecordDownloadTests(TestCase):
+    """Range and conditional requests on the download endpoint, served from the local filesystem"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, RECORD_DOWNLOAD_MODE='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = bytes(range(256)) * 4
+        self.record = MedicalRecord.objects.create(
+            user=self.user, title='Lab', record_type='lab',
+            file=ContentFile(self.content, name='lab.pdf'),
+            checksum=hashlib.sha256(self.content).hexdigest(),
+        )
+        self.url = f'/api/records/{self.record.id}/download/'
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['ETag'], f'"{self.record.checksum}"')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_ranges(self):
+        for header, expected in (('bytes=10-19', self.content[10:20]),
+                                 ('bytes=1000-', self.content[1000:]),
+                                 ('bytes=-5', self.content[-5:])):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), expected)
+            self.assertEqual(response['Content-Length'], str(len(expected)))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A stale If-Range gets the whole file instead of the range
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    async def test_asgi_streams_asynchronously(self):
+        token = str((await sync_to_async(UserRefreshToken.for_user)(self.user)).access_token)
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}',
+                                                                  'Range': 'bytes=10-99999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        with mock.patch('medical_records.downloads.STREAM_BLOCK_SIZE', 100):
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b''.join(chunks), self.content[10:])
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual(response['Content-Length'], str(len(self.content) - 10))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_other_patients_cannot_download(self):
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_x_accel_redirect(self):
+        with override_settings(RECORD_DOWNLOAD_MODE='x-accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.record.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+class RecordTextSearchTests(TestCase):
+    """Text extraction and search= over record contents"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_record(self, title, name, content):
+        return MedicalRecord.objects.create(
+            user=self.user, title=title, record_type='lab', file=ContentFile(content, name=name)
+        )
+
+    def test_extraction_is_queued_after_commit(self):
+        with mock.patch('medical_records.tasks.extract_record_text.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                record = self.create_record('Lab', 'lab.txt', b'Hemoglobin 13.5')
+            record.description = 'Updated'
+            with self.captureOnCommitCallbacks(execute=True):
+                record.save()
+        delay.assert_called_once_with(record.id)
+
+    def test_queueing_failure_keeps_the_record(self):
+        with mock.patch('medical_records.tasks.extract_record_text.delay', side_effect=ConnectionError('broker down')):
+            with self.assertLogs('medical_records.models', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    record = self.create_record('Lab', 'lab.txt', b'Hemoglobin 13.5')
+        self.assertTrue(MedicalRecord.objects.filter(id=record.id).exists())
+
+    def test_search_matches_file_text(self):
+        index_record(self.create_record('Blood panel', 'panel.txt', b'Ferritin low, hemoglobin 9.8'))
+        index_record(self.create_record('Chest X-ray', 'xray.txt', b'No acute findings'))
+
+        response = self.client.get('/api/records/', {'search': 'ferritin'})
+        self.assertEqual([r['title'] for r in response.data['results']], ['Blood panel'])
+
+    def test_snippet_is_escaped(self):
+        headline = '<img src=x onerror=alert(1)> \ue000Ferritin\ue001 low & falling'
+        self.assertEqual(render_headline(headline),
+                         '&lt;img src=x onerror=alert(1)&gt; <mark>Ferritin</mark> low &amp; falling')
+        self.assertIsNone(render_headline(None))
+
+    def test_unsupported_files_are_marked(self):
+        content = index_record(self.create_record('Scan', 'scan.dcm', b'DICM'))
+        self.assertEqual(content.status, MedicalRecordContent.STATUS_UNSUPPORTED)
+
+    def test_reindex_command(self):
+        self.create_record('Notes', 'notes.txt', b'Page one')
+        call_command('reindex_medical_records', '--sync', '--batch-size', '1', stdout=open(os.devnull, 'w'))
+        content = MedicalRecordContent.objects.get()
+        self.assertEqual(content.status, MedicalRecordContent.STATUS_DONE)
+        self.assertEqual(content.text, 'Page one')
+        self.assertEqual(content.page_offsets, [0])
+
+
+class DoctorRecordAccessTests(TestCase):
+    """Doctors only see the records of patients in their care"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.doctor = CustomUser.objects.create_user(
+            email='doctor@example.com', username='doctor', password='testpass123', is_doctor=True
+        )
+        self.patient = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.stranger = CustomUser.objects.create_user(
+            email='stranger@example.com', username='stranger', password='testpass123'
+        )
+        for user in (self.patient, self.stranger):
+            MedicalRecord.objects.create(
+                user=user, title=f'Record of {user.username}', record_type='lab',
+                file=ContentFile(b'data', name='record.bin')
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def visible_titles(self):
+        return [record['title'] for record in self.client.get('/api/records/').data['results']]
+
+    def book(self, status='confirmed'):
+        start = timezone.now() + datetime.timedelta(days=1)
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, datetime=start,
+            end_time=start + datetime.timedelta(minutes=30), status=status,
+            patient_confirmed_at=timezone.now()
+        )
+
+    def test_no_relationship(self):
+        self.assertEqual(self.visible_titles(), [])
+
+    def test_appointment_grants_access_until_cancelled(self):
+        appointment = self.book()
+        self.assertEqual(self.visible_titles(), ['Record of patient'])
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertEqual(self.visible_titles(), [])
+
+    def test_doctor_cannot_book_their_way_in(self):
+        start = timezone.now() + datetime.timedelta(days=1)
+        response = self.client.post('/api/appointments/', {
+            'patient': self.stranger.id, 'doctor': self.doctor.id,
+            'datetime': start, 'end_time': start + datetime.timedelta(minutes=30),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Appointment.objects.exists())
+        self.assertEqual(self.visible_titles(), [])
+
+        # Nor can another patient book on the stranger's behalf
+        self.client.force_authenticate(self.patient)
+        response = self.client.post('/api/appointments/', {
+            'patient': self.stranger.id, 'doctor': self.doctor.id,
+            'datetime': start, 'end_time': start + datetime.timedelta(minutes=30),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['patient'], self.patient.id)
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.visible_titles(), ['Record of patient'])
+
+    def test_diagnosis_grants_access(self):
+        diagnosis = Diagnosis.objects.create(
+            user=self.patient, doctor=self.doctor, source='doctor', title='Anemia',
+            description='Low hemoglobin', diagnosis_date=datetime.date.today()
+        )
+        self.assertTrue(CareRelationship.objects.get(doctor=self.doctor, patient=self.patient).has_diagnosis)
+
+        diagnosis.delete()
+        self.assertFalse(CareRelationship.objects.exists())
+
+    def test_list_query_count(self):
+        self.book()
+        # The records joined with their owners, filtered through the care relationships
+        with self.assertNumQueries(1):
+            self.client.get('/api/records/')
@@ -0,0 +1,250 @@
+"""
+Storage backends for resumable, chunked medical record uploads.
+
+An upload is initiated with the file's name and size, receives its chunks in
+order, and is completed into a MedicalRecord. Every chunk except the last is
+exactly ``chunk_size`` bytes, so chunk ``n`` starts at ``(n - 1) * chunk_size``
+and maps onto S3 multipart part ``n``.
+
+Chunks are read from the request stream in blocks and hashed with SHA-256 as
+they are written, so a chunk is never held in memory whole. A chunk whose
+digest does not match the one sent by the client is rejected and the upload
+offset is not advanced, so the client can send it again.
+
+Two backends implement the same interface:
+
+* ``LocalChunkedUploadBackend`` writes into a staging file next to
+  ``MEDIA_ROOT`` and moves it into place on completion. Used in development
+  and tests.
+* ``S3ChunkedUploadBackend`` streams chunks to an S3 multipart upload through
+  django-storages' ``S3Storage``. Used when ``AWS_STORAGE_BUCKET_NAME`` is set.
+
+The backend is chosen with the ``RECORD_UPLOAD_BACKEND`` setting.
+"""
+import base64
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from .models import MedicalRecord
+
+# Bytes read from the request per write
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Raised when a chunk or a completion request cannot be accepted"""
+
+
+class ChecksumMismatch(UploadError):
+    """Raised when a chunk does not match the digest sent with it"""
+
+
+def copy_chunk(stream, destination, length, expected_sha256=None):
+    """
+    Copy ``length`` bytes of ``stream`` to ``destination``, hashing as it goes.
+
+    Args:
+        stream: File-like object to read from, e.g. the request
+        destination: File-like object to write to
+        length: Number of bytes to copy
+        expected_sha256: Hex SHA-256 the chunk must match, if known
+
+    Returns:
+        The hex SHA-256 of the copied bytes
+
+    Raises:
+        UploadError: If the stream ends early
+        ChecksumMismatch: If the digest does not match ``expected_sha256``
+    """
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining:
+        block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+        if not block:
+            raise UploadError(f"Chunk ended after {length - remaining} of {length} bytes")
+        digest.update(block)
+        destination.write(block)
+        remaining -= len(block)
+
+    sha256 = digest.hexdigest()
+    if expected_sha256 and sha256 != expected_sha256.lower():
+        raise ChecksumMismatch("Chunk checksum does not match")
+    return sha256
+
+
+def composite_checksum(parts):
+    """SHA-256 of the concatenated chunk digests, suffixed with the chunk count like S3 ETags"""
+    digest = hashlib.sha256(b''.join(bytes.fromhex(part['sha256']) for part in parts))
+    return f"{digest.hexdigest()}-{len(parts)}"
+
+
+def record_file_name(upload):
+    """
+    Return the storage name of an upload's file under the ``upload_to`` of MedicalRecord.file.
+
+    The name is namespaced by the upload's id, so concurrent uploads of the
+    same filename never resolve to the same file.
+    """
+    field = MedicalRecord._meta.get_field('file')
+    filename = os.path.basename(upload.filename.replace('\\', '/'))
+    name = field.generate_filename(None, f"{upload.id}/{filename}")
+    if len(name) > field.max_length:
+        root, ext = os.path.splitext(name)
+        ext = ext[:16]
+        name = root[:field.max_length - len(ext)] + ext
+    return name
+
+
+class ChunkedUploadBackend:
+    """Interface of the chunked upload backends"""
+
+    def initiate(self, upload):
+        """Prepare storage for a new upload and set its ``storage_name``/``backend_upload_id``"""
+        raise NotImplementedError
+
+    def write_chunk(self, upload, stream, expected_sha256=None):
+        """
+        Store the next chunk of an upload.
+
+        Reads ``upload.next_chunk_length`` bytes from ``stream``.
+
+        Returns:
+            The part entry to append to ``upload.parts``
+        """
+        raise NotImplementedError
+
+    def complete(self, upload):
+        """Assemble the chunks and return the storage name of the file"""
+        raise NotImplementedError
+
+    def abort(self, upload):
+        """Discard whatever has been stored for the upload"""
+        raise NotImplementedError
+
+    def part_number(self, upload):
+        return upload.offset // upload.chunk_size + 1
+
+
+class LocalChunkedUploadBackend(ChunkedUploadBackend):
+    """Stage chunks in a local file and move it into the default (filesystem) storage"""
+
+    def staging_path(self, upload):
+        return os.path.join(settings.RECORD_UPLOAD_TEMP_DIR, str(upload.id))
+
+    def initiate(self, upload):
+        os.makedirs(settings.RECORD_UPLOAD_TEMP_DIR, exist_ok=True)
+        open(self.staging_path(upload), 'wb').close()
+        upload.storage_name = self.staging_path(upload)
+
+    def write_chunk(self, upload, stream, expected_sha256=None):
+        length = upload.next_chunk_length
+        with open(self.staging_path(upload), 'r+b') as staged:
+            staged.seek(upload.offset)
+            sha256 = copy_chunk(stream, staged, length, expected_sha256)
+        return {'number': self.part_number(upload), 'size': length, 'sha256': sha256}
+
+    def complete(self, upload):
+        path = self.staging_path(upload)
+        # Drop bytes left by rejected chunks past the end
+        with open(path, 'r+b') as staged:
+            staged.truncate(upload.size)
+
+        name = record_file_name(upload)
+        destination = default_storage.path(name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(path, destination)
+        return name
+
+    def abort(self, upload):
+        try:
+            os.remove(self.staging_path(upload))
+        except FileNotFoundError:
+            pass
+
+
+class S3ChunkedUploadBackend(ChunkedUploadBackend):
+    """
+    Stream chunks to an S3 multipart upload.
+
+    Each chunk is spooled to a temporary file (in memory up to
+    ``RECORD_UPLOAD_SPOOL_SIZE``) while it is hashed, then sent as one part
+    with its SHA-256, which S3 verifies again. S3 requires parts of at least
+    5 MiB except the last one.
+    """
+
+    @property
+    def storage(self):
+        return default_storage
+
+    @property
+    def client(self):
+        return self.storage.connection.meta.client
+
+    def key(self, name):
+        return self.storage._normalize_name(name)
+
+    def initiate(self, upload):
+        name = record_file_name(upload)
+        key = self.key(name)
+        response = self.client.create_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=key,
+            ChecksumAlgorithm='SHA256',
+            **self.storage._get_write_parameters(key)
+        )
+        upload.storage_name = name
+        upload.backend_upload_id = response['UploadId']
+
+    def write_chunk(self, upload, stream, expected_sha256=None):
+        length = upload.next_chunk_length
+        number = self.part_number(upload)
+        with tempfile.SpooledTemporaryFile(max_size=settings.RECORD_UPLOAD_SPOOL_SIZE) as spool:
+            sha256 = copy_chunk(stream, spool, length, expected_sha256)
+            spool.seek(0)
+            response = self.client.upload_part(
+                Bucket=self.storage.bucket_name,
+                Key=self.key(upload.storage_name),
+                UploadId=upload.backend_upload_id,
+                PartNumber=number,
+                Body=spool,
+                ContentLength=length,
+                ChecksumSHA256=base64.b64encode(bytes.fromhex(sha256)).decode(),
+            )
+        return {'number': number, 'size': length, 'sha256': sha256, 'etag': response['ETag']}
+
+    def complete(self, upload):
+        self.client.complete_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self.key(upload.storage_name),
+            UploadId=upload.backend_upload_id,
+            MultipartUpload={'Parts': [
+                {
+                    'PartNumber': part['number'],
+                    'ETag': part['etag'],
+                    'ChecksumSHA256': base64.b64encode(bytes.fromhex(part['sha256'])).decode(),
+                }
+                for part in upload.parts
+            ]},
+        )
+        return upload.storage_name
+
+    def abort(self, upload):
+        if upload.backend_upload_id:
+            self.client.abort_multipart_upload(
+                Bucket=self.storage.bucket_name,
+                Key=self.key(upload.storage_name),
+                UploadId=upload.backend_upload_id,
+            )
+
+
+BACKENDS = {
+    'local': LocalChunkedUploadBackend,
+    's3': S3ChunkedUploadBackend,
+}
+
+
+def get_upload_backend():
+    """Return the chunked upload backend selected by RECORD_UPLOAD_BACKEND"""
+    return BACKENDS[settings.RECORD_UPLOAD_BACKEND]()
@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 from . import views
 
 router = DefaultRouter()
+router.register(r'uploads', views.MedicalRecordUploadViewSet, basename='record_uploads')
 router.register(r'', views.MedicalRecordViewSet, basename='medical_records')
 
 app_name = 'medical_records'
@@ -1,18 +1,31 @@
+import base64
+import binascii
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, filters
+from rest_framework import viewsets, mixins, permissions, filters, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import MedicalRecord
-from .serializers import MedicalRecordSerializer
+from .models import MedicalRecord, MedicalRecordUpload
+from .serializers import MedicalRecordSerializer, MedicalRecordUploadSerializer
+from .downloads import serve_record_file
+from .uploads import ChecksumMismatch, UploadError, composite_checksum, get_upload_backend
+from healthmateai.pagination import HistoryCursorPagination
+from users.models import CareRelationship
 from users.permissions import IsOwnerOrReadOnly
-from .filters import MedicalRecordFilter
+from .filters import MedicalRecordFilter, MedicalRecordSearchFilter
 
 class MedicalRecordViewSet(viewsets.ModelViewSet):
     serializer_class = MedicalRecordSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, MedicalRecordSearchFilter, filters.OrderingFilter]
     filterset_class = MedicalRecordFilter
-    search_fields = ['title', 'description']
     ordering_fields = ['uploaded_at', 'title']
+    ordering = ['-uploaded_at']
+    search_ordering = ['-search_rank']  # Best matches first for ?search=, newest first among ties
+    pagination_class = HistoryCursorPagination
     
     def get_queryset(self):
 
@@ -20,10 +33,148 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             return MedicalRecord.objects.none()
             
         user = self.request.user
-        # Mainly for future use and development
+        records = MedicalRecord.objects.select_related('user')
         if user.is_doctor:
-            # Doctors can see all medical records
-            return MedicalRecord.objects.all()
+            # Doctors can see their own records and those of the patients in their care
+            return records.filter(Q(user=user) | Q(user_id__in=CareRelationship.patient_ids(user)))
         else:
             # Patients can see their own records
-            return MedicalRecord.objects.filter(user=user)
+            return records.filter(user=user)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Download the record's file.
+        
+        Supports Range requests and conditional GETs (ETag/Last-Modified).
+        Pass ``?inline=1`` to display the file instead of saving it.
+        """
+        record = self.get_object()
+        if not record.file:
+            raise Http404
+        return serve_record_file(request, record, as_attachment=not request.query_params.get('inline'))
+
+
+class MedicalRecordUploadViewSet(mixins.CreateModelMixin,
+                                 mixins.RetrieveModelMixin,
+                                 mixins.DestroyModelMixin,
+                                 viewsets.GenericViewSet):
+    """
+    Resumable, chunked uploads of medical record files.
+    
+    POST creates an upload from the record metadata plus ``filename`` and
+    ``size``. Chunks are then sent in order to ``chunk/`` with an
+    ``Upload-Offset`` header, and optionally ``Upload-Checksum: sha256
+    <base64 digest>``. GET reports the offset to resume from after a dropped
+    connection. ``complete/`` creates the record; DELETE aborts the upload.
+    """
+    serializer_class = MedicalRecordUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return MedicalRecordUpload.objects.none()
+        return MedicalRecordUpload.objects.filter(user=self.request.user)
+    
+    def lock_upload(self):
+        """Return the upload locked for update, or None if another request holds it"""
+        upload = self.get_object()
+        try:
+            return MedicalRecordUpload.objects.select_for_update(nowait=True).get(pk=upload.pk)
+        except DatabaseError:
+            return None
+    
+    def busy_response(self):
+        return Response(
+            {"error": "Another request is writing to this upload"},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        """Append the next chunk, sent as the raw request body"""
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({"error": "Upload-Offset header is required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        expected_sha256 = None
+        if request.headers.get('Upload-Checksum'):
+            algorithm, _, encoded = request.headers['Upload-Checksum'].partition(' ')
+            if algorithm.lower() != 'sha256':
+                return Response({"error": "Only sha256 checksums are supported"}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                expected_sha256 = base64.b64decode(encoded, validate=True).hex()
+            except (binascii.Error, ValueError):
+                return Response({"error": "Invalid Upload-Checksum header"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            upload = self.lock_upload()
+            if upload is None:
+                return self.busy_response()
+            
+            if upload.status != MedicalRecordUpload.STATUS_UPLOADING:
+                return Response({"error": f"Upload is {upload.status}"}, status=status.HTTP_409_CONFLICT)
+            if offset != upload.offset:
+                # The client resumes from the offset the server has
+                return Response(
+                    {"error": "Upload-Offset does not match", "offset": upload.offset},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            if length != upload.next_chunk_length:
+                return Response(
+                    {"error": f"Chunk must be {upload.next_chunk_length} bytes"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                part = get_upload_backend().write_chunk(upload, request.stream, expected_sha256)
+            except ChecksumMismatch as e:
+                return Response({"error": str(e), "offset": upload.offset}, status=status.HTTP_400_BAD_REQUEST)
+            except UploadError as e:
+                return Response({"error": str(e), "offset": upload.offset}, status=status.HTTP_400_BAD_REQUEST)
+            
+            upload.parts = upload.parts + [part]
+            upload.offset += length
+            upload.save(update_fields=['parts', 'offset', 'updated_at'])
+        
+        return Response(self.get_serializer(upload).data, headers={'Upload-Offset': str(upload.offset)})
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Assemble the chunks and create the medical record"""
+        with transaction.atomic():
+            upload = self.lock_upload()
+            if upload is None:
+                return self.busy_response()
+            
+            if upload.status != MedicalRecordUpload.STATUS_UPLOADING:
+                return Response({"error": f"Upload is {upload.status}"}, status=status.HTTP_409_CONFLICT)
+            if upload.offset != upload.size:
+                return Response(
+                    {"error": "Upload is not finished", "offset": upload.offset},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            name = get_upload_backend().complete(upload)
+            record = MedicalRecord.objects.create(
+                user=upload.user,
+                title=upload.title,
+                record_type=upload.record_type,
+                description=upload.description,
+                file=name,
+                checksum=composite_checksum(upload.parts)
+            )
+            upload.record = record
+            upload.status = MedicalRecordUpload.STATUS_COMPLETE
+            upload.save(update_fields=['record', 'status', 'updated_at'])
+        
+        serializer = MedicalRecordSerializer(record, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def perform_destroy(self, instance):
+        if instance.status == MedicalRecordUpload.STATUS_UPLOADING:
+            get_upload_backend().abort(instance)
+        instance.delete()
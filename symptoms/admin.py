@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Symptom, UserSymptom, SymptomCheck
+from .models import Symptom, TriageRule, UserSymptom, SymptomCheck, SymptomCheckBatch
 
 admin.site.register(Symptom)
+admin.site.register(TriageRule)
 admin.site.register(UserSymptom)
 admin.site.register(SymptomCheck)
-
+admin.site.register(SymptomCheckBatch)
@@ -0,0 +1,104 @@
+"""
+Response cache for symptom analyses.
+
+The analysis prompt is sent at temperature 0.1, so the same prompt gets an
+equivalent answer. The prompt shows normalized inputs: an age band, a
+severity band per symptom and how many days ago each symptom started, in a
+canonical order. Parsed analyses are cached under a fingerprint of those
+inputs and the prompt templates they are rendered into, so two checks share
+an entry exactly when they would send the same prompt, whoever made them.
+
+Entries live in the default Django cache (Redis when REDIS_URL is set) with a
+TTL. When Redis is unreachable the cache degrades to an in-process LRU so
+analyses keep working. Configure Redis with ``maxmemory-policy allkeys-lru``
+so it evicts the least recently used entries when full.
+"""
+import hashlib
+import json
+import logging
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'symptom-analysis:v3'
+
+
+def analysis_fingerprint(model, templates, inputs):
+    """
+    Build the cache key for a symptom analysis.
+
+    Args:
+        model: The model the prompt is sent to
+        templates: The prompt templates the inputs are rendered into
+        inputs: The normalized inputs the prompt is rendered from
+
+    Returns:
+        The cache key
+    """
+    payload = json.dumps({'model': model, 'templates': templates, 'inputs': inputs}, sort_keys=True)
+    return f'{KEY_PREFIX}:{hashlib.sha256(payload.encode()).hexdigest()}'
+
+
+class AnalysisCache:
+    """Analysis cache with hit/miss counters and an in-process fallback"""
+
+    def __init__(self):
+        self.local = LocMemCache('symptom-analysis', {
+            'TIMEOUT': settings.SYMPTOM_ANALYSIS_CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': settings.SYMPTOM_ANALYSIS_CACHE_MAX_ENTRIES},
+        })
+
+    @property
+    def shared(self):
+        return caches['default']
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.shared, method)(*args, **kwargs)
+        except ValueError:
+            # Raised by incr() for a missing key, not a backend failure
+            raise
+        except Exception as e:
+            logger.warning(f"Analysis cache unavailable, using in-process cache: {str(e)}")
+            return getattr(self.local, method)(*args, **kwargs)
+
+    def get(self, key):
+        """Return the cached analysis for ``key`` or None, counting the lookup"""
+        if key is None or not settings.SYMPTOM_ANALYSIS_CACHE_ENABLED:
+            return None
+        result = self._call('get', key)
+        self._count('hits' if result is not None else 'misses')
+        return result
+
+    def set(self, key, result):
+        if key is None or not settings.SYMPTOM_ANALYSIS_CACHE_ENABLED:
+            return
+        self._call('set', key, result, settings.SYMPTOM_ANALYSIS_CACHE_TIMEOUT)
+
+    def _count(self, name):
+        key = f'{KEY_PREFIX}:stats:{name}'
+        try:
+            self._call('incr', key)
+        except ValueError:
+            # First lookup since the counter was reset or evicted
+            if not self._call('add', key, 1, None):
+                self._call('incr', key)
+
+    def stats(self):
+        """Return the hit and miss counters"""
+        hits = self._call('get', f'{KEY_PREFIX}:stats:hits', 0)
+        misses = self._call('get', f'{KEY_PREFIX}:stats:misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self._call('delete_many', [f'{KEY_PREFIX}:stats:hits', f'{KEY_PREFIX}:stats:misses'])
+
+
+analysis_cache = AnalysisCache()
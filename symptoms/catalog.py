@@ -0,0 +1,211 @@
+"""
+Process-local snapshot of the symptom catalog.
+
+The Symptom table is small, read-mostly and read on every symptom list,
+every serialized user symptom and every analysis. Each process keeps an
+immutable CatalogSnapshot of it: the rows by id, and ids by lower-cased name
+and by body part. Structures derived from the catalog, such as the condition
+ranker and the typeahead index, hang off the snapshot and are replaced with
+it.
+
+Invalidation uses a version counter in the default cache (Redis when
+REDIS_URL is set). Symptom saves and deletes, and bulk loads through
+``populate_symptoms``, bump it once committed. Processes compare their
+snapshot's version with the counter at most every
+``SYMPTOM_CATALOG_VERSION_CHECK`` seconds and reload when it moved. The
+process making a change drops its own snapshot straight away. If the cache
+is unreachable, processes keep their current snapshot.
+"""
+import hashlib
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'symptom-catalog:version'
+
+# Fields of a catalog record, in SymptomSerializer order
+FIELDS = ('id', 'name', 'description', 'body_part', 'severity_scale', 'common_related_conditions')
+
+
+class CatalogSnapshot:
+    """
+    Immutable copy of the Symptom table.
+
+    Records are plain dictionaries shared by every reader; copy them before
+    changing anything.
+    """
+
+    def __init__(self, version, records):
+        """
+        Args:
+            version: Catalog version the records were loaded at
+            records: Iterable of dictionaries with the FIELDS of each symptom, ordered by id
+        """
+        self.version = version
+        self.records = {}
+        self.ids_by_name = {}
+        self.search_text = {}
+        ids_by_body_part = {}
+        digest = hashlib.sha256()
+        for record in records:
+            self.records[record['id']] = record
+            self.search_text[record['id']] = '\x00'.join(
+                (record['name'], record['description'], record['body_part'])
+            ).lower()
+            self.ids_by_name[record['name'].strip().lower()] = record['id']
+            ids_by_body_part.setdefault(record['body_part'], []).append(record['id'])
+            digest.update(repr(tuple(record[field] for field in FIELDS)).encode())
+        self.ids_by_body_part = {body_part: tuple(ids) for body_part, ids in ids_by_body_part.items()}
+        # Content hash, so processes that loaded the same rows share ETags
+        self.etag = digest.hexdigest()[:32]
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, symptom_id):
+        """Return the record of a symptom, or None"""
+        return self.records.get(symptom_id)
+
+    def get_by_name(self, name):
+        """Return the record of a symptom by case-insensitive name, or None"""
+        symptom_id = self.ids_by_name.get(name.strip().lower())
+        return self.records.get(symptom_id)
+
+    def instance(self, symptom_id):
+        """Return a new Symptom instance for a record, as if loaded from the database, or None"""
+        from .models import Symptom
+
+        record = self.records.get(symptom_id)
+        if record is None:
+            return None
+        values = [record[field] for field in FIELDS]
+        values[-1] = list(values[-1])  # common_related_conditions, so the shared record is never mutated
+        return Symptom.from_db(router.db_for_read(Symptom), list(FIELDS), values)
+
+    def filter(self, body_part=None, search=None):
+        """
+        Return the records matching the symptom list filters, ordered by id.
+
+        Args:
+            body_part: Exact body part, as the ``body_part`` filter
+            search: Search terms, as DRF's SearchFilter over name, description
+                and body part: every term must occur in one of them
+
+        Returns:
+            List of records
+        """
+        ids = self.ids_by_body_part.get(body_part, ()) if body_part else self.records.keys()
+        terms = [term.lower() for term in (search or '').replace('\x00', '').replace(',', ' ').split()]
+        if terms:
+            ids = [i for i in ids if all(term in self.search_text[i] for term in terms)]
+        return [self.records[i] for i in ids]
+
+    @cached_property
+    def ranker(self):
+        """Condition ranker built from this snapshot"""
+        from .ranker import SymptomRanker
+
+        return SymptomRanker(
+            (record['id'], record['name'], record['severity_scale'], record['common_related_conditions'])
+            for record in self.records.values()
+        )
+
+    @cached_property
+    def typeahead(self):
+        """Typeahead index built from this snapshot"""
+        from .typeahead import SymptomTypeahead
+
+        return SymptomTypeahead(self.records.values())
+
+
+_snapshot = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def current_version():
+    """
+    Return the shared catalog version, creating the counter if missing.
+
+    Returns:
+        The version, or None if the cache is unreachable
+    """
+    try:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, _initial_version(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+    except Exception as e:
+        logger.warning(f"Symptom catalog version unavailable: {str(e)}")
+        return None
+
+
+def _initial_version():
+    # A counter recreated after eviction starts past any version a process may hold
+    return int(time.time())
+
+
+def load_snapshot(version):
+    """Load a snapshot of the Symptom table"""
+    from .models import Symptom
+
+    return CatalogSnapshot(version, Symptom.objects.order_by('id').values(*FIELDS))
+
+
+def get_catalog():
+    """Return this process's catalog snapshot, reloading it when the shared version moved"""
+    global _snapshot, _checked_at
+    snapshot = _snapshot
+    now = time.monotonic()
+    if snapshot is not None and now - _checked_at < settings.SYMPTOM_CATALOG_VERSION_CHECK:
+        return snapshot
+
+    # Read the version before the rows, so a change committed in between triggers another reload
+    version = current_version()
+    with _lock:
+        if _snapshot is None or (version is not None and _snapshot.version != version):
+            _snapshot = load_snapshot(version if version is not None else 0)
+        _checked_at = now
+        return _snapshot
+
+
+def bump_version():
+    """Move the shared catalog version so every process reloads"""
+    try:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            if not cache.add(VERSION_KEY, _initial_version(), None):
+                cache.incr(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Unable to bump the symptom catalog version: {str(e)}")
+
+
+def invalidate():
+    """
+    Drop this process's snapshot now and bump the shared version once the
+    current transaction commits.
+    """
+    global _snapshot
+    _snapshot = None
+    transaction.on_commit(bump_version)
+
+
+def attach_symptoms(user_symptoms):
+    """
+    Set ``symptom`` on UserSymptom instances from the catalog instead of
+    querying it. Symptoms missing from the snapshot are left to load lazily.
+    """
+    catalog = get_catalog()
+    for user_symptom in user_symptoms:
+        symptom = catalog.instance(user_symptom.symptom_id)
+        if symptom is not None:
+            user_symptom.symptom = symptom
+    return user_symptoms
@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from symptoms.typeahead import SymptomTypeahead
+
+MODIFIERS = ['Acute', 'Chronic', 'Intermittent', 'Persistent', 'Sudden', 'Recurrent', 'Mild', 'Severe',
+             'Sharp', 'Dull', 'Burning', 'Throbbing', 'Stabbing', 'Radiating', 'Nocturnal', 'Exertional',
+             'Postprandial', 'Morning', 'Positional', 'Cyclic', 'Episodic', 'Progressive', 'Localized',
+             'Diffuse', 'Bilateral', 'Unilateral', 'Migrating', 'Cramping', 'Aching', 'Pulsating']
+SITES = ['Head', 'Neck', 'Chest', 'Back', 'Abdominal', 'Pelvic', 'Shoulder', 'Elbow', 'Wrist', 'Hand',
+         'Hip', 'Knee', 'Ankle', 'Foot', 'Jaw', 'Ear', 'Eye', 'Throat', 'Flank', 'Groin', 'Calf', 'Thigh',
+         'Scalp', 'Sinus', 'Rib', 'Heel', 'Toe', 'Finger', 'Forearm', 'Tongue', 'Lip', 'Gum', 'Nasal',
+         'Rectal', 'Bladder', 'Kidney', 'Liver', 'Stomach', 'Lung', 'Heart']
+BASES = ['Pain', 'Swelling', 'Numbness', 'Tingling', 'Weakness', 'Stiffness', 'Tenderness', 'Itching',
+         'Rash', 'Bruising', 'Bleeding', 'Cramps', 'Spasms', 'Pressure', 'Discomfort', 'Burning', 'Redness',
+         'Warmth', 'Coldness', 'Tremor', 'Headache', 'Palpitations', 'Dizziness', 'Nausea', 'Fatigue',
+         'Fever', 'Cough', 'Wheezing', 'Congestion', 'Discharge', 'Ulcer', 'Lump', 'Blister', 'Sensitivity',
+         'Twitching', 'Clicking', 'Locking', 'Instability', 'Heaviness', 'Soreness', 'Hoarseness',
+         'Dryness', 'Flushing', 'Sweating', 'Chills', 'Insomnia', 'Vertigo', 'Fainting', 'Confusion', 'Anxiety']
+
+class Command(BaseCommand):
+    help = 'Builds the symptom typeahead over a synthetic catalog and reports suggestion latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50000, help='Number of synthetic symptoms')
+        parser.add_argument('--queries', type=int, default=2000, help='Queries to time per query type')
+        parser.add_argument('--limit', type=int, default=settings.SYMPTOM_TYPEAHEAD_LIMIT, help='Suggestions per query')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated catalog')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        records = self.generate(rng, options['count'])
+        names = [record['name'] for record in records]
+
+        started = time.perf_counter()
+        typeahead = SymptomTypeahead(records)
+        self.stdout.write(f'Built the typeahead over {len(typeahead)} symptoms in {time.perf_counter() - started:.2f}s')
+
+        queries = {
+            'first letter': lambda: rng.choice(names)[:1],
+            'name prefix': lambda: rng.choice(names)[:rng.randint(3, 8)],
+            'later word': lambda: rng.choice(names).split()[-1][:rng.randint(2, 6)],
+            'full name': lambda: rng.choice(names),
+            'typo': lambda: self.misspell(rng, rng.choice(BASES)),
+            'no match': lambda: 'zzqx',
+        }
+        limit = options['limit']
+        self.stdout.write(f'Timing {options["queries"]} queries per type, {limit} suggestions each')
+        for name, make_query in queries.items():
+            timings = []
+            for _ in range(options['queries']):
+                query = make_query()
+                started = time.perf_counter()
+                typeahead.suggest(query, limit, settings.SYMPTOM_TYPEAHEAD_MIN_SIMILARITY)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            p50, p95 = self.percentile(timings, 50), self.percentile(timings, 95)
+            self.stdout.write(f'{name:<14} p50 {p50:7.3f} ms   p95 {p95:7.3f} ms   max {max(timings):7.3f} ms')
+
+    def generate(self, rng, count):
+        """Return ``count`` catalog records with unique names"""
+        names = {f'{modifier} {site} {base}' for modifier in MODIFIERS for site in SITES for base in BASES}
+        names = sorted(names)
+        rng.shuffle(names)
+        suffix = 2
+        while len(names) < count:
+            # More symptoms than combinations: number another round
+            names.extend(f'{name} {suffix}' for name in names[:count - len(names)])
+            suffix += 1
+        return [
+            {'id': i + 1, 'name': name, 'description': '', 'body_part': name.split()[1],
+             'severity_scale': rng.randint(1, 10), 'common_related_conditions': []}
+            for i, name in enumerate(names[:count])
+        ]
+
+    @staticmethod
+    def misspell(rng, word):
+        """Drop, double or swap one letter of ``word``"""
+        i = rng.randrange(1, len(word) - 1)
+        edit = rng.choice(['drop', 'double', 'swap'])
+        if edit == 'drop':
+            return word[:i] + word[i + 1:]
+        if edit == 'double':
+            return word[:i] + word[i] + word[i:]
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+    @staticmethod
+    def percentile(values, percent):
+        if len(values) < 2:
+            return values[0]
+        return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
@@ -1,161 +1,374 @@
-from django.core.management.base import BaseCommand
+import csv
+import gzip
+import itertools
+import json
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from symptoms.catalog import invalidate
 from symptoms.models import Symptom
 
+# Loaded columns besides ``name``, the natural key rows are matched on
+UPDATE_FIELDS = ['description', 'body_part', 'severity_scale', 'common_related_conditions']
+
+# Invalid rows listed in the report; the rest are only counted
+MAX_ERRORS_SHOWN = 10
+
+DEFAULT_SYMPTOMS = [
+    {
+        'name': 'Headache',
+        'description': 'Pain in the head or upper neck area',
+        'body_part': 'Head',
+        'severity_scale': 5,
+        'common_related_conditions': ['Migraine', 'Tension Headache', 'Sinusitis']
+    },
+    {
+        'name': 'Fever',
+        'description': 'Elevated body temperature above normal range',
+        'body_part': 'Whole Body',
+        'severity_scale': 6,
+        'common_related_conditions': ['Influenza', 'Common Cold', 'COVID-19']
+    },
+    {
+        'name': 'Cough',
+        'description': 'Sudden expulsion of air from the lungs',
+        'body_part': 'Chest',
+        'severity_scale': 4,
+        'common_related_conditions': ['Bronchitis', 'Common Cold', 'Asthma']
+    },
+    {
+        'name': 'Chest Pain',
+        'description': 'Pain or discomfort in the chest area',
+        'body_part': 'Chest',
+        'severity_scale': 8,
+        'common_related_conditions': ['Angina', 'Heart Attack', 'Pleurisy']
+    },
+    {
+        'name': 'Shortness of Breath',
+        'description': 'Difficulty breathing or feeling breathless',
+        'body_part': 'Chest',
+        'severity_scale': 7,
+        'common_related_conditions': ['Asthma', 'Pneumonia', 'Heart Failure']
+    },
+    {
+        'name': 'Abdominal Pain',
+        'description': 'Pain in the stomach or abdominal area',
+        'body_part': 'Abdomen',
+        'severity_scale': 6,
+        'common_related_conditions': ['Gastritis', 'Appendicitis', 'Irritable Bowel Syndrome']
+    },
+    {
+        'name': 'Nausea',
+        'description': 'Feeling of sickness with an inclination to vomit',
+        'body_part': 'Stomach',
+        'severity_scale': 5,
+        'common_related_conditions': ['Food Poisoning', 'Migraine', 'Motion Sickness']
+    },
+    {
+        'name': 'Dizziness',
+        'description': 'Feeling of lightheadedness or unsteadiness',
+        'body_part': 'Head',
+        'severity_scale': 5,
+        'common_related_conditions': ['Vertigo', 'Low Blood Pressure', 'Dehydration']
+    },
+    {
+        'name': 'Fatigue',
+        'description': 'Extreme tiredness or lack of energy',
+        'body_part': 'Whole Body',
+        'severity_scale': 4,
+        'common_related_conditions': ['Anemia', 'Chronic Fatigue Syndrome', 'Depression']
+    },
+    {
+        'name': 'Joint Pain',
+        'description': 'Pain or discomfort in the joints',
+        'body_part': 'Joints',
+        'severity_scale': 5,
+        'common_related_conditions': ['Arthritis', 'Rheumatoid Arthritis', 'Gout']
+    },
+    {
+        'name': 'Muscle Pain',
+        'description': 'Pain or discomfort in the muscles',
+        'body_part': 'Muscles',
+        'severity_scale': 4,
+        'common_related_conditions': ['Fibromyalgia', 'Muscle Strain', 'Influenza']
+    },
+    {
+        'name': 'Rash',
+        'description': 'Change in skin texture or color',
+        'body_part': 'Skin',
+        'severity_scale': 4,
+        'common_related_conditions': ['Allergic Reaction', 'Eczema', 'Psoriasis']
+    },
+    {
+        'name': 'Sore Throat',
+        'description': 'Pain or irritation in the throat',
+        'body_part': 'Throat',
+        'severity_scale': 4,
+        'common_related_conditions': ['Strep Throat', 'Common Cold', 'Tonsillitis']
+    },
+    {
+        'name': 'Runny Nose',
+        'description': 'Excessive nasal discharge',
+        'body_part': 'Nose',
+        'severity_scale': 3,
+        'common_related_conditions': ['Common Cold', 'Allergies', 'Sinusitis']
+    },
+    {
+        'name': 'Back Pain',
+        'description': 'Pain in the back area',
+        'body_part': 'Back',
+        'severity_scale': 6,
+        'common_related_conditions': ['Muscle Strain', 'Herniated Disc', 'Sciatica']
+    },
+    {
+        'name': 'Insomnia',
+        'description': 'Difficulty falling or staying asleep',
+        'body_part': 'Whole Body',
+        'severity_scale': 5,
+        'common_related_conditions': ['Anxiety', 'Depression', 'Sleep Apnea']
+    },
+    {
+        'name': 'Anxiety',
+        'description': 'Feeling of worry, nervousness, or unease',
+        'body_part': 'Whole Body',
+        'severity_scale': 6,
+        'common_related_conditions': ['Generalized Anxiety Disorder', 'Panic Disorder', 'Depression']
+    },
+    {
+        'name': 'Diarrhea',
+        'description': 'Frequent loose or watery bowel movements',
+        'body_part': 'Abdomen',
+        'severity_scale': 5,
+        'common_related_conditions': ['Food Poisoning', 'Irritable Bowel Syndrome', 'Gastroenteritis']
+    },
+    {
+        'name': 'Constipation',
+        'description': 'Difficulty in passing stools',
+        'body_part': 'Abdomen',
+        'severity_scale': 4,
+        'common_related_conditions': ['Irritable Bowel Syndrome', 'Dehydration', 'Hypothyroidism']
+    },
+    {
+        'name': 'Blurred Vision',
+        'description': 'Lack of sharpness of vision',
+        'body_part': 'Eyes',
+        'severity_scale': 6,
+        'common_related_conditions': ['Migraine', 'Diabetes', 'Glaucoma']
+    }
+]
+
+
+class InvalidRow(ValueError):
+    """Raised for input rows that cannot be loaded"""
+
+
+def parse_conditions(value):
+    """
+    Parse related conditions from a list, a JSON array, or a string separated by | or ;
+    """
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise InvalidRow('common_related_conditions is not a valid JSON array')
+        else:
+            value = value.replace(';', '|').split('|')
+    if not isinstance(value, list):
+        raise InvalidRow('common_related_conditions must be a list')
+    return [str(condition).strip() for condition in value if str(condition).strip()]
+
+
+def clean_row(row):
+    """
+    Validate an input row.
+
+    Args:
+        row: Dictionary read from CSV or JSONL
+
+    Returns:
+        Tuple of (name, dictionary of the UPDATE_FIELDS values)
+
+    Raises:
+        InvalidRow: If the row cannot be loaded
+    """
+    if not isinstance(row, dict):
+        raise InvalidRow('row must be an object')
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise InvalidRow('name is required')
+    if len(name) > Symptom._meta.get_field('name').max_length:
+        raise InvalidRow('name is too long')
+    body_part = str(row.get('body_part') or '').strip()
+    if len(body_part) > Symptom._meta.get_field('body_part').max_length:
+        raise InvalidRow('body_part is too long')
+
+    severity_scale = row.get('severity_scale')
+    try:
+        severity_scale = int(severity_scale) if severity_scale not in (None, '') else 1
+    except (TypeError, ValueError):
+        raise InvalidRow('severity_scale must be a number')
+    if not 1 <= severity_scale <= 10:
+        raise InvalidRow('severity_scale must be between 1 and 10')
+
+    return name, {
+        'description': str(row.get('description') or '').strip(),
+        'body_part': body_part,
+        'severity_scale': severity_scale,
+        'common_related_conditions': parse_conditions(row.get('common_related_conditions')),
+    }
+
+
+def read_rows(file, input_format):
+    """Yield ``(line number, row)`` pairs from a CSV or JSONL file; unparsable lines yield an InvalidRow"""
+    if input_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, InvalidRow('invalid JSON')
+
+
 class Command(BaseCommand):
-    help = 'Populates the database with predefined symptoms'
-
-    def handle(self, *args, **kwargs):
-        symptoms_data = [
-            {
-                'name': 'Headache',
-                'description': 'Pain in the head or upper neck area',
-                'body_part': 'Head',
-                'severity_scale': 5,
-                'common_related_conditions': ['Migraine', 'Tension Headache', 'Sinusitis']
-            },
-            {
-                'name': 'Fever',
-                'description': 'Elevated body temperature above normal range',
-                'body_part': 'Whole Body',
-                'severity_scale': 6,
-                'common_related_conditions': ['Influenza', 'Common Cold', 'COVID-19']
-            },
-            {
-                'name': 'Cough',
-                'description': 'Sudden expulsion of air from the lungs',
-                'body_part': 'Chest',
-                'severity_scale': 4,
-                'common_related_conditions': ['Bronchitis', 'Common Cold', 'Asthma']
-            },
-            {
-                'name': 'Chest Pain',
-                'description': 'Pain or discomfort in the chest area',
-                'body_part': 'Chest',
-                'severity_scale': 8,
-                'common_related_conditions': ['Angina', 'Heart Attack', 'Pleurisy']
-            },
-            {
-                'name': 'Shortness of Breath',
-                'description': 'Difficulty breathing or feeling breathless',
-                'body_part': 'Chest',
-                'severity_scale': 7,
-                'common_related_conditions': ['Asthma', 'Pneumonia', 'Heart Failure']
-            },
-            {
-                'name': 'Abdominal Pain',
-                'description': 'Pain in the stomach or abdominal area',
-                'body_part': 'Abdomen',
-                'severity_scale': 6,
-                'common_related_conditions': ['Gastritis', 'Appendicitis', 'Irritable Bowel Syndrome']
-            },
-            {
-                'name': 'Nausea',
-                'description': 'Feeling of sickness with an inclination to vomit',
-                'body_part': 'Stomach',
-                'severity_scale': 5,
-                'common_related_conditions': ['Food Poisoning', 'Migraine', 'Motion Sickness']
-            },
-            {
-                'name': 'Dizziness',
-                'description': 'Feeling of lightheadedness or unsteadiness',
-                'body_part': 'Head',
-                'severity_scale': 5,
-                'common_related_conditions': ['Vertigo', 'Low Blood Pressure', 'Dehydration']
-            },
-            {
-                'name': 'Fatigue',
-                'description': 'Extreme tiredness or lack of energy',
-                'body_part': 'Whole Body',
-                'severity_scale': 4,
-                'common_related_conditions': ['Anemia', 'Chronic Fatigue Syndrome', 'Depression']
-            },
-            {
-                'name': 'Joint Pain',
-                'description': 'Pain or discomfort in the joints',
-                'body_part': 'Joints',
-                'severity_scale': 5,
-                'common_related_conditions': ['Arthritis', 'Rheumatoid Arthritis', 'Gout']
-            },
-            {
-                'name': 'Muscle Pain',
-                'description': 'Pain or discomfort in the muscles',
-                'body_part': 'Muscles',
-                'severity_scale': 4,
-                'common_related_conditions': ['Fibromyalgia', 'Muscle Strain', 'Influenza']
-            },
-            {
-                'name': 'Rash',
-                'description': 'Change in skin texture or color',
-                'body_part': 'Skin',
-                'severity_scale': 4,
-                'common_related_conditions': ['Allergic Reaction', 'Eczema', 'Psoriasis']
-            },
-            {
-                'name': 'Sore Throat',
-                'description': 'Pain or irritation in the throat',
-                'body_part': 'Throat',
-                'severity_scale': 4,
-                'common_related_conditions': ['Strep Throat', 'Common Cold', 'Tonsillitis']
-            },
-            {
-                'name': 'Runny Nose',
-                'description': 'Excessive nasal discharge',
-                'body_part': 'Nose',
-                'severity_scale': 3,
-                'common_related_conditions': ['Common Cold', 'Allergies', 'Sinusitis']
-            },
-            {
-                'name': 'Back Pain',
-                'description': 'Pain in the back area',
-                'body_part': 'Back',
-                'severity_scale': 6,
-                'common_related_conditions': ['Muscle Strain', 'Herniated Disc', 'Sciatica']
-            },
-            {
-                'name': 'Insomnia',
-                'description': 'Difficulty falling or staying asleep',
-                'body_part': 'Whole Body',
-                'severity_scale': 5,
-                'common_related_conditions': ['Anxiety', 'Depression', 'Sleep Apnea']
-            },
-            {
-                'name': 'Anxiety',
-                'description': 'Feeling of worry, nervousness, or unease',
-                'body_part': 'Whole Body',
-                'severity_scale': 6,
-                'common_related_conditions': ['Generalized Anxiety Disorder', 'Panic Disorder', 'Depression']
-            },
-            {
-                'name': 'Diarrhea',
-                'description': 'Frequent loose or watery bowel movements',
-                'body_part': 'Abdomen',
-                'severity_scale': 5,
-                'common_related_conditions': ['Food Poisoning', 'Irritable Bowel Syndrome', 'Gastroenteritis']
-            },
-            {
-                'name': 'Constipation',
-                'description': 'Difficulty in passing stools',
-                'body_part': 'Abdomen',
-                'severity_scale': 4,
-                'common_related_conditions': ['Irritable Bowel Syndrome', 'Dehydration', 'Hypothyroidism']
-            },
-            {
-                'name': 'Blurred Vision',
-                'description': 'Lack of sharpness of vision',
-                'body_part': 'Eyes',
-                'severity_scale': 6,
-                'common_related_conditions': ['Migraine', 'Diabetes', 'Glaucoma']
-            }
-        ]
-
-        created_count = 0
-        for symptom_data in symptoms_data:
-            symptom, created = Symptom.objects.get_or_create(
-                name=symptom_data['name'],
-                defaults=symptom_data
+    help = 'Loads symptoms from CSV or JSONL files (or the built-in list), upserting them by name in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*',
+                            help='CSV or JSONL files, optionally gzipped; "-" reads standard input. '
+                                 'Loads the built-in symptoms when omitted')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows upserted per statement')
+        parser.add_argument('--no-update', action='store_true', help='Only insert new symptoms; leave existing ones unchanged')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        self.options = options
+        self.stats = dict.fromkeys(['read', 'created', 'updated', 'unchanged', 'duplicate', 'invalid'], 0)
+        self.errors = []
+        started = time.perf_counter()
+
+        if options['files']:
+            for path in options['files']:
+                with self.open(path) as file:
+                    self.load(path, read_rows(file, self.input_format(path)))
+        else:
+            self.load('built-in symptoms', enumerate(DEFAULT_SYMPTOMS, 1))
+
+        changed = self.stats['created'] + self.stats['updated']
+        if changed and not options['dry_run']:
+            # bulk_create sends no signals: have every process reload its catalog snapshot
+            invalidate()
+
+        self.report(time.perf_counter() - started)
+
+    def input_format(self, path):
+        if self.options['format']:
+            return self.options['format']
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.jsonl', '.ndjson', '.json')):
+            return 'jsonl'
+        raise CommandError(f'Cannot tell the format of {path}; pass --format')
+
+    def open(self, path):
+        if path == '-':
+            return open(sys.stdin.fileno(), 'r', encoding='utf-8-sig', newline='', closefd=False)
+        try:
+            if path.endswith('.gz'):
+                return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+            return open(path, 'r', encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def load(self, source, rows):
+        """Upsert rows batch by batch, so memory use does not grow with the input"""
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.options['batch_size']))
+            if not batch:
+                return
+            self.load_batch(source, batch)
+            if self.options['verbosity'] >= 2:
+                self.stdout.write(f'{source}: {self.stats["read"]} rows read')
+
+    def load_batch(self, source, batch):
+        symptoms = {}
+        for line_number, row in batch:
+            self.stats['read'] += 1
+            try:
+                if isinstance(row, InvalidRow):
+                    raise row
+                name, values = clean_row(row)
+            except InvalidRow as e:
+                self.stats['invalid'] += 1
+                if len(self.errors) < MAX_ERRORS_SHOWN:
+                    self.errors.append(f'{source}, line {line_number}: {e}')
+                continue
+            if name in symptoms:
+                # The last occurrence wins; one upsert cannot touch a row twice
+                self.stats['duplicate'] += 1
+            symptoms[name] = values
+
+        existing = {
+            row[0]: dict(zip(UPDATE_FIELDS, row[1:]))
+            for row in Symptom.objects.filter(name__in=list(symptoms)).values_list('name', *UPDATE_FIELDS)
+        }
+        to_write = []
+        for name, values in symptoms.items():
+            current = existing.get(name)
+            if current is None:
+                self.stats['created'] += 1
+                self.log_change('+', name)
+            elif self.options['no_update'] or current == values:
+                self.stats['unchanged'] += 1
+                continue
+            else:
+                self.stats['updated'] += 1
+                self.log_change('~', name, [field for field in UPDATE_FIELDS if current[field] != values[field]])
+            to_write.append(Symptom(name=name, **values))
+
+        if not to_write or self.options['dry_run']:
+            return
+        if self.options['no_update']:
+            Symptom.objects.bulk_create(to_write, ignore_conflicts=True)
+        else:
+            Symptom.objects.bulk_create(
+                to_write, update_conflicts=True, unique_fields=['name'], update_fields=UPDATE_FIELDS
             )
-            if created:
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(f'Created symptom: {symptom.name}'))
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully created {created_count} new symptoms')) 
\ No newline at end of file
+    def log_change(self, marker, name, fields=None):
+        if self.options['verbosity'] >= 3:
+            changed = f' ({", ".join(fields)})' if fields else ''
+            self.stdout.write(f'{marker} {name}{changed}')
+
+    def report(self, elapsed):
+        stats = self.stats
+        for error in self.errors:
+            self.stderr.write(error)
+        if stats['invalid'] > len(self.errors):
+            self.stderr.write(f'... and {stats["invalid"] - len(self.errors)} more invalid rows')
+
+        rate = stats['read'] / elapsed if elapsed else 0
+        prefix = 'Dry run: would have ' if self.options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}created {stats["created"]}, updated {stats["updated"]}, left {stats["unchanged"]} unchanged'
+        ))
+        self.stdout.write(
+            f'Read {stats["read"]} rows in {elapsed:.2f}s ({rate:,.0f} rows/s); '
+            f'{stats["duplicate"]} duplicates, {stats["invalid"]} invalid'
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from symptoms.cache import analysis_cache
+
+class Command(BaseCommand):
+    help = 'Shows hit/miss counters for the symptom analysis cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = analysis_cache.stats()
+        self.stdout.write(f"Hits: {stats['hits']}")
+        self.stdout.write(f"Misses: {stats['misses']}")
+        self.stdout.write(f"Hit ratio: {stats['hit_ratio']:.1%}")
+
+        if options['reset']:
+            analysis_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+def mark_existing_checks_done(apps, schema_editor):
+    # Checks created before the async flow were analyzed inline
+    SymptomCheck = apps.get_model('symptoms', 'SymptomCheck')
+    SymptomCheck.objects.update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('symptoms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='symptomcheck',
+            name='analysis_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='symptomcheck',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='symptomcheck',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='symptomcheck',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_checks_done, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('symptoms', '0003_symptomcheckbatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='symptomcheck',
+            index=models.Index(fields=['user', 'created_at'], name='symptomcheck_user_created_idx'),
+        ),
+    ]
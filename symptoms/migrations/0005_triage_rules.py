@@ -0,0 +1,69 @@
+# Generated by Django 4.2.10 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+# (name, symptom_names, body_part, min_severity, min_age, max_age, reason)
+DEFAULT_RULES = [
+    ('Severe chest pain', ['Chest Pain'], '', 7, None, None,
+     'Severe chest pain can be a sign of a heart attack. Call emergency services.'),
+    ('Chest pain with breathlessness', ['Chest Pain', 'Shortness of Breath'], '', 5, None, None,
+     'Chest pain with shortness of breath needs urgent assessment. Call emergency services.'),
+    ('Severe shortness of breath', ['Shortness of Breath'], '', 8, None, None,
+     'Severe difficulty breathing needs emergency care.'),
+    ('Fever in an infant', ['Fever'], '', None, None, 0,
+     'Fever in a baby under one year old needs to be seen by a doctor today.'),
+    ('Very high fever', ['Fever'], '', 9, None, None,
+     'A very high fever needs urgent medical attention.'),
+    ('Sudden severe head symptoms', [], 'Head', 9, None, None,
+     'A sudden, severe headache or dizziness can be a sign of a stroke. Call emergency services.'),
+    ('Severe abdominal pain', ['Abdominal Pain'], '', 9, None, None,
+     'Severe abdominal pain needs urgent medical attention.'),
+    ('Sudden vision loss', ['Blurred Vision'], '', 8, None, None,
+     'Sudden severe vision problems can be a sign of a stroke. Seek emergency care.'),
+    ('Emergency severity', [], '', 10, None, None,
+     'You rated a symptom as an emergency. Call emergency services if you are in danger.'),
+]
+
+
+def create_default_rules(apps, schema_editor):
+    TriageRule = apps.get_model('symptoms', 'TriageRule')
+    TriageRule.objects.bulk_create([
+        TriageRule(name=name, symptom_names=symptom_names, body_part=body_part, min_severity=min_severity,
+                   min_age=min_age, max_age=max_age, reason=reason)
+        for name, symptom_names, body_part, min_severity, min_age, max_age, reason in DEFAULT_RULES
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('symptoms', '0004_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TriageRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('symptom_names', models.JSONField(blank=True, default=list, help_text='Symptoms that must all be present')),
+                ('body_part', models.CharField(blank=True, max_length=50)),
+                ('min_severity', models.PositiveIntegerField(blank=True, help_text='Lowest severity (1-10) that matches', null=True)),
+                ('min_age', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_age', models.PositiveIntegerField(blank=True, null=True)),
+                ('reason', models.CharField(help_text='Shown to the patient when the rule matches', max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='symptomcheck',
+            name='triage_reasons',
+            field=models.JSONField(blank=True, default=list, help_text='Reasons of the triage rules that flagged the check'),
+        ),
+        migrations.RunPython(create_default_rules, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
@@ -13,6 +15,43 @@ class Symptom(models.Model):
     def __str__(self):
         return self.name
 
+@receiver([post_save, post_delete], sender=Symptom)
+def invalidate_symptom_catalog(sender, **kwargs):
+    """Reload the catalog snapshot, and everything built from it, in every process"""
+    from .catalog import invalidate
+    invalidate()
+
+class TriageRule(models.Model):
+    """
+    Rule flagging a symptom check as an emergency before it is analyzed.
+    
+    A rule matches when the check has every listed symptom, has a symptom of
+    ``body_part`` if set, one of those symptoms (or any symptom, when neither
+    is set) reaches ``min_severity``, and the patient's age is in range.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    symptom_names = models.JSONField(default=list, blank=True, help_text="Symptoms that must all be present")
+    body_part = models.CharField(max_length=50, blank=True)
+    min_severity = models.PositiveIntegerField(null=True, blank=True, help_text="Lowest severity (1-10) that matches")
+    min_age = models.PositiveIntegerField(null=True, blank=True)
+    max_age = models.PositiveIntegerField(null=True, blank=True)
+    reason = models.CharField(max_length=255, help_text="Shown to the patient when the rule matches")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return self.name
+
+@receiver([post_save, post_delete], sender=TriageRule)
+def reset_triage_engine(sender, **kwargs):
+    """Recompile this process's triage engine from the changed rules"""
+    from .triage import reset_engine
+    reset_engine()
+
 class UserSymptom(models.Model):
     """Model for tracking a user's specific symptom instance"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='symptoms')
@@ -46,9 +85,23 @@ class UserSymptom(models.Model):
     def __str__(self):
         return f"{self.user.full_name} - {self.symptom.name} (Severity: {self.severity})"
 
+class SymptomCheckBatch(models.Model):
+    """Model for a bulk upload of symptom checks analyzed together"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='symptom_check_batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Symptom Check Batch"
+        verbose_name_plural = "Symptom Check Batches"
+    
+    def __str__(self):
+        return f"Symptom Check Batch {self.id} for {self.user.full_name}"
+
 class SymptomCheck(models.Model):
     """Model for symptom checking sessions with results"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='symptom_checks')
+    batch = models.ForeignKey(SymptomCheckBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='checks')
     symptoms = models.ManyToManyField(UserSymptom, related_name='check_sessions')
     
     # Additional questions and responses
@@ -62,13 +115,61 @@ class SymptomCheck(models.Model):
     
     recommendations = models.TextField(blank=True)
     emergency_level = models.BooleanField(default=False, help_text="Whether this requires emergency attention")
+    triage_reasons = models.JSONField(default=list, blank=True,
+                                      help_text="Reasons of the triage rules that flagged the check")
+    
+    # Analysis lifecycle
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, _('Queued')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+    # Allowed moves between analysis states
+    TRANSITIONS = {
+        STATUS_QUEUED: [STATUS_RUNNING, STATUS_FAILED],
+        STATUS_RUNNING: [STATUS_DONE, STATUS_FAILED],
+        STATUS_DONE: [],
+        STATUS_FAILED: [STATUS_QUEUED],
+    }
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    analysis_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='symptomcheck_user_created_idx'),
+        ]
         verbose_name = "Symptom Check"
         verbose_name_plural = "Symptom Checks"
     
     def __str__(self):
         return f"Symptom Check for {self.user.full_name} on {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+    
+    def transition(self, new_status, **fields):
+        """
+        Move the check to ``new_status`` if that is allowed from its current
+        state in the database. The check-and-set is a single UPDATE, so only
+        one worker can claim a queued check.
+        
+        Returns True if the transition happened.
+        """
+        sources = [source for source, targets in self.TRANSITIONS.items() if new_status in targets]
+        updated = SymptomCheck.objects.filter(pk=self.pk, status__in=sources).update(status=new_status, **fields)
+        if updated:
+            self.status = new_status
+            for name, value in fields.items():
+                setattr(self, name, value)
+        return bool(updated)
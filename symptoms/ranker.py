@@ -0,0 +1,174 @@
+"""
+Local symptom-to-condition ranking from the Symptom catalog.
+
+Each symptom's ``common_related_conditions`` becomes a row of a sparse
+symptom x condition matrix, stored as CSR arrays (``indptr``, ``indices``,
+``weights``). A condition's weight in a row decays with its position in the
+list, since the catalog lists the most common conditions first.
+
+A check is scored by gathering the rows of its symptoms with NumPy and summing
+them per condition, each row scaled by the symptom's query weight: the
+geometric mean of the user's severity and the symptom's ``severity_scale``,
+both out of 10. The score is divided by the total query weight, so it is the
+fraction of the presentation a condition explains and doubles as the match
+percentage. Only the conditions the check touches are scored, so ranking
+takes microseconds whatever the size of the catalog.
+
+The ranker is built lazily from the process's catalog snapshot
+(symptoms.catalog) and replaced with it.
+"""
+import numpy as np
+
+# Weight of the n-th listed condition: 1, 0.8, 0.67, 0.57, ...
+POSITION_DECAY = 0.25
+
+# Lower bounds of the match percentage for each confidence level
+CONFIDENCE_LEVELS = [(70, 'high'), (40, 'medium'), (0, 'low')]
+
+
+class SymptomRanker:
+    """Immutable ranking index over a snapshot of the symptom catalog"""
+
+    def __init__(self, symptoms):
+        """
+        Args:
+            symptoms: Iterable of (id, name, severity_scale, common_related_conditions)
+        """
+        self.rows = {}
+        self.names = []
+        conditions = {}
+        condition_names = []
+        indptr = [0]
+        indices = []
+        weights = []
+        severity_scales = []
+
+        for symptom_id, name, severity_scale, related in symptoms:
+            seen = set()
+            for position, condition in enumerate(related or []):
+                if not isinstance(condition, str) or not condition.strip():
+                    continue
+                key = ' '.join(condition.lower().split())
+                if key in seen:
+                    continue
+                seen.add(key)
+                if key not in conditions:
+                    conditions[key] = len(condition_names)
+                    condition_names.append(condition.strip())
+                indices.append(conditions[key])
+                weights.append(1 / (1 + POSITION_DECAY * position))
+            self.rows[symptom_id] = len(self.names)
+            self.names.append(name)
+            severity_scales.append(min(max(severity_scale or 1, 1), 10))
+            indptr.append(len(indices))
+
+        self.conditions = condition_names
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float64)
+        self.severity_scales = np.array(severity_scales, dtype=np.float64)
+        # Symptoms linked to each condition; rarer links are more specific
+        self.frequency = np.bincount(self.indices, minlength=len(condition_names))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def score(self, symptoms):
+        """
+        Score the conditions linked to a set of symptoms.
+
+        Args:
+            symptoms: Iterable of (symptom_id, user_severity) pairs
+
+        Returns:
+            Tuple of (condition indices, scores between 0 and 1)
+        """
+        columns, scores, _, _ = self._score(symptoms)
+        return columns, scores
+
+    def _score(self, symptoms):
+        # Also returns the known symptoms' rows and, per gathered entry, its
+        # column's position in ``columns`` and the symptom it came from
+        rows = []
+        severities = []
+        for symptom_id, severity in symptoms:
+            row = self.rows.get(symptom_id)
+            if row is not None:
+                rows.append(row)
+                severities.append(severity)
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, np.empty(0), empty, (empty, empty)
+
+        rows = np.array(rows, dtype=np.int64)
+        severities = np.clip(np.array(severities, dtype=np.float64), 1, 10)
+        query = np.sqrt(severities * self.severity_scales[rows]) / 10
+
+        # Gather the CSR entries of every row without a Python loop
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(lengths.sum())
+
+        columns, inverse = np.unique(self.indices[positions], return_inverse=True)
+        scores = np.bincount(inverse, weights=self.weights[positions] * np.repeat(query, lengths))
+        entries = (inverse, np.repeat(np.arange(len(rows)), lengths))
+        return columns, scores / query.sum(), rows, entries
+
+    def rank(self, symptoms, limit=5):
+        """
+        Rank candidate conditions for a set of symptoms.
+
+        Args:
+            symptoms: Iterable of (symptom_id, user_severity) pairs
+            limit: Number of conditions to return
+
+        Returns:
+            List of conditions in the ``possible_conditions`` format, best first
+        """
+        columns, scores, rows, (inverse, entry_symptoms) = self._score(symptoms)
+        if not len(columns) or limit <= 0:
+            return []
+
+        # Ties go to the condition fewer symptoms point at
+        keys = scores + 1e-6 / self.frequency[columns]
+        if len(keys) > limit:
+            top = np.argpartition(-keys, limit - 1)[:limit]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(-keys[top], kind='stable')]
+
+        results = []
+        for i in top:
+            match = int(round(min(scores[i], 1.0) * 100))
+            supporting = [self.names[rows[j]] for j in entry_symptoms[inverse == i]]
+            results.append({
+                "condition": self.conditions[columns[i]],
+                "confidence": next(label for lower, label in CONFIDENCE_LEVELS if match >= lower),
+                "match_percentage": match,
+                "description": f"Commonly associated with {', '.join(supporting)}",
+            })
+        return results
+
+
+def get_ranker():
+    """Return the ranker of this process's catalog snapshot"""
+    from .catalog import get_catalog
+
+    return get_catalog().ranker
+
+
+def rank_user_symptoms(user_symptoms, limit=5):
+    """
+    Rank candidate conditions for a check's symptoms.
+
+    Args:
+        user_symptoms: UserSymptom instances
+        limit: Number of conditions to return
+
+    Returns:
+        List of conditions in the ``possible_conditions`` format
+    """
+    return get_ranker().rank(
+        [(user_symptom.symptom_id, user_symptom.severity) for user_symptom in user_symptoms], limit
+    )
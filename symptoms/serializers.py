@@ -1,14 +1,101 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Symptom, UserSymptom, SymptomCheck
+from healthmateai.serializers import SparseFieldsetsMixin
+from .catalog import get_catalog
+from .models import Symptom, UserSymptom, SymptomCheck, SymptomCheckBatch
+from .triage import triage
 from users.serializers import UserProfileSerializer
 from django.utils import timezone
 
-class SymptomSerializer(serializers.ModelSerializer):
+def create_symptom_checks(user, entries, batch=None):
+    """
+    Create symptom checks and their user symptoms with three bulk inserts.
+    
+    Each check is triaged first, so emergencies are flagged before any
+    analysis is queued. The inserts run in one transaction, so a failure
+    leaves no partial checks behind.
+    
+    Args:
+        user: The user the checks belong to
+        entries: Validated SymptomCheckCreateSerializer data, one per check
+        batch: Optional SymptomCheckBatch the checks belong to
+    
+    Returns:
+        List of created SymptomCheck instances
+    """
+    today = timezone.now().date()
+    symptom_checks = []
+    
+    # Create UserSymptom instances, remembering which check each belongs to
+    user_symptoms = []
+    owners = []
+    for entry in entries:
+        additional_info = entry.get('additional_info', {})
+        symptom_check = SymptomCheck(user=user, batch=batch, additional_info=additional_info)
+        
+        # Extract severity data from additional_info
+        severity_data = additional_info.get('severity', [])
+        severities = []
+        
+        for symptom_id in entry.get('symptom_ids', []):
+            # Find matching severity data for this symptom
+            symptom_severity = next(
+                (item for item in severity_data if item.get('symptom_id') == symptom_id),
+                {'severity': 5}  # Default severity if not specified
+            )
+            severities.append((symptom_id, symptom_severity.get('severity', 5)))
+            user_symptoms.append(UserSymptom(
+                user=user,
+                symptom_id=symptom_id,
+                severity=severities[-1][1],
+                onset_date=today,
+                is_active=True
+            ))
+            owners.append(symptom_check)
+        
+        reasons = triage(severities, additional_info.get('age', user.age))
+        symptom_check.emergency_level = bool(reasons)
+        symptom_check.triage_reasons = reasons
+        symptom_checks.append(symptom_check)
+    
+    with transaction.atomic():
+        symptom_checks = SymptomCheck.objects.bulk_create(symptom_checks)
+        
+        user_symptoms = UserSymptom.objects.bulk_create(user_symptoms)
+        
+        # Link them to their checks in one insert into the M2M table
+        SymptomCheckSymptoms = SymptomCheck.symptoms.through
+        SymptomCheckSymptoms.objects.bulk_create([
+            SymptomCheckSymptoms(symptomcheck_id=symptom_check.id, usersymptom_id=user_symptom.id)
+            for symptom_check, user_symptom in zip(owners, user_symptoms)
+        ])
+    
+    return symptom_checks
+
+def check_symptom_ids(symptom_ids):
+    """
+    Check every referenced symptom exists with a single query.
+    
+    Args:
+        symptom_ids: Iterable of symptom ids
+    
+    Raises:
+        ValidationError: If any of the ids is not a known symptom
+    """
+    symptom_ids = set(symptom_ids)
+    known_ids = set(Symptom.objects.filter(id__in=symptom_ids).values_list('id', flat=True))
+    unknown_ids = symptom_ids - known_ids
+    if unknown_ids:
+        raise serializers.ValidationError(f"Unknown symptom ids: {sorted(unknown_ids)}")
+
+class SymptomSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Symptom
         fields = '__all__'
 
-class UserSymptomSerializer(serializers.ModelSerializer):
+class UserSymptomSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     symptom_name = serializers.SerializerMethodField()
     
     class Meta:
@@ -20,7 +107,15 @@ class UserSymptomSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load the related rows this serializer reads; symptom names come from the catalog"""
+        return queryset
+    
     def get_symptom_name(self, obj):
+        record = get_catalog().get(obj.symptom_id)
+        if record is not None:
+            return record['name']
         return obj.symptom.name if obj.symptom else None
 
 class UserSymptomCreateSerializer(serializers.ModelSerializer):
@@ -35,7 +130,7 @@ class UserSymptomCreateSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         return UserSymptom.objects.create(user=user, **validated_data)
 
-class SymptomCheckSerializer(serializers.ModelSerializer):
+class SymptomCheckSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     symptoms = UserSymptomSerializer(many=True, read_only=True)
     user_details = serializers.SerializerMethodField()
     
@@ -44,9 +139,19 @@ class SymptomCheckSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'user_details', 'symptoms', 'additional_info',
             'ai_analysis', 'possible_conditions', 'recommendations',
-            'emergency_level', 'created_at'
+            'emergency_level', 'triage_reasons', 'status', 'created_at'
+        ]
+        read_only_fields = [
+            'ai_analysis', 'possible_conditions', 'recommendations', 'emergency_level', 'triage_reasons',
+            'status', 'created_at'
         ]
-        read_only_fields = ['ai_analysis', 'possible_conditions', 'recommendations', 'emergency_level', 'created_at']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load the user and the nested symptoms in two queries"""
+        return queryset.select_related('user').prefetch_related(
+            Prefetch('symptoms', queryset=UserSymptomSerializer.setup_eager_loading(UserSymptom.objects.all()))
+        )
     
     def get_user_details(self, obj):
         return {
@@ -56,6 +161,16 @@ class SymptomCheckSerializer(serializers.ModelSerializer):
             'gender': obj.user.gender
         }
 
+class SymptomCheckStatusSerializer(serializers.ModelSerializer):
+    """Lightweight view of a symptom check for polling its analysis"""
+    class Meta:
+        model = SymptomCheck
+        fields = [
+            'id', 'status', 'emergency_level', 'triage_reasons', 'analysis_error',
+            'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = fields
+
 class SymptomCheckCreateSerializer(serializers.ModelSerializer):
     symptom_ids = serializers.ListField(
         child=serializers.IntegerField(),
@@ -67,35 +182,61 @@ class SymptomCheckCreateSerializer(serializers.ModelSerializer):
         model = SymptomCheck
         fields = ['symptom_ids', 'additional_info']
     
+    def validate_symptom_ids(self, value):
+        # Checks of a batch are checked together by the batch serializer
+        if self.parent is None:
+            check_symptom_ids(value)
+        return value
+    
     def create(self, validated_data):
         user = self.context['request'].user
-        symptom_ids = validated_data.pop('symptom_ids', [])
-        additional_info = validated_data.get('additional_info', {})
-        
-        # Extract severity data from additional_info
-        severity_data = additional_info.get('severity', [])
-        
-        # Create symptom check
-        symptom_check = SymptomCheck.objects.create(user=user, **validated_data)
-        
-        # Create UserSymptom instances
-        for symptom_id in symptom_ids:
-            # Find matching severity data for this symptom
-            symptom_severity = next(
-                (item for item in severity_data if item.get('symptom_id') == symptom_id),
-                {'severity': 5}  # Default severity if not specified
-            )
-            
-            # Create UserSymptom
-            user_symptom = UserSymptom.objects.create(
-                user=user,
-                symptom_id=symptom_id,
-                severity=symptom_severity.get('severity', 5),
-                onset_date=timezone.now().date(),
-                is_active=True
-            )
-            
-            # Add to symptom check
-            symptom_check.symptoms.add(user_symptom)
+        return create_symptom_checks(user, [validated_data])[0]
+
+class SymptomCheckBatchCreateSerializer(serializers.Serializer):
+    """Serializer for creating many symptom checks in one request"""
+    checks = SymptomCheckCreateSerializer(many=True)
+    
+    def validate_checks(self, value):
+        if not value:
+            raise serializers.ValidationError("Provide at least one symptom check.")
+        if len(value) > settings.SYMPTOM_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(f"A batch can hold at most {settings.SYMPTOM_BATCH_MAX_SIZE} symptom checks.")
         
-        return symptom_check 
\ No newline at end of file
+        check_symptom_ids(symptom_id for entry in value for symptom_id in entry.get('symptom_ids', []))
+        return value
+    
+    def create(self, validated_data):
+        user = self.context['request'].user
+        # The batch and its checks are stored together or not at all
+        with transaction.atomic():
+            batch = SymptomCheckBatch.objects.create(user=user)
+            create_symptom_checks(user, validated_data['checks'], batch=batch)
+        return batch
+
+class SymptomCheckBatchSerializer(serializers.ModelSerializer):
+    """Progress of a batch; expects the counts annotated by SymptomCheckBatchViewSet"""
+    status = serializers.SerializerMethodField()
+    counts = serializers.SerializerMethodField()
+    checks = SymptomCheckStatusSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = SymptomCheckBatch
+        fields = ['id', 'status', 'counts', 'created_at', 'checks']
+        read_only_fields = fields
+    
+    def get_counts(self, obj):
+        return {
+            'total': obj.total_count,
+            'queued': obj.queued_count,
+            'running': obj.running_count,
+            'done': obj.done_count,
+            'failed': obj.failed_count,
+            'emergency': obj.emergency_count,
+        }
+    
+    def get_status(self, obj):
+        if obj.done_count + obj.failed_count == obj.total_count:
+            return 'done'
+        if obj.queued_count == obj.total_count:
+            return SymptomCheck.STATUS_QUEUED
+        return SymptomCheck.STATUS_RUNNING
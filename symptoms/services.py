@@ -1,101 +1,409 @@
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.conf import settings
-import openai
+from django.db import connection
+from django.utils import timezone
+from healthmateai.llm import chat_completion, achat_completion
+from .cache import analysis_cache, analysis_fingerprint
+from .catalog import attach_symptoms
+from .models import SymptomCheck
+from .ranker import get_ranker, rank_user_symptoms
+from .tasks import analyze_symptom_check, analyze_symptom_batch
 
 logger = logging.getLogger(__name__)
 
+ANALYSIS_MODEL = "gpt-4"
+
+ANALYSIS_SYSTEM_PROMPT = """
+You are a medical assistant AI. Analyze the following symptoms and provide:
+1. A brief analysis of the symptoms
+2. A list of possible conditions with confidence levels (low, medium, high)
+3. Recommendations for the patient
+4. Whether this requires emergency attention (true/false)
+
+Format your response as a JSON object with these keys:
+{
+    "analysis": "Your detailed analysis here",
+    "possible_conditions": [
+        {"condition": "Condition name", "confidence": "low/medium/high", "match_percentage": 0-100, "description": "Brief description"}
+    ],
+    "recommendations": "Your recommendations here",
+    "emergency": true/false
+}
+"""
+
+ANALYSIS_USER_PROMPT = """
+    Patient Information:
+    - Age: {age}
+    - Gender: {gender}
+    - Additional Info: {additional_info}
+    
+    Symptoms:
+    {symptoms}
+    {candidates}
+    Please analyze these symptoms and provide an assessment.
+    """
+
+# The prompt shows bands rather than exact values, so equivalent presentations
+# send the same prompt and share a cached analysis. Upper bounds, checked in order
+AGE_BANDS = [(1, "0-1"), (12, "2-12"), (17, "13-17"), (39, "18-39"), (64, "40-64"), (None, "65+")]
+SEVERITY_BANDS = [(3, "Mild (1-3)"), (6, "Moderate (4-6)"), (8, "Severe (7-8)"), (10, "Critical (9-10)")]
+
+def enqueue_symptom_analysis(symptom_check):
+    """
+    Queue a symptom check for analysis by a Celery worker.
+    
+    Args:
+        symptom_check: A SymptomCheck instance in the queued state
+    """
+    try:
+        analyze_symptom_check.delay(symptom_check.id)
+    except Exception as e:
+        logger.error(f"Unable to queue symptom check {symptom_check.id}: {str(e)}")
+        symptom_check.transition(
+            SymptomCheck.STATUS_FAILED,
+            analysis_error="Unable to queue symptom analysis",
+            completed_at=timezone.now()
+        )
+
+def enqueue_symptom_batch(batch):
+    """
+    Queue every check in a batch for analysis by Celery workers.
+    
+    Args:
+        batch: A SymptomCheckBatch instance whose checks are queued
+    """
+    try:
+        analyze_symptom_batch.delay(batch.id)
+    except Exception as e:
+        logger.error(f"Unable to queue symptom check batch {batch.id}: {str(e)}")
+        batch.checks.filter(status=SymptomCheck.STATUS_QUEUED).update(
+            status=SymptomCheck.STATUS_FAILED,
+            analysis_error="Unable to queue symptom analysis",
+            completed_at=timezone.now()
+        )
+
+def run_symptom_analyses(symptom_check_ids):
+    """
+    Analyze several symptom checks with a bounded pool of threads.
+    
+    The LLM calls are I/O bound, so a handful of threads keeps several in
+    flight from one worker process. The gateway's concurrency cap still applies.
+    
+    Args:
+        symptom_check_ids: IDs of the symptom checks to analyze
+    
+    Returns:
+        The number of checks this call analyzed
+    """
+    symptom_checks = list(SymptomCheck.objects.select_related('user').filter(id__in=symptom_check_ids))
+    if not symptom_checks:
+        return 0
+    
+    workers = min(settings.SYMPTOM_BATCH_CONCURRENCY, len(symptom_checks))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_run_symptom_analysis_in_thread, symptom_checks))
+
+def _run_symptom_analysis_in_thread(symptom_check):
+    # Each thread opens its own database connection; close it before the thread is reused
+    try:
+        return run_symptom_analysis(symptom_check)
+    finally:
+        connection.close()
+
+def run_symptom_analysis(symptom_check):
+    """
+    Claim a queued symptom check and analyze it.
+    
+    Args:
+        symptom_check: A SymptomCheck instance
+    
+    Returns:
+        True if this call ran the analysis, False if the check was not queued
+    """
+    if not symptom_check.transition(SymptomCheck.STATUS_RUNNING, started_at=timezone.now()):
+        logger.info(f"Symptom check {symptom_check.id} is {symptom_check.status}, skipping analysis")
+        return False
+    
+    analyze_symptoms(symptom_check)
+    return True
+
 def analyze_symptoms(symptom_check):
     """
     Analyze a user's symptoms using OpenAI API and update the symptom check object.
     
+    Equivalent presentations are answered from the analysis cache.
+    
     Args:
         symptom_check: A SymptomCheck instance
     """
     try:
-        # Format symptom information for OpenAI
-        user = symptom_check.user
-        symptoms_data = []
-        print("symptom_check", symptom_check)
-        
-        for user_symptom in symptom_check.symptoms.all():
-            symptom_info = {
-                "name": user_symptom.symptom.name,
-                "severity": user_symptom.get_severity_display(),
-                "duration": f"Since {user_symptom.onset_date.strftime('%Y-%m-%d')}",
-                "notes": user_symptom.notes
-            }
-            symptoms_data.append(symptom_info)
+        messages, stub_content, cache_key, local_result = prepare_analysis(symptom_check)
+        if local_result is not None:
+            apply_analysis_result(symptom_check, local_result)
+            return
         
-        # Get additional user data
-        user_info = {
-            "age": user.age,
-            "gender": user.get_gender_display() if hasattr(user, 'get_gender_display') else user.gender,
-            "additional_info": symptom_check.additional_info
-        }
-        
-        # Create prompt for OpenAI
-        system_prompt = """
-        You are a medical assistant AI. Analyze the following symptoms and provide:
-        1. A brief analysis of the symptoms
-        2. A list of possible conditions with confidence levels (low, medium, high)
-        3. Recommendations for the patient
-        4. Whether this requires emergency attention (true/false)
-        
-        Format your response as a JSON object with these keys:
-        {
-            "analysis": "Your detailed analysis here",
-            "possible_conditions": [
-                {"condition": "Condition name", "confidence": "low/medium/high", "match_percentage": 0-100, "description": "Brief description"}
-            ],
-            "recommendations": "Your recommendations here",
-            "emergency": true/false
-        }
-        """
-        
-        # Create the user prompt with all symptom information
-        user_prompt = f"""
-        Patient Information:
-        - Age: {user_info['age']}
-        - Gender: {user_info['gender']}
-        - Additional Info: {json.dumps(user_info['additional_info'])}
-        
-        Symptoms:
-        {json.dumps(symptoms_data, indent=2)}
-        
-        Please analyze these symptoms and provide an assessment.
-        """
-        print("user_prompt", user_prompt)
+        result = analysis_cache.get(cache_key)
+        if result is None:
+            # Query the LLM backend
+            result_text = chat_completion(
+                model=ANALYSIS_MODEL,
+                messages=messages,
+                temperature=0.1,  # Low temperature for more deterministic results
+                stub_content=stub_content,
+            )
+            result = parse_analysis(result_text)
+            analysis_cache.set(cache_key, result)
         
-        # Query OpenAI API
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4",  # Use appropriate model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1,  # Low temperature for more deterministic results
-        )
+        apply_analysis_result(symptom_check, result)
         
-        # Extract response
-        result_text = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error in symptom analysis: {str(e)}")
+        apply_analysis_fallback(symptom_check, e)
+
+async def aanalyze_symptoms(symptom_check):
+    """
+    Async version of analyze_symptoms that awaits the LLM on the event loop.
+    
+    Args:
+        symptom_check: A SymptomCheck instance
+    """
+    try:
+        messages, stub_content, cache_key, local_result = await sync_to_async(prepare_analysis)(symptom_check)
+        if local_result is not None:
+            await sync_to_async(apply_analysis_result)(symptom_check, local_result)
+            return
         
-        # Parse JSON response
-        result = json.loads(result_text)
+        result = await sync_to_async(analysis_cache.get)(cache_key)
+        if result is None:
+            result_text = await achat_completion(
+                model=ANALYSIS_MODEL,
+                messages=messages,
+                temperature=0.1,
+                stub_content=stub_content,
+            )
+            result = parse_analysis(result_text)
+            await sync_to_async(analysis_cache.set)(cache_key, result)
         
-        # Update the symptom check with analysis results
-        symptom_check.ai_analysis = result["analysis"]
-        symptom_check.possible_conditions = result["possible_conditions"]
-        symptom_check.recommendations = result["recommendations"]
-        symptom_check.emergency_level = result["emergency"]
-        symptom_check.save()
+        await sync_to_async(apply_analysis_result)(symptom_check, result)
         
     except Exception as e:
         logger.error(f"Error in symptom analysis: {str(e)}")
-        # Set a fallback analysis
-        symptom_check.ai_analysis = "Unable to complete symptom analysis. Please consult with a healthcare professional."
-        symptom_check.possible_conditions = []
-        symptom_check.recommendations = "Please consult with a healthcare professional for a proper diagnosis."
-        symptom_check.emergency_level = False
-        symptom_check.save() 
\ No newline at end of file
+        await sync_to_async(apply_analysis_fallback)(symptom_check, e)
+
+async def arun_symptom_analysis(symptom_check):
+    """
+    Async version of run_symptom_analysis.
+    """
+    claimed = await sync_to_async(symptom_check.transition)(SymptomCheck.STATUS_RUNNING, started_at=timezone.now())
+    if not claimed:
+        logger.info(f"Symptom check {symptom_check.id} is {symptom_check.status}, skipping analysis")
+        return False
+    
+    await aanalyze_symptoms(symptom_check)
+    return True
+
+def prepare_analysis(symptom_check):
+    """
+    Build the chat messages and cache key for a symptom analysis.
+    
+    Candidate conditions ranked from the symptom catalog are added to the
+    prompt. Low-risk checks may be answered from them without the LLM.
+    
+    Args:
+        symptom_check: A SymptomCheck instance
+    
+    Returns:
+        Tuple of (messages, stub_content, cache_key, local_result), where
+        local_result is a parsed analysis when the check is answered locally
+    """
+    # Format symptom information for OpenAI
+    user = symptom_check.user
+    user_symptoms = attach_symptoms(list(symptom_check.symptoms.all()))
+    # A canonical order, so the prompt and its cache key do not depend on the order of entry
+    user_symptoms.sort(key=lambda s: (s.symptom.name.lower(), s.severity, s.onset_date, s.notes))
+    today = timezone.now().date()
+    symptoms_data = []
+    
+    for user_symptom in user_symptoms:
+        symptom_info = {
+            "name": user_symptom.symptom.name,
+            "severity": _band(user_symptom.severity, SEVERITY_BANDS)[1],
+            "duration": _duration((today - user_symptom.onset_date).days),
+            "notes": user_symptom.notes
+        }
+        symptoms_data.append(symptom_info)
+    
+    # Ranked at the top of each severity band, so the candidates follow the prompt
+    candidates = get_ranker().rank(
+        [(s.symptom_id, _band(s.severity, SEVERITY_BANDS)[0]) for s in user_symptoms],
+        max(settings.SYMPTOM_RANKER_CANDIDATES, 1)
+    )
+    # Checks flagged by triage always get the full analysis
+    local_result = None if symptom_check.emergency_level else local_analysis(user_symptoms, candidates)
+    
+    # Age and severity entered with the check are shown banded above
+    additional_info = {
+        key: value for key, value in symptom_check.additional_info.items() if key not in ("age", "severity")
+    }
+    age = symptom_check.additional_info.get("age", user.age)
+    inputs = {
+        "age": _band(age, AGE_BANDS)[1],
+        "gender": user.get_gender_display() if hasattr(user, 'get_gender_display') else user.gender,
+        "additional_info": additional_info,
+        "symptoms": symptoms_data,
+        "candidates": candidates[:settings.SYMPTOM_RANKER_CANDIDATES],
+    }
+    
+    # Create the user prompt with all symptom information
+    user_prompt = ANALYSIS_USER_PROMPT.format(
+        age=inputs["age"],
+        gender=inputs["gender"],
+        additional_info=json.dumps(inputs["additional_info"], sort_keys=True),
+        symptoms=json.dumps(inputs["symptoms"], indent=2),
+        candidates=_format_candidates(inputs["candidates"]),
+    )
+    logger.debug(f"Symptom analysis prompt for check {symptom_check.id}: {user_prompt}")
+    
+    messages = [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    # The prompt is rendered from these inputs alone, so checks with the same key send the same prompt
+    cache_key = analysis_fingerprint(ANALYSIS_MODEL, [ANALYSIS_SYSTEM_PROMPT, ANALYSIS_USER_PROMPT], inputs)
+    return messages, _stub_analysis(symptoms_data, candidates), cache_key, local_result
+
+def local_analysis(user_symptoms, candidates):
+    """
+    Answer a low-risk check from the catalog ranking, if enabled.
+    
+    A check qualifies when every symptom is mild, typically mild, has no
+    notes, and the best candidate explains enough of the presentation.
+    
+    Args:
+        user_symptoms: The check's UserSymptom instances with their symptom loaded
+        candidates: Conditions ranked by rank_user_symptoms
+    
+    Returns:
+        A parsed analysis, or None if the LLM should answer
+    """
+    if not settings.SYMPTOM_LOCAL_ANALYSIS or not user_symptoms or not candidates:
+        return None
+    max_severity = settings.SYMPTOM_LOCAL_ANALYSIS_MAX_SEVERITY
+    for user_symptom in user_symptoms:
+        if (user_symptom.severity > max_severity or user_symptom.symptom.severity_scale > max_severity
+                or user_symptom.notes.strip()):
+            return None
+    if candidates[0]["match_percentage"] < settings.SYMPTOM_LOCAL_ANALYSIS_MIN_MATCH:
+        return None
+    
+    names = ", ".join(user_symptom.symptom.name for user_symptom in user_symptoms)
+    return {
+        "analysis": f"Your symptoms ({names}) are mild and most consistent with {candidates[0]['condition']}. "
+                    "This assessment is based on our symptom catalog.",
+        "possible_conditions": candidates,
+        "recommendations": "Rest, stay hydrated and monitor your symptoms. Consult a healthcare professional "
+                           "if they get worse or do not improve within a few days.",
+        "emergency": False
+    }
+
+def fallback_conditions(symptom_check):
+    """Rank candidate conditions from the catalog when the LLM could not answer"""
+    try:
+        return rank_user_symptoms(list(symptom_check.symptoms.all()), settings.SYMPTOM_RANKER_CANDIDATES)
+    except Exception as e:
+        logger.warning(f"Unable to rank conditions for symptom check {symptom_check.id}: {str(e)}")
+        return []
+
+def parse_analysis(result_text):
+    """
+    Parse and validate the JSON analysis returned by the model.
+    
+    Args:
+        result_text: Raw JSON text returned by the model
+    
+    Returns:
+        Dictionary with analysis, possible_conditions, recommendations and emergency
+    """
+    result = json.loads(result_text.strip())
+    return {
+        "analysis": result["analysis"],
+        "possible_conditions": result["possible_conditions"],
+        "recommendations": result["recommendations"],
+        "emergency": result["emergency"]
+    }
+
+def apply_analysis_result(symptom_check, result):
+    """
+    Store a parsed analysis on the symptom check.
+    
+    Args:
+        symptom_check: A SymptomCheck instance
+        result: Dictionary returned by parse_analysis
+    """
+    # Update the symptom check with analysis results
+    symptom_check.ai_analysis = result["analysis"]
+    symptom_check.possible_conditions = result["possible_conditions"]
+    symptom_check.recommendations = result["recommendations"]
+    # The analysis can raise the triage flag but never clear it
+    symptom_check.emergency_level = symptom_check.emergency_level or bool(result["emergency"])
+    symptom_check.status = SymptomCheck.STATUS_DONE
+    symptom_check.completed_at = timezone.now()
+    symptom_check.save()
+
+def apply_analysis_fallback(symptom_check, error):
+    """
+    Store the fallback analysis after a failed analysis.
+    
+    Args:
+        symptom_check: A SymptomCheck instance
+        error: The exception that stopped the analysis
+    """
+    symptom_check.ai_analysis = "Unable to complete symptom analysis. Please consult with a healthcare professional."
+    # Conditions from the catalog ranking, so the check is not left empty
+    symptom_check.possible_conditions = fallback_conditions(symptom_check)
+    symptom_check.recommendations = "Please consult with a healthcare professional for a proper diagnosis."
+    symptom_check.status = SymptomCheck.STATUS_FAILED
+    symptom_check.analysis_error = str(error)
+    symptom_check.completed_at = timezone.now()
+    symptom_check.save()
+
+def _band(value, bands):
+    """Return (upper bound, label) of the band ``value`` falls in, or (None, "Unknown")"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None, "Unknown"
+    for upper, label in bands:
+        if upper is None or value <= upper:
+            return upper, label
+    return bands[-1]
+
+def _duration(days):
+    """Symptom duration relative to today, e.g. '2 days'"""
+    if days <= 0:
+        return "Less than a day"
+    return f"{days} day{'s' if days != 1 else ''}"
+
+def _format_candidates(candidates):
+    """Prompt lines listing the catalog's candidate conditions"""
+    if not candidates:
+        return ""
+    lines = "\n".join(
+        f"    - {c['condition']} ({c['match_percentage']}% of symptoms)" for c in candidates
+    )
+    return f"""
+    Candidate conditions from our symptom catalog (verify these, do not assume them):
+{lines}
+    """
+
+def _stub_analysis(symptoms_data, candidates):
+    """Canned analysis returned by the stub LLM backend"""
+    return json.dumps({
+        "analysis": "Stub analysis of: " + ", ".join(s["name"] for s in symptoms_data),
+        "possible_conditions": candidates,
+        "recommendations": "Please consult with a healthcare professional for a proper diagnosis.",
+        "emergency": False
+    }) 
\ No newline at end of file
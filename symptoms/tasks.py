@@ -0,0 +1,44 @@
+from celery import shared_task
+
+@shared_task
+def analyze_symptom_check(symptom_check_id):
+    """Run the AI analysis for a queued symptom check"""
+    from .models import SymptomCheck
+    from .services import run_symptom_analysis
+    
+    try:
+        symptom_check = SymptomCheck.objects.select_related('user').get(id=symptom_check_id)
+    except SymptomCheck.DoesNotExist:
+        return f"Symptom check {symptom_check_id} not found"
+    
+    run_symptom_analysis(symptom_check)
+    
+    return f"Symptom check {symptom_check_id} is {symptom_check.status}"
+
+@shared_task
+def analyze_symptom_check_chunk(symptom_check_ids):
+    """Analyze a chunk of queued symptom checks concurrently"""
+    from .services import run_symptom_analyses
+    
+    analyzed = run_symptom_analyses(symptom_check_ids)
+    
+    return f"Analyzed {analyzed} of {len(symptom_check_ids)} symptom checks"
+
+@shared_task
+def analyze_symptom_batch(batch_id):
+    """Fan a batch of symptom checks out to chunk tasks"""
+    from celery import group
+    from django.conf import settings
+    from .models import SymptomCheck
+    
+    symptom_check_ids = list(
+        SymptomCheck.objects.filter(batch_id=batch_id, status=SymptomCheck.STATUS_QUEUED)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    size = settings.SYMPTOM_BATCH_CHUNK_SIZE
+    chunks = [symptom_check_ids[i:i + size] for i in range(0, len(symptom_check_ids), size)]
+    
+    group(analyze_symptom_check_chunk.s(chunk) for chunk in chunks).apply_async()
+    
+    return f"Queued {len(symptom_check_ids)} symptom checks in {len(chunks)} chunks for batch {batch_id}"
@@ -1,3 +1,635 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.models import CustomUser
+from .cache import analysis_cache
+from .catalog import bump_version, get_catalog
+from .models import Symptom, TriageRule, UserSymptom, SymptomCheck, SymptomCheckBatch
+from .ranker import get_ranker
+from .services import analyze_symptoms, apply_analysis_fallback, apply_analysis_result, run_symptom_analysis
+from .tasks import analyze_symptom_check
 
-# Create your tests here.
+
+class SymptomQueryCountTests(TestCase):
+    """
+    List and detail endpoints must issue a fixed number of queries however
+    many checks and symptoms a user has.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.symptoms = [
+            Symptom.objects.create(name=f'Symptom {i}', body_part='Head', severity_scale=5)
+            for i in range(3)
+        ]
+        # Symptom names come from the catalog snapshot, loaded once per process
+        get_catalog()
+
+    def create_checks(self, count):
+        for _ in range(count):
+            check = SymptomCheck.objects.create(user=self.user, status=SymptomCheck.STATUS_DONE)
+            for symptom in self.symptoms:
+                user_symptom = UserSymptom.objects.create(
+                    user=self.user, symptom=symptom, severity=5, onset_date=date.today()
+                )
+                check.symptoms.add(user_symptom)
+
+    def assertQueriesFlat(self, url, queries):
+        """Assert ``url`` issues ``queries`` queries with small and large histories"""
+        for count in (1, 10):
+            self.create_checks(count)
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_symptom_check_list(self):
+        # Checks joined with their user, then the symptoms joined with their names
+        self.assertQueriesFlat('/api/symptoms/checks/', 2)
+
+    def test_symptom_check_detail(self):
+        self.create_checks(1)
+        check = SymptomCheck.objects.get()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/symptoms/checks/{check.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['symptoms']), len(self.symptoms))
+
+    def test_recent_symptom_check(self):
+        self.assertQueriesFlat('/api/symptoms/checks/recent/', 2)
+
+    def test_user_symptom_list(self):
+        self.assertQueriesFlat('/api/symptoms/user-symptoms/', 1)
+
+    def test_active_user_symptoms(self):
+        self.assertQueriesFlat('/api/symptoms/user-symptoms/active/', 1)
+
+
+@override_settings(SYMPTOM_CHECK_ASYNC=True)
+class SymptomCheckStatusTests(TestCase):
+    """Checks are accepted with a 202 and their analysis is followed through the status endpoint"""
+
+    ANALYSIS = json.dumps({
+        'analysis': 'Likely a cold', 'possible_conditions': [], 'recommendations': 'Rest', 'emergency': False,
+    })
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cough = Symptom.objects.create(name='Cough', body_part='Chest', severity_scale=4)
+
+    def create_check(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/symptoms/checks/', {'symptom_ids': [self.cough.id]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], SymptomCheck.STATUS_QUEUED)
+        self.assertEqual(len(callbacks), 1)
+        return response.data['id'], callbacks[0]
+
+    def status(self, check_id, **params):
+        response = self.client.get(f'/api/symptoms/checks/{check_id}/status/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_queued_running_done(self):
+        check_id, enqueue = self.create_check()
+        self.assertEqual(self.status(check_id)['status'], SymptomCheck.STATUS_QUEUED)
+        with mock.patch('symptoms.tasks.analyze_symptom_check.delay') as delay:
+            enqueue()
+        delay.assert_called_once_with(check_id)
+
+        def chat_completion(**kwargs):
+            self.assertEqual(self.status(check_id)['status'], SymptomCheck.STATUS_RUNNING)
+            return self.ANALYSIS
+
+        with mock.patch('symptoms.services.chat_completion', side_effect=chat_completion) as completion:
+            analyze_symptom_check(check_id)
+        completion.assert_called_once()
+        data = self.status(check_id)
+        self.assertEqual(data['status'], SymptomCheck.STATUS_DONE)
+        self.assertIsNotNone(data['completed_at'])
+        self.assertEqual(self.client.get(f'/api/symptoms/checks/{check_id}/').data['ai_analysis'], 'Likely a cold')
+
+        # A finished check is not analyzed again
+        with mock.patch('symptoms.services.chat_completion') as completion:
+            analyze_symptom_check(check_id)
+        completion.assert_not_called()
+
+    def test_failed_analysis(self):
+        check_id, _ = self.create_check()
+        with mock.patch('symptoms.services.chat_completion', side_effect=RuntimeError('LLM unavailable')):
+            analyze_symptom_check(check_id)
+        data = self.status(check_id)
+        self.assertEqual(data['status'], SymptomCheck.STATUS_FAILED)
+        self.assertEqual(data['analysis_error'], 'LLM unavailable')
+
+    def test_queueing_failure_fails_the_check(self):
+        check_id, enqueue = self.create_check()
+        with mock.patch('symptoms.tasks.analyze_symptom_check.delay', side_effect=ConnectionError):
+            enqueue()
+        self.assertEqual(self.status(check_id)['status'], SymptomCheck.STATUS_FAILED)
+
+    def test_long_poll_returns_when_the_analysis_finishes(self):
+        check_id, _ = self.create_check()
+
+        async def finish(delay):
+            await SymptomCheck.objects.filter(pk=check_id).aupdate(status=SymptomCheck.STATUS_DONE)
+
+        with mock.patch('symptoms.views.asyncio.sleep', side_effect=finish) as sleep:
+            self.assertEqual(self.status(check_id, wait=10)['status'], SymptomCheck.STATUS_DONE)
+        sleep.assert_awaited_once()
+
+    @override_settings(SYMPTOM_CHECK_MAX_WAIT=0.05, SYMPTOM_CHECK_POLL_INTERVAL=0.01)
+    def test_long_poll_times_out(self):
+        check_id, _ = self.create_check()
+        self.assertEqual(self.status(check_id, wait=30)['status'], SymptomCheck.STATUS_QUEUED)
+
+    def test_analyze_inline(self):
+        with mock.patch('symptoms.services.achat_completion', return_value=self.ANALYSIS) as completion:
+            response = self.client.post('/api/symptoms/checks/analyze/', {'symptom_ids': [self.cough.id]},
+                                        format='json')
+        completion.assert_awaited_once()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], SymptomCheck.STATUS_DONE)
+        self.assertEqual(response.data['ai_analysis'], 'Likely a cold')
+        self.assertEqual(response.data['symptoms'][0]['symptom_name'], 'Cough')
+
+    def test_invalid_requests(self):
+        check_id, _ = self.create_check()
+        response = self.client.get(f'/api/symptoms/checks/{check_id}/status/', {'wait': 'soon'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/symptoms/checks/', {
+            'symptom_ids': [self.cough.id, 99999], 'additional_info': {},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('symptom_ids', response.data)
+        self.assertEqual(SymptomCheck.objects.count(), 1)
+
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/symptoms/checks/{check_id}/status/').status_code, 404)
+
+
+class SymptomCheckBatchTests(TestCase):
+    """Batches are created atomically and report the progress of their checks"""
+
+    ANALYSIS = SymptomCheckStatusTests.ANALYSIS
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123', age=40
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cough = Symptom.objects.create(name='Cough', body_part='Chest', severity_scale=4)
+        self.chest_pain = Symptom.objects.create(name='Chest Pain', body_part='Chest', severity_scale=8)
+
+    def payload(self):
+        return {'checks': [
+            {'symptom_ids': [self.cough.id]},
+            {'symptom_ids': [self.cough.id, self.chest_pain.id],
+             'additional_info': {'severity': [{'symptom_id': self.chest_pain.id, 'severity': 9}]}},
+            {'symptom_ids': [self.cough.id], 'additional_info': {'smoker': True}},
+        ]}
+
+    def counts(self, batch_id):
+        response = self.client.get(f'/api/symptoms/batches/{batch_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['status'], response.data['counts']
+
+    @override_settings(SYMPTOM_CHECK_ASYNC=True)
+    def test_batch_progress(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/symptoms/batches/', self.payload(), format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        batch_id = response.data['id']
+        self.assertEqual(self.counts(batch_id), ('queued', {
+            'total': 3, 'queued': 3, 'running': 0, 'done': 0, 'failed': 0, 'emergency': 1,
+        }))
+        self.assertEqual(UserSymptom.objects.count(), 4)
+
+        checks = list(SymptomCheck.objects.filter(batch_id=batch_id).select_related('user').order_by('id'))
+        with mock.patch('symptoms.services.chat_completion', return_value=self.ANALYSIS):
+            run_symptom_analysis(checks[0])
+        checks[1].transition(SymptomCheck.STATUS_RUNNING)
+        status, counts = self.counts(batch_id)
+        self.assertEqual(status, 'running')
+        self.assertEqual((counts['queued'], counts['running'], counts['done']), (1, 1, 1))
+
+        with mock.patch('symptoms.services.chat_completion', side_effect=RuntimeError('LLM unavailable')):
+            analyze_symptoms(checks[1])
+            run_symptom_analysis(checks[2])
+        status, counts = self.counts(batch_id)
+        self.assertEqual(status, 'done')
+        self.assertEqual((counts['done'], counts['failed'], counts['emergency']), (1, 2, 1))
+
+    @override_settings(SYMPTOM_CHECK_ASYNC=False)
+    def test_inline_batch(self):
+        with mock.patch('symptoms.services.chat_completion', return_value=self.ANALYSIS):
+            response = self.client.post('/api/symptoms/batches/', self.payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['counts']['done'], 3)
+
+    def test_invalid_batches(self):
+        response = self.client.post('/api/symptoms/batches/', {'checks': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/symptoms/batches/', {'checks': [{'symptom_ids': [0]}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with override_settings(SYMPTOM_BATCH_MAX_SIZE=2):
+            self.assertEqual(self.client.post('/api/symptoms/batches/', self.payload(), format='json').status_code, 400)
+        self.assertFalse(SymptomCheckBatch.objects.exists())
+
+    def test_failed_insert_leaves_nothing_behind(self):
+        with mock.patch.object(UserSymptom.objects, 'bulk_create', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                self.client.post('/api/symptoms/batches/', self.payload(), format='json')
+        self.assertFalse(SymptomCheckBatch.objects.exists())
+        self.assertFalse(SymptomCheck.objects.exists())
+
+    def test_other_users_batches(self):
+        with self.captureOnCommitCallbacks():
+            batch_id = self.client.post('/api/symptoms/batches/', self.payload(), format='json').data['id']
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/symptoms/batches/{batch_id}/').status_code, 404)
+
+
+class AnalysisCacheTests(TestCase):
+    """Analyses are reused for checks that send the same banded prompt"""
+
+    ANALYSIS = json.dumps({
+        'analysis': 'Likely a cold', 'possible_conditions': [], 'recommendations': 'Rest', 'emergency': False,
+    })
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123', age=30, gender='F'
+        )
+        self.other_user = CustomUser.objects.create_user(
+            email='other@example.com', username='other', password='testpass123', age=35, gender='F'
+        )
+        self.cough = Symptom.objects.create(name='Cough', severity_scale=4, common_related_conditions=['Common Cold'])
+        self.fever = Symptom.objects.create(name='Fever', severity_scale=6, common_related_conditions=['Flu'])
+        self.completion = None
+
+    def analyze(self, symptoms, additional_info=None, user=None, days=2):
+        """Analyze a check of (symptom, severity) pairs; return whether the LLM was called"""
+        user = user or self.user
+        check = SymptomCheck.objects.create(
+            user=user, status=SymptomCheck.STATUS_RUNNING, additional_info=additional_info or {}
+        )
+        for symptom, severity in symptoms:
+            check.symptoms.add(UserSymptom.objects.create(
+                user=user, symptom=symptom, severity=severity, onset_date=timezone.now().date() - timedelta(days=days)
+            ))
+        check = SymptomCheck.objects.select_related('user').get(pk=check.pk)
+        with mock.patch('symptoms.services.chat_completion', return_value=self.ANALYSIS) as completion:
+            analyze_symptoms(check)
+        self.assertEqual(check.status, SymptomCheck.STATUS_DONE)
+        self.completion = completion
+        return completion.called
+
+    def test_prompt_is_banded(self):
+        self.assertTrue(self.analyze([(self.cough, 4)], {'smoker': True}))
+        prompt = self.completion.call_args.kwargs['messages'][1]['content']
+        self.assertIn('Age: 18-39', prompt)
+        self.assertIn('"severity": "Moderate (4-6)"', prompt)
+        self.assertIn('"duration": "2 days"', prompt)
+        self.assertNotIn(str(timezone.now().year), prompt)
+
+    def test_same_prompt_hits(self):
+        self.assertTrue(self.analyze([(self.cough, 4), (self.fever, 6)], {'smoker': True, 'travel': 'no'}))
+        # Entry order does not change the prompt
+        self.assertFalse(self.analyze([(self.fever, 6), (self.cough, 4)], {'travel': 'no', 'smoker': True}))
+        self.assertEqual(analysis_cache.stats()['hits'], 1)
+        self.assertEqual(analysis_cache.stats()['misses'], 1)
+
+    def test_equivalent_checks_of_other_users_hit(self):
+        self.assertTrue(self.analyze([(self.cough, 4), (self.fever, 6)], {'smoker': True}))
+        # Another patient in the same age band, with severities in the same bands
+        self.assertFalse(self.analyze([(self.cough, 5), (self.fever, 4)], {'smoker': True}, user=self.other_user))
+        self.assertEqual(analysis_cache.stats()['hits'], 1)
+
+    def test_prompt_changes_miss(self):
+        self.assertTrue(self.analyze([(self.cough, 4)]))
+        self.assertTrue(self.analyze([(self.cough, 7)]))
+        self.assertTrue(self.analyze([(self.cough, 4)], days=3))
+        self.assertTrue(self.analyze([(self.cough, 4)], {'smoker': True}))
+        # Severity and age entered with the check are shown banded
+        self.assertFalse(self.analyze([(self.cough, 4)], {'severity': [{'symptom_id': self.cough.id, 'severity': 9}]}))
+        self.assertTrue(self.analyze([(self.cough, 4)], {'age': 80}))
+        self.assertFalse(self.analyze([(self.cough, 4)], {'age': 70}))
+
+        self.user.age = 45
+        self.user.save()
+        self.assertTrue(self.analyze([(self.cough, 4)]))
+
+    @override_settings(SYMPTOM_ANALYSIS_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.assertTrue(self.analyze([(self.cough, 4)]))
+        self.assertTrue(self.analyze([(self.cough, 4)]))
+
+
+class SymptomRankerTests(TestCase):
+    """Candidate conditions ranked from the catalog's related conditions"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.headache = Symptom.objects.create(
+            name='Headache', severity_scale=5, common_related_conditions=['Migraine', 'Tension Headache', 'Sinusitis']
+        )
+        self.nausea = Symptom.objects.create(
+            name='Nausea', severity_scale=5, common_related_conditions=['Food Poisoning', 'Migraine']
+        )
+        self.cough = Symptom.objects.create(
+            name='Cough', severity_scale=4, common_related_conditions=['Common Cold', 'Bronchitis']
+        )
+
+    def user_symptom(self, symptom, severity, notes=''):
+        return UserSymptom.objects.create(
+            user=self.user, symptom=symptom, severity=severity, onset_date=date.today(), notes=notes
+        )
+
+    def test_rank(self):
+        ranked = get_ranker().rank([(self.headache.id, 5), (self.nausea.id, 5)])
+        self.assertEqual(ranked[0]['condition'], 'Migraine')
+        self.assertEqual(ranked[0]['match_percentage'], 90)  # Second on Nausea's list
+        self.assertEqual(ranked[0]['confidence'], 'high')
+        self.assertEqual(ranked[0]['description'], 'Commonly associated with Headache, Nausea')
+        self.assertNotIn('Common Cold', [c['condition'] for c in ranked])
+        self.assertEqual(len(get_ranker().rank([(self.headache.id, 5), (self.nausea.id, 5)], limit=2)), 2)
+        self.assertEqual(get_ranker().rank([(0, 5)]), [])
+
+    def test_catalog_changes_rebuild_the_ranker(self):
+        get_ranker()
+        self.cough.common_related_conditions = ['Asthma']
+        self.cough.save()
+        self.assertEqual(get_ranker().rank([(self.cough.id, 4)])[0]['condition'], 'Asthma')
+
+    def test_failed_analysis_falls_back_to_the_ranking(self):
+        check = SymptomCheck.objects.create(user=self.user)
+        check.symptoms.add(self.user_symptom(self.cough, 4))
+        apply_analysis_fallback(check, RuntimeError('LLM unavailable'))
+        self.assertEqual(check.possible_conditions[0]['condition'], 'Common Cold')
+
+    @override_settings(SYMPTOM_LOCAL_ANALYSIS=True, SYMPTOM_LOCAL_ANALYSIS_MAX_SEVERITY=5)
+    def test_low_risk_checks_are_answered_locally(self):
+        check = SymptomCheck.objects.create(user=self.user, status=SymptomCheck.STATUS_RUNNING)
+        check.symptoms.add(self.user_symptom(self.headache, 2), self.user_symptom(self.nausea, 3))
+        with mock.patch('symptoms.services.chat_completion') as chat_completion:
+            analyze_symptoms(check)
+        chat_completion.assert_not_called()
+        self.assertEqual(check.status, SymptomCheck.STATUS_DONE)
+        self.assertEqual(check.possible_conditions[0]['condition'], 'Migraine')
+
+        # Notes need the LLM to read them
+        check = SymptomCheck.objects.create(user=self.user, status=SymptomCheck.STATUS_RUNNING)
+        check.symptoms.add(self.user_symptom(self.headache, 2, notes='Worst of my life'))
+        with mock.patch('symptoms.services.chat_completion', side_effect=RuntimeError) as chat_completion:
+            analyze_symptoms(check)
+        chat_completion.assert_called_once()
+
+
+class TriageTests(TestCase):
+    """Emergency flags set from the triage rules when a check is created"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123', age=40
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.chest_pain = Symptom.objects.create(name='Chest Pain', body_part='Chest', severity_scale=8)
+        self.breathless = Symptom.objects.create(name='Shortness of Breath', body_part='Chest', severity_scale=7)
+        self.fever = Symptom.objects.create(name='Fever', body_part='Whole Body', severity_scale=6)
+
+    def create_check(self, *severities, **additional_info):
+        additional_info['severity'] = [
+            {'symptom_id': symptom.id, 'severity': severity} for symptom, severity in severities
+        ]
+        with override_settings(SYMPTOM_CHECK_ASYNC=True):
+            response = self.client.post('/api/symptoms/checks/', {
+                'symptom_ids': [symptom.id for symptom, _ in severities], 'additional_info': additional_info,
+            }, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def test_emergency_is_flagged_before_analysis(self):
+        data = self.create_check((self.chest_pain, 8))
+        self.assertTrue(data['emergency_level'])
+        self.assertEqual(data['status'], SymptomCheck.STATUS_QUEUED)
+        self.assertIn('heart attack', data['triage_reasons'][0])
+
+        self.assertFalse(self.create_check((self.chest_pain, 3))['emergency_level'])
+
+    def test_combined_symptoms(self):
+        self.assertFalse(self.create_check((self.breathless, 5))['emergency_level'])
+        data = self.create_check((self.chest_pain, 5), (self.breathless, 5))
+        self.assertEqual(len(data['triage_reasons']), 1)
+
+    def test_age_limits(self):
+        self.assertFalse(self.create_check((self.fever, 4))['emergency_level'])
+        self.assertTrue(self.create_check((self.fever, 4), age=0)['emergency_level'])
+
+    def test_rule_changes_apply(self):
+        TriageRule.objects.create(name='Any fever', symptom_names=['fever'], reason='Test rule')
+        self.assertEqual(self.create_check((self.fever, 1))['triage_reasons'], ['Test rule'])
+
+    def test_analysis_cannot_clear_the_flag(self):
+        check = SymptomCheck.objects.get(id=self.create_check((self.chest_pain, 9))['id'])
+        check.status = SymptomCheck.STATUS_RUNNING
+        apply_analysis_result(check, {
+            'analysis': 'Muscle strain', 'possible_conditions': [], 'recommendations': 'Rest', 'emergency': False,
+        })
+        self.assertTrue(SymptomCheck.objects.get().emergency_level)
+
+
+class SymptomCatalogTests(TestCase):
+    """The symptom list is served from the catalog snapshot"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.headache = Symptom.objects.create(name='Headache', description='Pain in the head', body_part='Head')
+        Symptom.objects.create(name='Cough', description='Expulsion of air', body_part='Chest')
+        Symptom.objects.create(name='Chest Pain', description='Pain in the chest', body_part='Chest')
+
+    def names(self, **params):
+        return [symptom['name'] for symptom in self.client.get('/api/symptoms/predefined/', params).data]
+
+    def test_list_without_queries(self):
+        get_catalog()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/symptoms/predefined/')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(set(response.data[0]), {
+            'id', 'name', 'description', 'body_part', 'severity_scale', 'common_related_conditions'
+        })
+
+    def test_filters(self):
+        self.assertEqual(self.names(body_part='Chest'), ['Cough', 'Chest Pain'])
+        self.assertEqual(self.names(search='pain'), ['Headache', 'Chest Pain'])
+        self.assertEqual(self.names(search='pain chest'), ['Chest Pain'])
+        self.assertEqual(self.client.get('/api/symptoms/predefined/', {'fields': 'id,name'}).data[0],
+                         {'id': self.headache.id, 'name': 'Headache'})
+
+    def test_etag(self):
+        response = self.client.get('/api/symptoms/predefined/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/symptoms/predefined/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/symptoms/predefined/', {'search': 'pain'})['ETag'], etag)
+
+        self.headache.description = 'Pain in the head or neck'
+        self.headache.save()
+        response = self.client.get('/api/symptoms/predefined/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['description'], 'Pain in the head or neck')
+
+    def test_retrieve(self):
+        response = self.client.get(f'/api/symptoms/predefined/{self.headache.id}/')
+        self.assertEqual(response.data['name'], 'Headache')
+        self.assertEqual(self.client.get('/api/symptoms/predefined/0/').status_code, 404)
+
+    @override_settings(SYMPTOM_CATALOG_VERSION_CHECK=0)
+    def test_version_bump_reloads_other_processes(self):
+        snapshot = get_catalog()
+        self.assertIs(get_catalog(), snapshot)
+
+        # A change made by another process, without this process's signal
+        Symptom.objects.filter(pk=self.headache.pk).update(name='Migraine headache')
+        bump_version()
+        self.assertEqual(get_catalog().get(self.headache.id)['name'], 'Migraine headache')
+
+
+class SymptomTypeaheadTests(TestCase):
+    """Autocomplete suggestions from the typeahead index"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ('Headache', 'Head Injury', 'Shortness of Breath', 'Chest Pain', 'Abdominal Pain'):
+            Symptom.objects.create(name=name)
+
+    def suggest(self, query, **params):
+        response = self.client.get('/api/symptoms/predefined/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(suggestion['name'], suggestion['match']) for suggestion in response.data]
+
+    def test_prefix(self):
+        self.assertEqual(self.suggest('hea'), [('Headache', 'prefix'), ('Head Injury', 'prefix')])
+        self.assertEqual(self.suggest('hea', limit=1), [('Headache', 'prefix')])
+
+    def test_later_words(self):
+        self.assertEqual(self.suggest('breat'), [('Shortness of Breath', 'prefix')])
+        # Names starting with the text come before names with a later word starting with it
+        Symptom.objects.create(name='Painful Swallowing')
+        self.assertEqual([name for name, _ in self.suggest('pain')],
+                         ['Painful Swallowing', 'Chest Pain', 'Abdominal Pain'])
+
+    def test_typos(self):
+        self.assertEqual(self.suggest('hedache'), [('Headache', 'fuzzy')])
+        self.assertEqual(self.suggest('chest paim'), [('Chest Pain', 'fuzzy')])
+        self.assertEqual(self.suggest('xyzzy'), [])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/api/symptoms/predefined/autocomplete/').status_code, 400)
+
+
+class PopulateSymptomsTests(TestCase):
+    """populate_symptoms upserts streamed CSV and JSONL input in batches"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def populate(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('populate_symptoms', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_built_in_symptoms(self):
+        self.populate()
+        self.assertTrue(Symptom.objects.filter(name='Chest Pain', body_part='Chest').exists())
+        output, _ = self.populate()
+        self.assertIn('created 0, updated 0', output)
+
+    def test_csv_upsert(self):
+        Symptom.objects.create(name='Cough', body_part='Chest', severity_scale=3)
+        path = self.write('symptoms.csv', (
+            'name,description,body_part,severity_scale,common_related_conditions\n'
+            'Cough,Expulsion of air,Chest,4,Bronchitis|Asthma\n'
+            'Wheezing,,Chest,5,"[""Asthma""]"\n'
+            'Sneezing,,Nose,,\n'
+        ))
+        output, _ = self.populate(path, '--batch-size', '2')
+        self.assertIn('created 2, updated 1, left 0 unchanged', output)
+        cough = Symptom.objects.get(name='Cough')
+        self.assertEqual(cough.severity_scale, 4)
+        self.assertEqual(cough.common_related_conditions, ['Bronchitis', 'Asthma'])
+        self.assertEqual(Symptom.objects.get(name='Wheezing').common_related_conditions, ['Asthma'])
+        self.assertEqual(Symptom.objects.get(name='Sneezing').severity_scale, 1)
+
+        output, _ = self.populate(path)
+        self.assertIn('created 0, updated 0, left 3 unchanged', output)
+
+    def test_jsonl_with_invalid_rows(self):
+        path = self.write('symptoms.jsonl', '\n'.join([
+            json.dumps({'name': 'Hiccups', 'severity_scale': 2}),
+            'not json',
+            json.dumps({'name': 'Tremor', 'severity_scale': 11}),
+            json.dumps({'name': 'Hiccups', 'severity_scale': 3}),
+        ]))
+        output, errors = self.populate(path)
+        self.assertIn('created 1', output)
+        self.assertIn('1 duplicates, 2 invalid', output)
+        self.assertIn('line 2: invalid JSON', errors)
+        self.assertIn('line 3: severity_scale must be between 1 and 10', errors)
+        self.assertEqual(Symptom.objects.get().severity_scale, 3)
+
+    def test_dry_run_and_no_update(self):
+        Symptom.objects.create(name='Cough', severity_scale=3)
+        path = self.write('symptoms.jsonl', json.dumps({'name': 'Cough', 'severity_scale': 4}))
+        output, _ = self.populate(path, '--dry-run')
+        self.assertIn('would have created 0, updated 1', output)
+        self.populate(path, '--no-update')
+        self.assertEqual(Symptom.objects.get().severity_scale, 3)
+
+    def test_catalog_is_reloaded(self):
+        get_catalog()
+        self.populate()
+        self.assertIsNotNone(get_catalog().get_by_name('Headache'))
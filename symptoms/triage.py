@@ -0,0 +1,193 @@
+"""
+Rule-based emergency triage.
+
+Active TriageRule rows are compiled against the Symptom catalog into a
+TriageEngine: symptom names and body parts become sets of symptom ids, and
+each rule is indexed under the symptom ids that can trigger it. Triage then
+only looks at the rules indexed under the check's symptoms, plus the rules
+without a symptom or body part, so it takes microseconds and no queries.
+
+Checks are triaged when they are created, before their analysis is queued,
+so ``emergency_level`` is set in the creation response. The LLM analysis can
+later raise the flag but never clear it.
+
+The engine is compiled once per process and recompiled when the catalog
+snapshot (symptoms.catalog) changes, after TriageRule changes in this process
+or after ``SYMPTOM_TRIAGE_TTL`` seconds.
+"""
+import threading
+import time
+from django.conf import settings
+from .catalog import get_catalog
+
+
+class CompiledRule:
+    """A TriageRule resolved to symptom ids"""
+
+    __slots__ = ('name', 'reason', 'symptom_ids', 'body_part_ids', 'min_severity', 'min_age', 'max_age')
+
+    def __init__(self, name, reason, symptom_ids, body_part_ids, min_severity, min_age, max_age):
+        self.name = name
+        self.reason = reason
+        self.symptom_ids = symptom_ids
+        self.body_part_ids = body_part_ids
+        self.min_severity = min_severity
+        self.min_age = min_age
+        self.max_age = max_age
+
+    def matches(self, severities, age):
+        """
+        Args:
+            severities: Dictionary of symptom id to the highest severity reported
+            age: Patient age in years, or None
+        """
+        if self.min_age is not None or self.max_age is not None:
+            if age is None:
+                return False
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+
+        if not all(symptom_id in severities for symptom_id in self.symptom_ids):
+            return False
+        relevant = self.symptom_ids
+        if self.body_part_ids is not None:
+            # Body parts can hold thousands of symptoms; walk the check's few instead
+            in_body_part = {symptom_id for symptom_id in severities if symptom_id in self.body_part_ids}
+            if not in_body_part:
+                return False
+            relevant = relevant | in_body_part
+        if self.min_severity is None:
+            return True
+        if not relevant:
+            relevant = severities.keys()
+        return max(severities[symptom_id] for symptom_id in relevant) >= self.min_severity
+
+
+class TriageEngine:
+    """Triage rules compiled against a snapshot of the symptom catalog"""
+
+    def __init__(self, rules, symptoms, catalog=None):
+        """
+        Args:
+            rules: Iterable of (name, reason, symptom_names, body_part, min_severity, min_age, max_age)
+            symptoms: Iterable of (id, name, body_part)
+            catalog: The catalog snapshot the symptoms come from, if any
+        """
+        self.catalog = catalog
+        ids_by_name = {}
+        ids_by_body_part = {}
+        for symptom_id, name, body_part in symptoms:
+            ids_by_name[name.strip().lower()] = symptom_id
+            if body_part.strip():
+                ids_by_body_part.setdefault(body_part.strip().lower(), set()).add(symptom_id)
+
+        self.index = {}
+        self.unindexed = []
+        self.rules = []
+        for name, reason, symptom_names, body_part, min_severity, min_age, max_age in rules:
+            symptom_ids = {ids_by_name.get(str(symptom_name).strip().lower()) for symptom_name in symptom_names or []}
+            body_part_ids = ids_by_body_part.get(body_part.strip().lower(), set()) if body_part.strip() else None
+            if None in symptom_ids or body_part_ids == set():
+                # Refers to symptoms missing from the catalog, so it cannot match
+                continue
+            rule = CompiledRule(name, reason, frozenset(symptom_ids),
+                                frozenset(body_part_ids) if body_part_ids is not None else None,
+                                min_severity, min_age, max_age)
+            self.rules.append(rule)
+
+            # One required symptom is enough to find the rule; otherwise any symptom of the body part
+            if symptom_ids:
+                trigger_ids = [next(iter(symptom_ids))]
+            elif body_part_ids:
+                trigger_ids = body_part_ids
+            else:
+                self.unindexed.append(rule)
+                continue
+            for symptom_id in trigger_ids:
+                self.index.setdefault(symptom_id, []).append(rule)
+
+        self.order = {rule: position for position, rule in enumerate(self.rules)}
+
+    def evaluate(self, symptoms, age=None):
+        """
+        Find the rules a check matches.
+
+        Args:
+            symptoms: Iterable of (symptom_id, severity) pairs
+            age: Patient age in years, or None
+
+        Returns:
+            List of matching CompiledRule, in rule order
+        """
+        severities = {}
+        for symptom_id, severity in symptoms:
+            severity = _as_int(severity) or 0
+            if severity > severities.get(symptom_id, -1):
+                severities[symptom_id] = severity
+        if not severities:
+            return []
+
+        candidates = set(self.unindexed)
+        for symptom_id in severities:
+            candidates.update(self.index.get(symptom_id, ()))
+        matched = [rule for rule in candidates if rule.matches(severities, age)]
+        return sorted(matched, key=self.order.__getitem__)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_engine = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def build_engine(catalog):
+    """Compile the active TriageRule rows against a catalog snapshot"""
+    from .models import TriageRule
+
+    rules = TriageRule.objects.filter(is_active=True).order_by('id').values_list(
+        'name', 'reason', 'symptom_names', 'body_part', 'min_severity', 'min_age', 'max_age'
+    )
+    symptoms = ((record['id'], record['name'], record['body_part']) for record in catalog.records.values())
+    return TriageEngine(rules, symptoms, catalog)
+
+
+def get_engine():
+    """Return this process's triage engine, compiling it when missing, stale or expired"""
+    global _engine, _built_at
+    catalog = get_catalog()
+    engine = _engine
+    if (engine is None or engine.catalog is not catalog
+            or time.monotonic() - _built_at > settings.SYMPTOM_TRIAGE_TTL):
+        with _lock:
+            if _engine is engine:
+                _engine, _built_at = build_engine(catalog), time.monotonic()
+            engine = _engine
+    return engine
+
+
+def reset_engine():
+    """Drop this process's engine so the next triage recompiles it"""
+    global _engine
+    _engine = None
+
+
+def triage(symptoms, age=None):
+    """
+    Triage a check from its symptoms.
+
+    Args:
+        symptoms: Iterable of (symptom_id, severity) pairs
+        age: Patient age in years, or None
+
+    Returns:
+        List of the reasons of the matching rules; empty if none matched
+    """
+    return [rule.reason for rule in get_engine().evaluate(symptoms, _as_int(age))]
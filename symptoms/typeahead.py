@@ -0,0 +1,175 @@
+"""
+Typeahead index over the symptom catalog.
+
+Suggestions come from two indexes built from a catalog snapshot:
+
+* A prefix trie over every word-aligned suffix of each symptom name, so
+  "breath" completes "Shortness of Breath". The trie is flattened into a
+  sorted array of keys: the subtree of any prefix is the contiguous range
+  found by two binary searches, which keeps 50k symptoms to a few MB instead
+  of a node object per character. Within a range, the best entries are
+  picked with NumPy from precomputed ranks (name starts before later words,
+  then shorter names).
+* A trigram index (healthmateai.search) over the distinct words of the
+  names. When prefixes run out, each query word missing from the vocabulary
+  is replaced by its closest words ("hedache" by "headache") and the
+  corrected query is completed through the trie. The vocabulary is far
+  smaller than the catalog, so this stays fast where matching whole names
+  by trigrams would not.
+
+Prefix matches rank above fuzzy matches. The index is built lazily from the
+process's catalog snapshot (symptoms.catalog) and replaced with it.
+"""
+import bisect
+import itertools
+import numpy as np
+from healthmateai.search import TrigramIndex, normalize
+
+# Highest code point, closing the range of keys that start with a prefix
+_MAX_CHAR = '\U0010ffff'
+
+# Closest vocabulary words tried per misspelled query word, and corrected queries tried in total
+CORRECTIONS_PER_WORD = 3
+MAX_CORRECTED_QUERIES = 9
+
+
+class SymptomTypeahead:
+    """Prefix and trigram indexes over symptom names"""
+
+    def __init__(self, records):
+        """
+        Args:
+            records: Iterable of catalog records with at least id, name and body_part
+        """
+        self.records = {}
+        entries = []
+        vocabulary = set()
+        for record in records:
+            self.records[record['id']] = record
+            words = normalize(record['name']).split()
+            vocabulary.update(words)
+            for position in range(len(words)):
+                entries.append((' '.join(words[position:]), position, record['id']))
+
+        self.vocabulary = sorted(vocabulary)
+        self.trigrams = TrigramIndex()
+        for word in self.vocabulary:
+            self.trigrams.add(word, word)
+
+        # Rank: suffixes starting at the first word first, then shorter and alphabetically earlier names
+        order = sorted(self.records, key=lambda i: (len(self.records[i]['name']), self.records[i]['name'].lower()))
+        name_rank = {symptom_id: rank for rank, symptom_id in enumerate(order)}
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.ids = np.array([symptom_id for _, _, symptom_id in entries], dtype=np.int64)
+        self.ranks = np.array(
+            [min(position, 1) * len(order) + name_rank[symptom_id] for _, position, symptom_id in entries],
+            dtype=np.int64
+        )
+
+    def __len__(self):
+        return len(self.records)
+
+    def complete(self, prefix, limit):
+        """
+        Return the ids of up to ``limit`` symptoms with a word starting with ``prefix``, best first.
+
+        Args:
+            prefix: Normalized query text
+            limit: Number of ids to return
+        """
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + _MAX_CHAR, start)
+        if start == end:
+            return []
+
+        ranks = self.ranks[start:end]
+        ids = self.ids[start:end]
+        # A symptom can match through several of its words; take extra entries to make up for duplicates
+        wanted = limit
+        while True:
+            if wanted < len(ranks):
+                top = np.argpartition(ranks, wanted)[:wanted]
+                top = top[np.argsort(ranks[top])]
+            else:
+                top = np.argsort(ranks)
+            result = list(dict.fromkeys(ids[top].tolist()))
+            if len(result) >= limit or wanted >= len(ranks):
+                return result[:limit]
+            wanted *= 2
+
+    def suggest(self, query, limit=10, min_similarity=0.5):
+        """
+        Suggest symptoms for a partly typed, possibly misspelled query.
+
+        Args:
+            query: Text typed by the user
+            limit: Number of suggestions to return
+            min_similarity: Lowest trigram similarity of a fuzzy match
+
+        Returns:
+            List of dictionaries with id, name, body_part, match ('prefix' or
+            'fuzzy') and score
+        """
+        prefix = normalize(query)
+        if not prefix or limit <= 0:
+            return []
+
+        suggestions = [
+            self._suggestion(symptom_id, 'prefix', 1.0) for symptom_id in self.complete(prefix, limit)
+        ]
+        if len(suggestions) < limit:
+            seen = {suggestion['id'] for suggestion in suggestions}
+            for corrected, score in self.corrections(prefix.split(), min_similarity):
+                for symptom_id in self.complete(corrected, limit - len(suggestions)):
+                    if symptom_id not in seen:
+                        seen.add(symptom_id)
+                        suggestions.append(self._suggestion(symptom_id, 'fuzzy', score))
+                if len(suggestions) >= limit:
+                    break
+        return suggestions
+
+    def corrections(self, words, min_similarity):
+        """
+        Return corrected versions of a query as ``(text, score)`` pairs, best first.
+
+        Words found in the vocabulary are kept, as is a last word that is the
+        prefix of one, since it may still be being typed. Other words are
+        replaced by their closest vocabulary words. The score is the mean
+        similarity of the words.
+        """
+        options = []
+        for i, word in enumerate(words):
+            if self._known(word, partial=i == len(words) - 1):
+                options.append([(word, 1.0)])
+                continue
+            closest = self.trigrams.search(word, threshold=min_similarity)
+            if not closest:
+                return []
+            closest.sort(key=lambda item: (-item[1], abs(len(item[0]) - len(word)), item[0]))
+            options.append(closest[:CORRECTIONS_PER_WORD])
+
+        if all(len(option) == 1 and option[0][1] == 1.0 for option in options):
+            return []  # Nothing to correct
+        combinations = itertools.islice(itertools.product(*options), MAX_CORRECTED_QUERIES)
+        corrected = [
+            (' '.join(word for word, _ in combination), sum(score for _, score in combination) / len(combination))
+            for combination in combinations
+        ]
+        return sorted(corrected, key=lambda item: -item[1])
+
+    def _known(self, word, partial):
+        i = bisect.bisect_left(self.vocabulary, word)
+        if i == len(self.vocabulary):
+            return False
+        return self.vocabulary[i] == word or (partial and self.vocabulary[i].startswith(word))
+
+    def _suggestion(self, symptom_id, match, score):
+        record = self.records[symptom_id]
+        return {
+            'id': symptom_id,
+            'name': record['name'],
+            'body_part': record['body_part'],
+            'match': match,
+            'score': round(score, 3),
+        }
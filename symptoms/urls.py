@@ -6,7 +6,10 @@ router = DefaultRouter()
 router.register(r'predefined', views.SymptomViewSet, basename='symptom')
 router.register(r'user-symptoms', views.UserSymptomViewSet, basename='user-symptom')
 router.register(r'checks', views.SymptomCheckViewSet, basename='symptom-check')
+router.register(r'batches', views.SymptomCheckBatchViewSet, basename='symptom-check-batch')
 
 urlpatterns = [
+    path('checks/analyze/', views.SymptomCheckAnalyzeView.as_view(), name='symptom-check-analyze'),
+    path('checks/<int:pk>/status/', views.SymptomCheckStatusView.as_view(), name='symptom-check-status'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
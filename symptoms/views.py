@@ -1,21 +1,47 @@
+import asyncio
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from django.http import Http404
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, status, filters
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import viewsets, mixins, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Symptom, UserSymptom, SymptomCheck
+from .catalog import get_catalog
+from .models import Symptom, UserSymptom, SymptomCheck, SymptomCheckBatch
 from .serializers import (
     SymptomSerializer, 
     UserSymptomSerializer, 
     UserSymptomCreateSerializer,
     SymptomCheckSerializer,
-    SymptomCheckCreateSerializer
+    SymptomCheckCreateSerializer,
+    SymptomCheckStatusSerializer,
+    SymptomCheckBatchCreateSerializer,
+    SymptomCheckBatchSerializer
 )
-from .services import analyze_symptoms
+from healthmateai.pagination import HistoryCursorPagination
+from healthmateai.views import AsyncAPIView
+from .services import enqueue_symptom_analysis, enqueue_symptom_batch, run_symptom_analysis, arun_symptom_analysis
+
+def eager_load(queryset, serializer_class):
+    """Apply the serializer's select/prefetch plan to a queryset, if it declares one"""
+    setup_eager_loading = getattr(serializer_class, 'setup_eager_loading', None)
+    if setup_eager_loading is None:
+        return queryset
+    return setup_eager_loading(queryset)
 
 class SymptomViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for listing and retrieving predefined symptoms.
+    
+    Served from the process's catalog snapshot without queries. Responses
+    carry an ETag derived from the catalog contents and the query, so
+    clients revalidating an unchanged catalog get a 304.
     """
     queryset = Symptom.objects.all()
     serializer_class = SymptomSerializer
@@ -23,6 +49,69 @@ class SymptomViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['name', 'description', 'body_part']
     filterset_fields = ['body_part']
+    
+    def list(self, request, *args, **kwargs):
+        if getattr(self, 'swagger_fake_view', False):
+            return super().list(request, *args, **kwargs)
+        
+        catalog = get_catalog()
+        params = request.query_params
+        return self.catalog_response(request, catalog, lambda: [
+            self.select_fields(record)
+            for record in catalog.filter(body_part=params.get('body_part'), search=params.get('search'))
+        ])
+    
+    def retrieve(self, request, *args, **kwargs):
+        catalog = get_catalog()
+        try:
+            record = catalog.get(int(kwargs[self.lookup_field]))
+        except ValueError:
+            record = None
+        if record is None:
+            # Not in this process's snapshot yet
+            return super().retrieve(request, *args, **kwargs)
+        return self.catalog_response(request, catalog, lambda: self.select_fields(record))
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Suggest symptoms for a partly typed name.
+        
+        ?q= is the typed text and ?limit= the number of suggestions. Names are
+        matched by word prefix first, then with typos corrected.
+        """
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', settings.SYMPTOM_TYPEAHEAD_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.SYMPTOM_TYPEAHEAD_MAX_LIMIT))
+        
+        typeahead = get_catalog().typeahead
+        return Response(typeahead.suggest(query, limit, settings.SYMPTOM_TYPEAHEAD_MIN_SIMILARITY))
+    
+    def catalog_response(self, request, catalog, get_data):
+        """Return the data built by ``get_data``, or a 304 if the client's copy is current"""
+        query = '&'.join(sorted(f'{key}={value}' for key, value in request.query_params.items()))
+        digest = hashlib.sha256(f'{catalog.etag}:{request.path}?{query}'.encode()).hexdigest()[:32]
+        etag = f'"{digest}"'
+        
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(get_data())
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    
+    def select_fields(self, record):
+        """Apply ``?fields=`` to a catalog record, as SparseFieldsetsMixin does"""
+        value = self.request.query_params.get('fields')
+        if not value:
+            return record
+        requested = {name.strip() for name in value.split(',') if name.strip()}
+        return {name: value for name, value in record.items() if name in requested}
 
 class UserSymptomViewSet(viewsets.ModelViewSet):
     """
@@ -35,7 +124,8 @@ class UserSymptomViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return UserSymptom.objects.filter(user=self.request.user)
+        queryset = UserSymptom.objects.filter(user=self.request.user)
+        return eager_load(queryset, self.get_serializer_class())
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -43,7 +133,7 @@ class UserSymptomViewSet(viewsets.ModelViewSet):
         return UserSymptomSerializer
     
     @action(detail=False, methods=['get'])
-    def active(self):
+    def active(self, request):
         """Get only active symptoms"""
         active_symptoms = self.get_queryset().filter(is_active=True)
         serializer = self.get_serializer(active_symptoms, many=True)
@@ -54,9 +144,12 @@ class SymptomCheckViewSet(viewsets.ModelViewSet):
     API endpoint for symptom checking sessions.
     """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HistoryCursorPagination
+    ordering = ['-created_at']
     
     def get_queryset(self):
-        return SymptomCheck.objects.filter(user=self.request.user)
+        queryset = SymptomCheck.objects.filter(user=self.request.user)
+        return eager_load(queryset, self.get_serializer_class())
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -68,8 +161,14 @@ class SymptomCheckViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         symptom_check = serializer.save()
         
+        if settings.SYMPTOM_CHECK_ASYNC:
+            # Analyze in a worker once the check is committed; clients poll the status endpoint
+            transaction.on_commit(lambda: enqueue_symptom_analysis(symptom_check))
+            status_serializer = SymptomCheckStatusSerializer(symptom_check)
+            return Response(status_serializer.data, status=status.HTTP_202_ACCEPTED)
+        
         # Process with AI analysis
-        analyze_symptoms(symptom_check)
+        run_symptom_analysis(symptom_check)
         
         # Return the full symptom check with analysis
         result_serializer = SymptomCheckSerializer(symptom_check)
@@ -84,3 +183,93 @@ class SymptomCheckViewSet(viewsets.ModelViewSet):
         
         serializer = SymptomCheckSerializer(recent_check)
         return Response(serializer.data)
+
+class SymptomCheckBatchViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for uploading many symptom checks at once.
+    
+    Checks are inserted in bulk and analyzed by Celery workers; the batch
+    resource reports progress counts and the status of each check.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return SymptomCheckBatch.objects.filter(user=self.request.user).annotate(
+            total_count=Count('checks'),
+            queued_count=Count('checks', filter=Q(checks__status=SymptomCheck.STATUS_QUEUED)),
+            running_count=Count('checks', filter=Q(checks__status=SymptomCheck.STATUS_RUNNING)),
+            done_count=Count('checks', filter=Q(checks__status=SymptomCheck.STATUS_DONE)),
+            failed_count=Count('checks', filter=Q(checks__status=SymptomCheck.STATUS_FAILED)),
+            emergency_count=Count('checks', filter=Q(checks__emergency_level=True)),
+        ).prefetch_related(
+            Prefetch('checks', queryset=SymptomCheck.objects.order_by('id'))
+        )
+    
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return SymptomCheckBatchCreateSerializer
+        return SymptomCheckBatchSerializer
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batch = serializer.save()
+        
+        if settings.SYMPTOM_CHECK_ASYNC:
+            transaction.on_commit(lambda: enqueue_symptom_batch(batch))
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            for symptom_check in batch.checks.select_related('user').order_by('id'):
+                run_symptom_analysis(symptom_check)
+            response_status = status.HTTP_201_CREATED
+        
+        result_serializer = SymptomCheckBatchSerializer(self.get_queryset().get(pk=batch.pk))
+        return Response(result_serializer.data, status=response_status)
+
+class SymptomCheckAnalyzeView(AsyncAPIView):
+    """
+    API endpoint that creates a symptom check and analyzes it inline.
+    
+    The OpenAI call is awaited on the event loop instead of queued, and the
+    response carries the full analysis.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    async def post(self, request):
+        serializer = SymptomCheckCreateSerializer(data=request.data, context={'request': request})
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        symptom_check = await sync_to_async(serializer.save)()
+        
+        await arun_symptom_analysis(symptom_check)
+        
+        data = await sync_to_async(lambda: SymptomCheckSerializer(symptom_check).data)()
+        return Response(data, status=status.HTTP_201_CREATED)
+
+class SymptomCheckStatusView(AsyncAPIView):
+    """
+    API endpoint for the analysis status of a symptom check.
+    
+    Pass ?wait=<seconds> to long-poll until the analysis finishes or the
+    wait elapses. Waiting sleeps on the event loop, so a waiting client holds
+    neither a worker thread nor a database connection between polls.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    async def get(self, request, pk):
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            return Response({"error": "wait must be a number of seconds"}, status=status.HTTP_400_BAD_REQUEST)
+        deadline = time.monotonic() + max(0, min(wait, settings.SYMPTOM_CHECK_MAX_WAIT))
+        
+        queryset = SymptomCheck.objects.filter(user=request.user, pk=pk)
+        symptom_check = await queryset.afirst()
+        if symptom_check is None:
+            raise Http404
+        
+        while not symptom_check.is_finished and time.monotonic() < deadline:
+            await asyncio.sleep(settings.SYMPTOM_CHECK_POLL_INTERVAL)
+            symptom_check = await queryset.aget()
+        
+        serializer = SymptomCheckStatusSerializer(symptom_check)
+        return Response(serializer.data)
@@ -0,0 +1,103 @@
+"""
+JWT authentication that resolves users from the cache.
+
+Access and refresh tokens carry a minimal claims set: the user id,
+``is_doctor`` and the user's ``token_version``. ``CachedJWTAuthentication``
+validates the token and rebuilds the user from a cached copy of its row
+(everything but the password hash), so an authenticated request does not
+query the users table. The row is cached for ``AUTH_USER_CACHE_TIMEOUT``
+seconds and dropped whenever the user is saved or deleted.
+
+Changing the password bumps ``token_version``; tokens issued before then no
+longer match and are rejected. With the in-process cache (no Redis) other
+worker processes notice within the cache timeout.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import CustomUser
+
+# Fields never copied to the cache
+UNCACHED_FIELDS = {'password'}
+
+
+class UserRefreshToken(RefreshToken):
+    """Refresh token carrying the claims CachedJWTAuthentication checks; copied to its access tokens"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['is_doctor'] = user.is_doctor
+        token['token_version'] = user.token_version
+        return token
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def cached_fields():
+    return [field for field in CustomUser._meta.concrete_fields if field.attname not in UNCACHED_FIELDS]
+
+
+def cache_user(user):
+    """Store the cacheable fields of a user row"""
+    row = {field.attname: getattr(user, field.attname) for field in cached_fields()}
+    cache.set(user_cache_key(user.pk), row, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def get_user(user_id):
+    """
+    Return a user by id, from the cache when possible.
+
+    The password hash is deferred, so saving the returned user writes only the
+    other fields; reading the password loads it from the database.
+
+    Raises:
+        CustomUser.DoesNotExist: If there is no such user
+    """
+    row = cache.get(user_cache_key(user_id))
+    if row is None:
+        user = CustomUser.objects.defer(*UNCACHED_FIELDS).get(pk=user_id)
+        cache_user(user)
+        return user
+
+    fields = cached_fields()
+    return CustomUser.from_db(
+        router.db_for_read(CustomUser),
+        [field.attname for field in fields],
+        [row[field.attname] for field in fields]
+    )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads the user from the cache and checks the token version"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_user(user_id)
+        except (CustomUser.DoesNotExist, ValueError):
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        # Tokens issued before the version claim existed count as version 0
+        if validated_token.get('token_version', 0) != user.token_version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return user
@@ -0,0 +1,195 @@
+"""
+Password hashing for logins.
+
+Hashing is deliberately slow, so login bursts are CPU bound. Logins verify
+passwords in a bounded, process-wide thread pool of
+``PASSWORD_HASH_WORKERS`` threads. Both argon2-cffi and hashlib's PBKDF2
+release the GIL, so the pool runs that many hashes in parallel. The pool also
+caps how many cores hashing can take, leaving the rest for other requests.
+The login view is async and awaits the pool from the event loop, so waiting
+for a hash holds no thread; under ASGI a blocking wait would hold the one
+thread that runs every synchronous view. ``user.check_password`` waits for
+the pool in the calling thread. With ``PASSWORD_HASH_WORKERS = 0`` passwords
+are hashed in the calling thread, or in a worker thread for the login view.
+
+Hashes made with an older algorithm or older parameters are upgraded after
+a successful login. The new hash is computed in the pool after the response
+is on its way instead of inside the request. Running it in-process keeps the
+raw password out of the Celery broker.
+
+``TunedArgon2PasswordHasher`` takes its cost parameters from settings. Use
+``python manage.py benchmark_password_hashers`` to measure logins per second
+per core before changing them.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate, hashers
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with the cost set by the PASSWORD_ARGON2_* settings.
+
+    Keeps Django's ``argon2`` algorithm name: the parameters are stored in
+    each hash, and hashes made with other parameters are upgraded on login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide hashing pool, or None to hash in the calling thread"""
+    global _executor
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    thread_name_prefix='password-hash'
+                )
+    return _executor
+
+
+def run_hashing(function, *args):
+    """Run ``function`` in the hashing pool and wait for its result"""
+    executor = get_executor()
+    if executor is None:
+        return function(*args)
+    return executor.submit(function, *args).result()
+
+
+async def arun_hashing(function, *args):
+    """Run ``function`` in the hashing pool and await its result without blocking a thread"""
+    executor = get_executor()
+    if executor is None:
+        return await sync_to_async(function, thread_sensitive=False)(*args)
+    return await asyncio.wrap_future(executor.submit(function, *args))
+
+
+def needs_rehash(encoded):
+    """Return True if a hash was made with another algorithm or other parameters than the preferred hasher"""
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = hashers.get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(user, raw_password):
+    """
+    Check a user's password in the hashing pool.
+
+    Unlike ``user.check_password``, a hash that needs upgrading is rehashed in
+    the background rather than before returning.
+
+    Returns:
+        True if the password is correct
+    """
+    encoded = user.password
+    if not run_hashing(hashers.check_password, raw_password, encoded):
+        return False
+    if needs_rehash(encoded):
+        schedule_rehash(user.pk, encoded, raw_password)
+    return True
+
+
+def schedule_rehash(user_id, old_encoded, raw_password):
+    """Upgrade a user's password hash in the hashing pool without waiting for it"""
+    executor = get_executor()
+    if executor is None:
+        rehash_password(user_id, old_encoded, raw_password)
+    else:
+        executor.submit(rehash_password, user_id, old_encoded, raw_password)
+
+
+def rehash_password(user_id, old_encoded, raw_password):
+    """
+    Store a new hash of ``raw_password`` for a user.
+
+    The update only applies if the stored hash is still ``old_encoded``, so a
+    password changed in the meantime is never overwritten. It bypasses
+    ``set_password``, which would revoke the user's tokens.
+    """
+    from .models import CustomUser
+
+    in_pool = threading.current_thread().name.startswith('password-hash')
+    if in_pool:
+        close_old_connections()
+    try:
+        encoded = hashers.make_password(raw_password)
+        CustomUser.objects.filter(pk=user_id, password=old_encoded).update(password=encoded)
+    except Exception as e:
+        logger.warning(f"Could not upgrade the password hash of user {user_id}: {str(e)}")
+    finally:
+        if in_pool:
+            close_old_connections()
+
+
+async def aauthenticate_login(request, email, raw_password):
+    """
+    Return the active user with these credentials, or None.
+
+    The async counterpart of ``django.contrib.auth.authenticate`` with the
+    default ModelBackend: the user is looked up with the async ORM and the
+    hashing is awaited in the pool. Like ``authenticate``, a failure sends
+    ``user_login_failed``. Unknown emails still cost one hash so they take as
+    long as wrong passwords. Other ``AUTHENTICATION_BACKENDS`` go through
+    ``authenticate`` itself.
+    """
+    from .models import CustomUser
+
+    if settings.AUTHENTICATION_BACKENDS != [MODEL_BACKEND]:
+        return await sync_to_async(authenticate)(
+            getattr(request, '_request', request), email=email, password=raw_password
+        )
+
+    try:
+        user = await CustomUser._default_manager.aget(**{CustomUser.USERNAME_FIELD: email})
+    except CustomUser.DoesNotExist:
+        await arun_hashing(hashers.make_password, raw_password)
+        user = None
+    else:
+        encoded = user.password
+        if not await arun_hashing(hashers.check_password, raw_password, encoded) or not user.is_active:
+            user = None
+        elif needs_rehash(encoded):
+            await sync_to_async(schedule_rehash)(user.pk, encoded, raw_password)
+
+    if user is None:
+        # Credentials cleaned as authenticate() does
+        await sync_to_async(user_login_failed.send)(
+            sender='django.contrib.auth',
+            credentials={'email': email, 'password': '********************'},
+            request=getattr(request, '_request', request)
+        )
+        return None
+    user.backend = MODEL_BACKEND
+    return user
@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+
+PASSWORD = 'correct horse battery staple'
+
+class Command(BaseCommand):
+    help = 'Measures password verifications (logins) per second per core for each hasher setting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3.0, help='Time spent measuring each setting')
+        parser.add_argument('--workers', type=int, default=max(settings.PASSWORD_HASH_WORKERS, 1),
+                            help='Threads for the parallel measurement')
+        parser.add_argument('--argon2', action='append', default=[], metavar='TIME,MEMORY_KIB,PARALLELISM',
+                            help='Extra Argon2 setting to measure (repeatable)')
+
+    def handle(self, *args, **options):
+        hashers = [
+            ('pbkdf2 (Django default)', PBKDF2PasswordHasher()),
+            ('argon2 (Django default)', self.argon2(Argon2PasswordHasher.time_cost, Argon2PasswordHasher.memory_cost,
+                                                    Argon2PasswordHasher.parallelism)),
+            ('argon2 (configured)', self.argon2(settings.PASSWORD_ARGON2_TIME_COST, settings.PASSWORD_ARGON2_MEMORY_COST,
+                                                settings.PASSWORD_ARGON2_PARALLELISM)),
+        ]
+        for value in options['argon2']:
+            try:
+                time_cost, memory_cost, parallelism = (int(part) for part in value.split(','))
+            except ValueError:
+                raise CommandError(f'Invalid --argon2 value {value!r}, expected TIME,MEMORY_KIB,PARALLELISM')
+            hashers.append((f'argon2 t={time_cost} m={memory_cost} p={parallelism}',
+                            self.argon2(time_cost, memory_cost, parallelism)))
+
+        workers = options['workers']
+        cores = min(workers, os.cpu_count() or 1)
+        self.stdout.write(f'{"setting":<40} {"ms/login":>9} {"logins/s/core":>14} {f"logins/s x{workers}":>16} {"per core":>9}')
+        for label, hasher in hashers:
+            encoded = hasher.encode(PASSWORD, hasher.salt())
+            single = self.measure(hasher, encoded, options['seconds'], 1)
+            parallel = self.measure(hasher, encoded, options['seconds'], workers)
+            self.stdout.write(
+                f'{label:<40} {1000 / single:>9.1f} {single:>14.1f} {parallel:>16.1f} {parallel / cores:>9.1f}'
+            )
+
+    def argon2(self, time_cost, memory_cost, parallelism):
+        hasher = Argon2PasswordHasher()
+        hasher.time_cost, hasher.memory_cost, hasher.parallelism = time_cost, memory_cost, parallelism
+        return hasher
+
+    def measure(self, hasher, encoded, seconds, workers):
+        """Return verifications per second with ``workers`` threads verifying back to back"""
+        deadline = time.perf_counter() + seconds
+
+        def run():
+            count = 0
+            while time.perf_counter() < deadline:
+                if not hasher.verify(PASSWORD, encoded):
+                    raise CommandError('Verification failed')
+                count += 1
+            return count
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            total = sum(executor.map(lambda _: run(), range(workers)))
+        return total / (time.perf_counter() - started)
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:49
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from healthmateai.postgres import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddPostgresIndex(
+            model_name='customuser',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['full_name'], name='user_full_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
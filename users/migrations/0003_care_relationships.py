@@ -0,0 +1,54 @@
+# Generated by Django 4.2.10 on 2026-10-18 01:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_care_relationships(apps, schema_editor):
+    CareRelationship = apps.get_model('users', 'CareRelationship')
+    Appointment = apps.get_model('appointments', 'Appointment')
+    Diagnosis = apps.get_model('diagnostics', 'Diagnosis')
+
+    pairs = {}
+    appointment_pairs = Appointment.objects.exclude(status='cancelled').values_list('doctor_id', 'patient_id').distinct()
+    for pair in appointment_pairs.iterator():
+        pairs.setdefault(pair, [False, False])[0] = True
+    diagnosis_pairs = Diagnosis.objects.filter(doctor__isnull=False).values_list('doctor_id', 'user_id').distinct()
+    for pair in diagnosis_pairs.iterator():
+        pairs.setdefault(pair, [False, False])[1] = True
+
+    CareRelationship.objects.bulk_create([
+        CareRelationship(doctor_id=doctor_id, patient_id=patient_id, has_appointment=flags[0], has_diagnosis=flags[1])
+        for (doctor_id, patient_id), flags in pairs.items()
+        if doctor_id != patient_id
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_search_indexes'),
+        ('appointments', '0005_appointment_reminder_sent_at'),
+        ('diagnostics', '0002_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CareRelationship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('has_appointment', models.BooleanField(default=False)),
+                ('has_diagnosis', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_patients', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_team', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='carerelationship',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='care_relationship_unique'),
+        ),
+        migrations.RunPython(backfill_care_relationships, migrations.RunPython.noop),
+    ]
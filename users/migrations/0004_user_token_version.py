@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_care_relationships'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, help_text="Bumped to revoke the user's issued tokens"),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
 from django.utils.translation import gettext_lazy as _
 
 class CustomUser(AbstractUser):
@@ -16,13 +19,104 @@ class CustomUser(AbstractUser):
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, blank=True)
     location = models.CharField(max_length=255, blank=True)
     is_doctor = models.BooleanField(default=False)
+    token_version = models.PositiveIntegerField(default=0, help_text=_("Bumped to revoke the user's issued tokens"))
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Doctor name search; PostgreSQL only, see healthmateai.postgres
+            GinIndex(fields=['full_name'], opclasses=['gin_trgm_ops'], name='user_full_name_trgm'),
+        ]
+    
     def __str__(self):
         return self.email
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored name, so saves that keep it skip rebuilding the doctor search index
+        instance._original = {'full_name': instance.__dict__.get('full_name')}
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'full_name' in update_fields:
+            self._original = {'full_name': self.full_name}
         
     @property
     def is_patient(self):
         return not self.is_doctor
+    
+    def check_password(self, raw_password):
+        # Verify in the hashing pool and upgrade old hashes in the background,
+        # without set_password revoking the user's tokens
+        from .hashers import verify_password
+        return verify_password(self, raw_password)
+    
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        # Revoke tokens issued with the old password
+        if self.pk:
+            self.token_version += 1
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached copy JWT authentication reads"""
+    from .authentication import invalidate_user
+    invalidate_user(instance.pk)
+
+
+class CareRelationship(models.Model):
+    """
+    A doctor involved in a patient's care.
+    
+    Exists while the doctor has a non-cancelled appointment that the patient
+    booked or confirmed, or has diagnosed them. Appointment and diagnosis writes keep it up to date
+    through ``refresh``, so access checks are one indexed lookup.
+    """
+    doctor = models.ForeignKey('CustomUser', on_delete=models.CASCADE, related_name='care_patients')
+    patient = models.ForeignKey('CustomUser', on_delete=models.CASCADE, related_name='care_team')
+    has_appointment = models.BooleanField(default=False)
+    has_diagnosis = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            # Also the index for "patients of this doctor"
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='care_relationship_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.doctor} cares for {self.patient}"
+    
+    @classmethod
+    def refresh(cls, doctor_id, patient_id):
+        """Create, update or remove the relationship of a doctor and patient from their current records"""
+        if not doctor_id or not patient_id or doctor_id == patient_id:
+            return
+        
+        from appointments.models import Appointment
+        from diagnostics.models import Diagnosis
+        
+        has_appointment = Appointment.objects.filter(
+            doctor_id=doctor_id, patient_id=patient_id, patient_confirmed_at__isnull=False
+        ).exclude(status='cancelled').exists()
+        has_diagnosis = Diagnosis.objects.filter(doctor_id=doctor_id, user_id=patient_id).exists()
+        
+        if has_appointment or has_diagnosis:
+            cls.objects.update_or_create(
+                doctor_id=doctor_id,
+                patient_id=patient_id,
+                defaults={'has_appointment': has_appointment, 'has_diagnosis': has_diagnosis}
+            )
+        else:
+            cls.objects.filter(doctor_id=doctor_id, patient_id=patient_id).delete()
+    
+    @classmethod
+    def patient_ids(cls, doctor):
+        """Subquery of the IDs of a doctor's patients"""
+        return cls.objects.filter(doctor=doctor).values('patient_id')
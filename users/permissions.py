@@ -41,5 +41,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
             
-        # Write permissions are only allowed to the owner
+        # Write permissions are only allowed to the owner; appointments belong to both participants
+        if hasattr(obj, 'patient_id') and hasattr(obj, 'doctor_id'):
+            return request.user.id in (obj.patient_id, obj.doctor_id)
         return obj.user == request.user 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from django.contrib.auth import authenticate
+from healthmateai.serializers import SparseFieldsetsMixin
 from .models import CustomUser
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -33,30 +33,17 @@ class RegistrationSerializer(serializers.ModelSerializer):
         
 
 class LoginSerializer(serializers.Serializer):
-    """Serializer for user login"""
+    """
+    Serializer for user login.
+    
+    Only checks the fields; LoginAPIView checks the credentials with
+    users.hashers.aauthenticate_login, which awaits the password hashing.
+    """
     email = serializers.EmailField()
     password = serializers.CharField(max_length=128, write_only=True)
-    
-    def validate(self, data):
-        email = data.get('email')
-        password = data.get('password')
-        
-        if email and password:
-            user = authenticate(username=email, password=password)
-            
-            if not user:
-                raise serializers.ValidationError("Invalid email or password.")
-                
-            if not user.is_active:
-                raise serializers.ValidationError("User account is disabled.")
-                
-            data['user'] = user
-            return data
-        else:
-            raise serializers.ValidationError("Must include 'email' and 'password'.")
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for user profile"""
     class Meta:
         model = CustomUser
@@ -1,3 +1,136 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from .authentication import UserRefreshToken
+from .models import CustomUser
 
-# Create your tests here.
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Authenticated requests resolve the user from the cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123', full_name='Pat'
+        )
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        token = UserRefreshToken.for_user(user).access_token
+        self.assertEqual(token['token_version'], user.token_version)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_cached_user_skips_the_users_table(self):
+        self.authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.data['full_name'], 'Pat')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_update_invalidates_the_cache(self):
+        self.authenticate(self.user)
+        self.client.patch('/api/auth/profile/', {'full_name': 'Patricia'}, format='json')
+        self.assertEqual(self.client.get('/api/auth/profile/').data['full_name'], 'Patricia')
+        # Saving the cached user must not drop the password it never loaded
+        self.assertTrue(CustomUser.objects.get().check_password('testpass123'))
+
+    def test_password_change_revokes_tokens(self):
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+
+        self.user.set_password('newpass456')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+
+    def test_inactive_user_is_rejected(self):
+        self.authenticate(self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+
+@override_settings(PASSWORD_HASH_WORKERS=0)
+class LoginPasswordHashingTests(TestCase):
+    """Logins verify passwords through users.hashers and upgrade old hashes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123'
+        )
+        self.client = APIClient()
+
+    def login(self, password):
+        return self.client.post('/api/auth/login/', {'email': 'patient@example.com', 'password': password},
+                                format='json')
+
+    def test_login(self):
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertEqual(self.login('testpass123').status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 400)
+
+    def test_legacy_hash_is_upgraded_without_revoking_tokens(self):
+        legacy = make_password('testpass123', hasher='pbkdf2_sha256')
+        CustomUser.objects.filter(pk=self.user.pk).update(password=legacy)
+
+        response = self.login('testpass123')
+        self.assertEqual(response.status_code, 200)
+        user = CustomUser.objects.get()
+        self.assertTrue(user.password.startswith('argon2$'))
+        self.assertTrue(user.check_password('testpass123'))
+        self.assertEqual(user.token_version, self.user.token_version)
+
+    def test_inactive_user_cannot_log_in(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login('testpass123').status_code, 400)
+
+    def test_failures_send_user_login_failed(self):
+        receiver = mock.Mock()
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+        response = self.login('wrong')
+        self.assertEqual(response.data, {'non_field_errors': ['Invalid email or password.']})
+        response = self.client.post('/api/auth/login/', {'email': 'nobody@example.com', 'password': 'testpass123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(receiver.call_count, 2)
+        credentials = receiver.call_args.kwargs['credentials']
+        self.assertEqual(credentials['email'], 'nobody@example.com')
+        self.assertNotEqual(credentials['password'], 'testpass123')
+
+        self.assertEqual(self.login('testpass123').status_code, 200)
+        self.assertEqual(receiver.call_count, 2)
+
+    async def test_async_login(self):
+        response = await self.async_client.post('/api/auth/login/',
+                                                {'email': 'patient@example.com', 'password': 'testpass123'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['email'], 'patient@example.com')
+        self.assertIn('access', response.json()['tokens'])
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_hashing_is_awaited_in_the_pool(self):
+        with mock.patch('users.hashers.asyncio.wrap_future', wraps=asyncio.wrap_future) as wrap_future:
+            self.assertEqual(self.login('testpass123').status_code, 200)
+            self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertEqual(wrap_future.call_count, 2)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend'])
+    def test_other_backends_go_through_authenticate(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login('testpass123').status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 400)
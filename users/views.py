@@ -1,9 +1,12 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import UserRefreshToken
 from rest_framework_simplejwt.views import TokenRefreshView
+from healthmateai.views import AsyncAPIView
+from .hashers import aauthenticate_login
 from .models import CustomUser
 from .serializers import RegistrationSerializer, LoginSerializer, UserProfileSerializer
 from drf_yasg.utils import swagger_auto_schema
@@ -72,7 +75,7 @@ class RegistrationAPIView(APIView):
             user = serializer.save()
             
             # Generate tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
             tokens = {
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -89,9 +92,11 @@ class RegistrationAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LoginAPIView(APIView):
+class LoginAPIView(AsyncAPIView):
     """
     API view for user login.
+    
+    Async, so waiting for the password hashing pool holds no thread.
     """
     permission_classes = [permissions.AllowAny]
     
@@ -137,13 +142,18 @@ class LoginAPIView(APIView):
             400: openapi.Response(description="Invalid credentials", schema=openapi.Schema(type=openapi.TYPE_OBJECT))
         }
     )
-    def post(self, request):
+    async def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.validated_data['user']
+            user = await aauthenticate_login(
+                request, serializer.validated_data['email'], serializer.validated_data['password']
+            )
+            if user is None:
+                return Response({"non_field_errors": ["Invalid email or password."]},
+                                status=status.HTTP_400_BAD_REQUEST)
             
             # Generate tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = await sync_to_async(UserRefreshToken.for_user)(user)
             tokens = {
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),